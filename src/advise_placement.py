@@ -0,0 +1,47 @@
+import sys
+sys.path.append("../lib")
+
+from blargh.placement import loadStats, advisePlacement, applyPlacement, printAdvice, formatTopology
+from pipeline import robotTopology
+from vision import VisionBlargh
+from world.blackboard import worldBlackboardPath
+
+# Works out which blarghs in the robot's topology (see pipeline.py) should be
+# fused into one process and which should stay separate, from the stats
+# saved on a real run (see blargh/placement.py). The topology is the one
+# main.py launches, with world publishing on the blackboard and behavior
+# reading it at its own rate. Save stats by running main.py or real time
+# simulated_main.py with BLARGH_STATS_DIR set and stopping it with Ctrl-C,
+# then for example:
+#   python advise_placement.py stats
+#   python advise_placement.py stats --emit
+# --emit also prints the topology with the advice applied, ready to be
+# pasted into pipeline.py.
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    emit = "--emit" in args
+    paths = [arg for arg in args if arg != "--emit"]
+    if len(paths) != 1:
+        print "Usage: python advise_placement.py <stats directory> [--emit]"
+        sys.exit(1)
+    allStats = loadStats(paths[0])
+    if len(allStats) == 0:
+        print "No stats in", paths[0]
+        sys.exit(1)
+
+    # Lock-step runs have a tick blargh driving them and an edge from world
+    # to behavior instead of the blackboard, so they're a different graph
+    if "TickBlargh" in allStats:
+        print "The stats in", paths[0], "are from a lock-step run, advice is only for the topology main.py runs"
+        sys.exit(1)
+
+    # Only the shape of the topology matters here, not what the blarghs
+    # talk to. The blackboard isn't opened, but its path makes this the same
+    # topology as main.py's.
+    topology = robotTopology([None], VisionBlargh, [None], [None], worldBlackboardPath())
+    advice = advisePlacement(topology, allStats)
+    printAdvice(advice)
+    if emit:
+        print
+        print formatTopology(applyPlacement(topology, advice))
@@ -1,5 +1,6 @@
 from arduino3 import *
 from blargh import Blargh
+from blargh.sampling import startSampling
 from exceptions import ValueError
 from multiprocessing import Pipe, Process
 import time
@@ -7,6 +8,9 @@ import math
 
 def arduinoInterface(pipes, arduinoWrapper):
 
+    # Sample where the CPU time goes, if sampling is turned on
+    startSampling("ArduinoInterface")
+
     # Start the arduino wrapper
     arduinoWrapper.start()
 
@@ -40,8 +44,11 @@ def arduinoInterface(pipes, arduinoWrapper):
             if pipe.poll() and handleCommand(pipe) == "KILL":
                 return 0
 
-# Called from the master process to create the arduino interface process
-def createArduinoInterface(numPipes):
+# Called from the master process to create the arduino interface process.
+# port, resetTime, deltaMode and baudrate are passed on to Arduino, for
+# example to use an ArduinoEmulator.
+def createArduinoInterface(numPipes, port=None, resetTime=RESET_TIME, deltaMode=False,
+                           baudrate=DEFAULT_BAUD_RATE):
     parentPipes = []
     childPipes = []
     for i in range(numPipes):
@@ -49,7 +56,7 @@ def createArduinoInterface(numPipes):
         parentPipes.append(parentPipe)
         childPipes.append(childPipe)
 
-    arduinoWrapper = ArduinoWrapper()
+    arduinoWrapper = ArduinoWrapper(port, resetTime, deltaMode, baudrate)
 
     proc = Process(target = arduinoInterface, args = [childPipes, arduinoWrapper])
     proc.start()
@@ -78,9 +85,9 @@ class ArduinoInterfaceWrapper():
 
 class ArduinoWrapper():
     # Initialize the arrays which will contain our sensors and such
-    def __init__(self):
+    def __init__(self, port=None, resetTime=RESET_TIME, deltaMode=False, baudrate=DEFAULT_BAUD_RATE):
         # Create the Arduino object
-        self.ard  = Arduino()
+        self.ard  = Arduino(port, resetTime, deltaMode, baudrate)
         # Clear all the lists
         self.mcs = []
         self.motors = []
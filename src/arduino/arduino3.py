@@ -3,6 +3,29 @@ sys.path.append("../../lib")
 
 import usb.core, usb.util, serial, time
 import threading, thread
+from exceptions import ValueError
+
+from packets import SensorPacketParser, CommandPacket, BAUD_RATES
+
+# How long the arduino takes to reset after the port is opened, in seconds
+RESET_TIME = 2
+# The ports the arduino might show up on, if we aren't told which one
+DEFAULT_PORTS = ['/dev/ttyACM{0}'.format(i) for i in range(4)]
+# Longest we wait on a read from the arduino before checking whether we've
+# been told to stop, in seconds
+READ_TIMEOUT = 0.1
+# How often the whole command packet gets sent in delta mode, in seconds, so
+# that the arduino gets put right if it ever missed a change
+FULL_REFRESH_PERIOD = 0.5
+# The baud rate the arduino starts at
+BASE_BAUD_RATE = BAUD_RATES[0]
+# The baud rate we ask the arduino to switch to by default
+DEFAULT_BAUD_RATE = 115200
+# How long we wait for the arduino to answer when we ask it to switch baud
+# rates, and then for the first packet at the new rate, in seconds
+NEGOTIATION_TIMEOUT = 0.5
+# How long the arduino can take to switch once it's said yes, in seconds
+SWITCH_TIME = 0.05
 
 # Class that handles communication with the arduino
 # The general idea is to have a thread that constantly sends actuator commands
@@ -11,31 +34,67 @@ import threading, thread
 # arrays.
 class Arduino(threading.Thread):
 
-    # Arrays for keeping track of input / output
-    motorSpeeds = []
-    stepperSteps = []
-    servoAngles = []
-    digitalSensors = []
-    analogSensors = []
-
-    # Arrays for keeping track of ports
-    digitalPorts = []
-    analogPorts = []
-    motorControllerPorts = []
-    stepperPorts = []
-    servoPorts = []
-
-    # Initialize the thread and variables
-    def __init__(self):
+    # Initialize the thread and variables. port is the serial port the arduino
+    # is on, if it's None we try each of DEFAULT_PORTS. Give it the path of an
+    # ArduinoEmulator (see emulator.py) to run without a board, with a
+    # resetTime of 0 since the emulator doesn't need to reset.
+    # In deltaMode, each command packet only has the actuators that changed
+    # since the last one (see CommandPacket in packets.py), plus the whole
+    # thing every FULL_REFRESH_PERIOD. Packets are shorter, so the sensors
+    # come back more often, but the firmware has to know the delta modes.
+    # baudrate is what we ask the arduino to switch to once it's initialized
+    # (one of BAUD_RATES). If the firmware's too old to switch, we stay at
+    # BASE_BAUD_RATE.
+    def __init__(self, port=None, resetTime=RESET_TIME, deltaMode=False, baudrate=DEFAULT_BAUD_RATE):
         threading.Thread.__init__(self)
+        if baudrate not in BAUD_RATES:
+            print "The arduino can't do", baudrate, "baud, only", BAUD_RATES
+            raise ValueError
         self.portOpened = False
         self.killReceived = False
+        self.portName = port
+        self.resetTime = resetTime
+        # Picks sensor packets out of what the arduino sends back
+        self.parser = SensorPacketParser()
+        self.deltaMode = deltaMode
+        self.baudrate = baudrate
+        self.lastFullRefresh = 0.0
+        # How many command / sensor packet round trips we've done, and how
+        # many bytes have gone each way
+        self.cycles = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        # The counters when getLinkStats() was last called
+        self.lastLinkStats = (time.time(), 0, 0, 0)
+        # The command packet, once the arduino's been initialized
+        self.commands = None
+        # The thread running checkPorts, once we're connected
+        self.readWriteThread = None
+
+        # Arrays for keeping track of input / output
+        self.motorSpeeds = []
+        self.stepperSteps = []
+        self.servoAngles = []
+        self.digitalSensors = []
+        self.analogSensors = []
+
+        # Arrays for keeping track of ports
+        self.digitalPorts = []
+        self.analogPorts = []
+        self.motorControllerPorts = []
+        self.stepperPorts = []
+        self.servoPorts = []
 
     # Start the connection and the thread that communicates with the arduino
     def run(self):
         self.portOpened = self.connect()
         if (self.portOpened):
             self.sendInitData()
+            if self.baudrate != BASE_BAUD_RATE:
+                self.negotiateBaudRate()
+        # Losing the arduino while switching baud rates can leave us with no
+        # connection at all
+        if (self.portOpened):
             self.readWriteThread = threading.Thread(target=self.checkPorts)
             self.readWriteThread.start()
 
@@ -43,28 +102,74 @@ class Arduino(threading.Thread):
     def stop(self):
         # This should tell the thread to finish
         self.killReceived = True
-        self.readWriteThread.join()
+        # (There's no thread if we never connected)
+        if self.readWriteThread != None:
+            self.readWriteThread.join()
 
     # Create the serial connection to the arduino
     def connect(self):
         print "Connecting"
         if self.portOpened: self.close()
-        # Loop through possible values of ACMX, and try to connect on each one
-        for i in range(4):
+        # Loop through possible ports, and try to connect on each one
+        ports = DEFAULT_PORTS
+        if self.portName != None:
+            ports = [self.portName]
+        for portName in ports:
             try:
                 # Try to create the serial connection
-                self.port=serial.Serial(port='/dev/ttyACM{0}'.format(i), baudrate=9600, timeout=0)
+                self.port=serial.Serial(port=portName, baudrate=BASE_BAUD_RATE, timeout=READ_TIMEOUT)
                 if self.port.isOpen():
-                    time.sleep(2) #Allows the arduino to initialize
+                    time.sleep(self.resetTime) #Allows the arduino to initialize
                     self.port.flush()
                     print "Connected"
                     return True
             except:
                 # Some debugging prints
-                print "Arduino not connected on ACM{0}".format(i)
+                print "Arduino not connected on", portName
         print "Failed to connect"
         return False
 
+    # Ask the arduino to switch to self.baudrate, and switch with it if it
+    # says yes. This has to happen after sendInitData(), since old firmware
+    # has nowhere to put its answer before that. Returns whether we switched.
+    # Packet format: 'B' 2 <index in BAUD_RATES + 1> ';'
+    # New firmware answers with "B<index + 1>;" and then switches. Old
+    # firmware doesn't know 'B', so it just sends sensor data back.
+    def negotiateBaudRate(self):
+        code = chr(BAUD_RATES.index(self.baudrate) + 1)
+        self.port.write("B" + chr(2) + code + ";")
+        oldFirmware = SensorPacketParser(len(self.digitalPorts), len(self.analogPorts))
+        reply = ""
+        deadline = time.time() + NEGOTIATION_TIMEOUT
+        while time.time() < deadline:
+            data = self.port.read(max(1, self.port.inWaiting()))
+            reply += data
+            if reply.startswith("B") and len(reply) >= 3:
+                break
+            oldFirmware.feed(data)
+            if len(oldFirmware.packets()) > 0:
+                print "Arduino firmware can't switch baud rates, staying at", BASE_BAUD_RATE
+                return False
+        if reply[:3] != "B" + code + ";":
+            print "Arduino didn't switch to", self.baudrate, "baud, staying at", BASE_BAUD_RATE
+            return False
+
+        time.sleep(SWITCH_TIME)
+        self.port.baudrate = self.baudrate
+        # Make sure we can hear each other at the new rate. If not, the
+        # arduino's somewhere we can't talk to it, so start it over.
+        self.sendCommands()
+        if self.readSensorData(NEGOTIATION_TIMEOUT):
+            print "Switched to", self.baudrate, "baud"
+            return True
+        print "Lost the arduino at", self.baudrate, "baud, starting over at", BASE_BAUD_RATE
+        self.port.close()
+        self.portOpened = False
+        self.portOpened = self.connect()
+        if self.portOpened:
+            self.sendInitData()
+        return False
+
     # This function constantly sends out a command packet to the arduino
     # (based on the states of all the arrays) then blocks until it receives
     # a data packet in response (and sets the appropriate arrays based on it).
@@ -73,67 +178,95 @@ class Arduino(threading.Thread):
     def checkPorts(self):
         # If killReceived is set to true, we want to kill this thread
         while not self.killReceived:
-            # Build the command packet
-            # Command packet format:
-            # An1234Bm5678;
-            # A, B = Command modes (M - motor command, S - servo command, ...)
-            #        Command modes tell the arduino how to interpret what comes
-            #        after it.
-            # n, m = Number of arguments. This tells the arduino how many
-            #        arguments to look for and parse.
-            # 1234, 5678 = Arguments. These depend on the command, but specify
-            #        things like motor speed and servo angle. Note - in many
-            #        places we add 1 before sending an argument and subtract
-            #        1 on the other end. This is because we can't send the null
-            #        character across.
-            # ; = Special command mode that means "end of packet"
-            output = ""
-            output += "M" + chr(len(self.motorSpeeds) + 1)
-            for i in self.motorSpeeds:
-                output += chr(i+1)
-            output += "T" + chr(len(self.stepperSteps) + 1)
-            for i in range(len(self.stepperSteps)):
-                step = self.stepperSteps[i]
-                output += chr(int(step))
-            output += "S" + chr(len(self.servoAngles) + 1)
-            for i in self.servoAngles:
-                output += chr(i+1)
-            output += ";"
-            self.port.write(output)
-
-
-            # Read in the data packet that the arduino sends back
-            # Data packet format is identical to the command packet format,
-            # except the modes are different (ex. 'D' for digital instead of
-            # 'M' for motor)
-            # Possible modes:
-            #     'D' - Digital sensor data
-            #     'A' - Analog sensor data
-            done = False
-            while (not done):
-                # Read in the mode
-                type = serialRead(self.port)
-
-                # Process arguments based on mode
-                # Digital
-                if (type == 'D'):
-                    length = ord(serialRead(self.port))-1
-                    # Fill the digitalSensors array with incoming data
-                    for i in range(length):
-                        # If we read in a 2, then the bump sensor is hit,
-                        # otherwise it's not
-                        self.digitalSensors[i] = ord(serialRead(self.port))==2
-                # Analog
-                elif (type == 'A'):
-                    length = ord(serialRead(self.port))-1
-                    # Fill the analogSensors array with incoming data
-                    for i in range(length):
-                        byte0 = ord(serialRead(self.port))-1
-                        byte1 = ord(serialRead(self.port))-1
-                        self.analogSensors[i] = byte1 * 256 + byte0
-                # End of packet
-                elif (type == ';'):
-                    done = True
+            self.sendCommands()
+            if self.readSensorData():
+                self.cycles += 1
+
+    # Build the command packet
+    # Command packet format:
+    # An1234Bm5678;
+    # A, B = Command modes (M - motor command, S - servo command, ...)
+    #        Command modes tell the arduino how to interpret what comes
+    #        after it.
+    # n, m = Number of arguments. This tells the arduino how many
+    #        arguments to look for and parse.
+    # 1234, 5678 = Arguments. These depend on the command, but specify
+    #        things like motor speed and servo angle. Note - in many
+    #        places we add 1 before sending an argument and subtract
+    #        1 on the other end. This is because we can't send the null
+    #        character across.
+    # ; = Special command mode that means "end of packet"
+    # The layout can't change once the arduino has been initialized, so we
+    # build it once and the setters patch each value into it in place (see
+    # CommandPacket in packets.py).
+    def compileCommands(self):
+        # Setters from now on patch it, so anything set while we fill it in
+        # from the arrays is still there afterwards
+        self.commands = CommandPacket(len(self.motorSpeeds), len(self.stepperSteps), len(self.servoAngles))
+        for i in range(len(self.motorSpeeds)):
+            self.commands.setMotorSpeed(i, self.motorSpeeds[i])
+        for i in range(len(self.stepperSteps)):
+            self.commands.stepStepper(i, self.stepperSteps[i])
+        for i in range(len(self.servoAngles)):
+            self.commands.setServoAngle(i, self.servoAngles[i])
+
+    def sendCommands(self):
+        now = time.time()
+        if self.deltaMode and now - self.lastFullRefresh < FULL_REFRESH_PERIOD:
+            packet = self.commands.deltaPacket()
+        else:
+            packet = self.commands.fullPacket()
+            self.lastFullRefresh = now
+        self.port.write(packet)
+        self.bytesSent += len(packet)
+
+    # Returns how the link's done since the last call: round trips per
+    # second, and the average bytes sent and received per round trip
+    def getLinkStats(self):
+        now, cycles, sent, received = time.time(), self.cycles, self.bytesSent, self.bytesReceived
+        lastTime, lastCycles, lastSent, lastReceived = self.lastLinkStats
+        self.lastLinkStats = (now, cycles, sent, received)
+        cycles -= lastCycles
+        if cycles == 0:
+            return {"cycleRate": 0.0, "sentPerCycle": 0.0, "receivedPerCycle": 0.0}
+        return {"cycleRate": cycles / (now - lastTime),
+                "sentPerCycle": float(sent - lastSent) / cycles,
+                "receivedPerCycle": float(received - lastReceived) / cycles}
+
+    def printLinkStats(self):
+        stats = self.getLinkStats()
+        print "Arduino link: %.1f cycles/s, %.1f bytes sent and %.1f received per cycle" % (
+            stats["cycleRate"], stats["sentPerCycle"], stats["receivedPerCycle"])
+
+    # Read in the data packet that the arduino sends back, and fill in the
+    # sensor arrays from it. Returns False if we got told to stop, or it
+    # took longer than timeout seconds (if there is one), first.
+    # Data packet format is identical to the command packet format,
+    # except the modes are different (ex. 'D' for digital instead of
+    # 'M' for motor)
+    # Possible modes:
+    #     'D' - Digital sensor data
+    #     'A' - Analog sensor data
+    # Rather than reading a byte at a time, we wait for as many bytes as it
+    # takes to finish the packet (or READ_TIMEOUT, so we notice being told to
+    # stop), take whatever else is there too, and let the parser pick the
+    # packet out. That way we sleep in the kernel until the packet's all there
+    # instead of spinning on reads that come back empty.
+    def readSensorData(self, timeout=None):
+        if timeout != None:
+            deadline = time.time() + timeout
+        while not self.killReceived and (timeout == None or time.time() < deadline):
+            packets = self.parser.packets()
+            if len(packets) > 0:
+                # If more than one came in, the newest one wins
+                digital, analog = packets[-1]
+                self.digitalSensors[:len(digital)] = digital
+                self.analogSensors[:len(analog)] = analog
+                return True
+            data = self.port.read(max(self.parser.needed(), self.port.inWaiting()))
+            self.bytesReceived += len(data)
+            self.parser.feed(data)
+        return False
 
     # Send initializing data to the arduino, so that it can dynamically set up
     # the actuators and sensors in memory
@@ -179,16 +312,27 @@ class Arduino(threading.Thread):
         output += ";"
 
         self.port.write(output)
+        self.compileCommands()
+        # Now we know exactly what the sensor packets will look like
+        self.parser = SensorPacketParser(numDigital, numAnalog)
 
         print "Init", output
     
     # Getting and setting values for sensors and actuators
+    # (once the arduino's initialized, the actuator ones patch the command
+    # packet too)
     def setMotorSpeed(self, motorNum, speed):
         self.motorSpeeds[motorNum] = speed
+        if self.commands != None:
+            self.commands.setMotorSpeed(motorNum, speed)
     def stepStepper(self, stepperNum, step):
         self.stepperSteps[stepperNum] = step
+        if self.commands != None:
+            self.commands.stepStepper(stepperNum, step)
     def setServoAngle(self, servoNum, angle):
         self.servoAngles[servoNum] = angle
+        if self.commands != None:
+            self.commands.setServoAngle(servoNum, angle)
     def getDigitalRead(self, index):
         out = self.digitalSensors[index]
         return out
@@ -222,7 +366,8 @@ class Arduino(threading.Thread):
         self.servoAngles.append(0)
         return len(self.servoPorts) - 1
 
-# Read from the serial port ignoring junk (use this instead of just port.read())
+# Read from the serial port ignoring junk, one byte at a time. This spins
+# if the port has no timeout, Arduino uses SensorPacketParser instead.
 def serialRead(port):
     inp = port.read()
     # Throw out no input (when python overtakes arduino)
@@ -0,0 +1,433 @@
+import os
+import select
+import sys
+import threading
+import time
+import tty
+from multiprocessing import Pipe, Process
+
+from packets import BAUD_RATES
+
+# Pretends to be an Arduino running arduino_firmware.pde, on a pseudo
+# terminal instead of /dev/ttyACM*, so that everything that talks to the
+# Arduino (arduino3.py and up) can be run and benchmarked without a board.
+# Point Arduino at it with Arduino(port=emulator.path), or run this file to
+# get an emulator to point main.py at by hand:
+#   python emulator.py --baud 9600 --analog 1=300 --digital 6=1
+# (add --old for one that acts like firmware that can't change baud rates)
+#
+# It speaks the same protocol as the firmware, quirks and all:
+#   - An 'I' packet sets up the motor controllers ('M'), steppers ('T'),
+#     servos ('S'), digital sensors ('D') and analog sensors ('A'), and gets
+#     no reply
+#   - A command packet sets motor speeds ('M'), steps steppers ('T') and
+#     sets servo angles ('S'), and ends with ';'
+#   - In delta mode, a command packet only has the actuators that changed,
+#     with 'm', 't' and 's' followed by (index + 1, argument) pairs, and a
+#     packet that's just ';' only asks for the sensors
+#   - Every command packet gets a reply with the digital ('D') and analog
+#     ('A') sensor readings, ending with ';'
+#   - A 'B' packet asks to switch baud rates, and gets a 'B' reply before the
+#     switch. Old firmware didn't know about 'B', so it just sent sensor data
+#     back. Give the emulator changesBaud=False to act like that.
+# Counts have 1 added to them and arguments are signed chars with 1 added,
+# so that there's never a null byte, the same as the firmware.
+#
+# If it's given a baud rate, it takes as long as a real serial link would
+# to get each packet in and each reply out, 10 bits per byte (8N1).
+#
+# Sensor readings come from sensor scripts, one per port. A script can be
+#   - a number, the reading all the time
+#   - a list of numbers, one per reply, starting again when they run out
+#   - a function, called with the time in seconds since the emulator
+#     started, that returns the reading
+# Digital readings are 0 or 1 (digitalRead), analog are 0 to 1023
+# (analogRead). Ports without a script read 0.
+
+# Mode characters, the same as in the firmware
+MOTOR_CHAR = 'M'
+STEPPER_CHAR = 'T'
+SERVO_CHAR = 'S'
+MOTOR_DELTA_CHAR = 'm'
+STEPPER_DELTA_CHAR = 't'
+SERVO_DELTA_CHAR = 's'
+DIGITAL_CHAR = 'D'
+ANALOG_CHAR = 'A'
+INIT_CHAR = 'I'
+BAUD_CHAR = 'B'
+DONE_CHAR = ';'
+
+# Bits on the wire for every byte: a start bit, 8 data bits and a stop bit
+BITS_PER_BYTE = 10
+# How many steps a stepper takes when it's told to step
+STEPS_PER_STEP = 100
+
+# Returns the reading a sensor script gives at time t on reply number reply
+def sensorReading(script, t, reply):
+    if callable(script):
+        return script(t)
+    if isinstance(script, (list, tuple)):
+        return script[reply % len(script)]
+    return script
+
+# chars are signed on the Arduino, so anything above 127 comes out negative
+def signedChar(c):
+    value = ord(c)
+    if value > 127:
+        value -= 256
+    return value
+
+# Returns the reply the firmware's sendSensorData() makes for a list of
+# digital readings (0 or 1) and a list of analog readings (0 to 1023)
+def sensorPacket(digital, analog):
+    reply = [DIGITAL_CHAR, chr(len(digital) + 1)]
+    for value in digital:
+        reply.append(chr(int(value) + 1))
+    reply.append(ANALOG_CHAR)
+    reply.append(chr(len(analog) + 1))
+    for value in analog:
+        value = int(value)
+        byte0 = value % 256
+        byte1 = value / 256
+        # Never send a null byte, the same as the firmware
+        if byte0 != 255:
+            byte0 += 1
+        if byte1 != 255:
+            byte1 += 1
+        reply.append(chr(byte0))
+        reply.append(chr(byte1))
+    reply.append(DONE_CHAR)
+    return "".join(reply)
+
+class ArduinoEmulator(threading.Thread):
+    # baudrate is the speed of the pretend link (None for as fast as the pty
+    # goes). digital and analog map ports to sensor scripts. processingTime
+    # is how long the pretend Arduino takes to act on a packet, in seconds.
+    def __init__(self, baudrate=9600, digital=None, analog=None, processingTime=0.0, changesBaud=True):
+        threading.Thread.__init__(self, name="ArduinoEmulator")
+        self.daemon = True
+        self.baudrate = baudrate
+        self.digitalScripts = digital or {}
+        self.analogScripts = analog or {}
+        self.processingTime = processingTime
+        self.changesBaud = changesBaud
+        self.killReceived = False
+
+        # The pty, we read and write master and whoever is pretending to be
+        # the computer opens path. Keeping slave open means reads don't fail
+        # while nobody else has it open.
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.buffer = ""
+        self.bufferTime = 0.0
+        # When the last byte sent to us finished arriving over the pretend
+        # link, and when the last byte we sent finishes leaving
+        self.inFreeAt = 0.0
+        self.outFreeAt = 0.0
+
+        # What the firmware has been set up with
+        self.motorControllerPorts = []
+        self.stepperPorts = []
+        self.servoPorts = []
+        self.digitalPorts = []
+        self.analogPorts = []
+
+        # What the actuators have been told to do, by index. Steppers step
+        # every packet while their state is 1, stepperSteps adds them up.
+        self.motorSpeeds = []
+        self.stepperStates = []
+        self.stepperSteps = []
+        self.servoAngles = []
+
+        # Counters
+        self.inits = 0
+        self.packets = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.startTime = time.time()
+
+    # The time it takes to send one byte over the pretend link
+    def byteTime(self):
+        if self.baudrate == None:
+            return 0.0
+        return float(BITS_PER_BYTE) / self.baudrate
+
+    # Read one byte, waiting for it if need be, like the firmware's
+    # serialRead(). Raises EOFError if we get stopped first.
+    def serialRead(self):
+        while self.buffer == "":
+            if self.killReceived:
+                raise EOFError
+            if select.select([self.master], [], [], 0.1)[0]:
+                self.buffer = os.read(self.master, 4096)
+                self.bufferTime = time.time()
+        c = self.buffer[0]
+        self.buffer = self.buffer[1:]
+        self.bytesIn += 1
+        # The byte can't have finished arriving before the one in front of
+        # it, or before it was even sent
+        self.inFreeAt = max(self.inFreeAt, self.bufferTime) + self.byteTime()
+        return c
+
+    # Send data, as fast as the pretend link allows
+    def serialWrite(self, data):
+        byteTime = self.byteTime()
+        if byteTime == 0.0:
+            os.write(self.master, data)
+            self.bytesOut += len(data)
+            return
+        start = max(self.outFreeAt, time.time())
+        sent = 0
+        while sent < len(data):
+            # Send everything that would have made it over the link by now
+            now = time.time()
+            due = min(len(data), int((now - start) / byteTime) + 1)
+            if due > sent:
+                os.write(self.master, data[sent:due])
+                self.bytesOut += due - sent
+                sent = due
+            if sent < len(data):
+                time.sleep(min(byteTime * (len(data) - sent), 0.001))
+        self.outFreeAt = start + len(data) * byteTime
+
+    # Wait until everything sent to us so far has finished arriving
+    def waitForInput(self):
+        delay = self.inFreeAt - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self):
+        try:
+            while not self.killReceived:
+                self.loop()
+        except EOFError:
+            pass
+
+    def stop(self):
+        self.killReceived = True
+
+    # The same as the firmware's loop()
+    def loop(self):
+        done = False
+        while not done:
+            mode = self.serialRead()
+            if mode == INIT_CHAR:
+                self.initAll()
+                return
+            elif mode == BAUD_CHAR and self.changesBaud:
+                self.changeBaudRate()
+                return
+            elif mode == MOTOR_CHAR:
+                self.moveMotors()
+            elif mode == STEPPER_CHAR:
+                self.stepSteppers()
+            elif mode == SERVO_CHAR:
+                self.moveServos()
+            elif mode == MOTOR_DELTA_CHAR:
+                self.moveMotorsDelta()
+            elif mode == STEPPER_DELTA_CHAR:
+                self.stepSteppersDelta()
+            elif mode == SERVO_DELTA_CHAR:
+                self.moveServosDelta()
+            elif mode == DONE_CHAR:
+                done = True
+        for i in range(len(self.stepperStates)):
+            if self.stepperStates[i] == 1:
+                self.stepperSteps[i] += STEPS_PER_STEP
+        self.waitForInput()
+        if self.processingTime > 0:
+            time.sleep(self.processingTime)
+        self.sendSensorData()
+        self.packets += 1
+
+    # Read a count, which has 1 added to it
+    def readCount(self):
+        return ord(self.serialRead()) - 1
+
+    def initAll(self):
+        mode = self.serialRead()
+        while mode != DONE_CHAR:
+            if mode == MOTOR_CHAR:
+                self.motorControllerPorts = [(ord(self.serialRead()), ord(self.serialRead()))
+                                             for i in range(self.readCount())]
+                self.motorSpeeds = [0] * (2 * len(self.motorControllerPorts))
+            elif mode == STEPPER_CHAR:
+                self.stepperPorts = [(ord(self.serialRead()), ord(self.serialRead()))
+                                     for i in range(self.readCount())]
+                self.stepperStates = [0] * len(self.stepperPorts)
+                self.stepperSteps = [0] * len(self.stepperPorts)
+            elif mode == SERVO_CHAR:
+                self.servoPorts = [ord(self.serialRead()) for i in range(self.readCount())]
+                self.servoAngles = [0] * len(self.servoPorts)
+            elif mode == DIGITAL_CHAR:
+                self.digitalPorts = [ord(self.serialRead()) for i in range(self.readCount())]
+            elif mode == ANALOG_CHAR:
+                self.analogPorts = [ord(self.serialRead()) for i in range(self.readCount())]
+            mode = self.serialRead()
+        self.inits += 1
+
+    def moveMotors(self):
+        for i in range(self.readCount()):
+            speed = signedChar(self.serialRead()) - 1
+            if i < len(self.motorSpeeds):
+                self.motorSpeeds[i] = speed
+
+    def stepSteppers(self):
+        for i in range(self.readCount()):
+            step = signedChar(self.serialRead()) - 1
+            if i < len(self.stepperStates):
+                self.stepperStates[i] = step
+
+    def moveServos(self):
+        for i in range(self.readCount()):
+            angle = signedChar(self.serialRead()) - 1
+            if i < len(self.servoAngles):
+                self.servoAngles[i] = angle
+
+    # The same as the firmware's changeBaudRate(). The answer goes out at the
+    # old baud rate.
+    def changeBaudRate(self):
+        index = -1
+        for i in range(self.readCount()):
+            index = self.readCount()
+        self.serialRead()
+        known = index >= 0 and index < len(BAUD_RATES)
+        if known:
+            self.serialWrite(BAUD_CHAR + chr(index + 1) + DONE_CHAR)
+            self.baudrate = BAUD_RATES[index]
+        else:
+            self.serialWrite(BAUD_CHAR + chr(1) + DONE_CHAR)
+
+    # Read the (index, argument) pairs of a delta mode
+    def readChanges(self):
+        return [(self.readCount(), signedChar(self.serialRead()) - 1) for i in range(self.readCount())]
+
+    def moveMotorsDelta(self):
+        for i, speed in self.readChanges():
+            if i < len(self.motorSpeeds):
+                self.motorSpeeds[i] = speed
+
+    def stepSteppersDelta(self):
+        for i, step in self.readChanges():
+            if i < len(self.stepperStates):
+                self.stepperStates[i] = step
+
+    def moveServosDelta(self):
+        for i, angle in self.readChanges():
+            if i < len(self.servoAngles):
+                self.servoAngles[i] = angle
+
+    def sendSensorData(self):
+        t = time.time() - self.startTime
+        digital = [sensorReading(self.digitalScripts.get(port, 0), t, self.packets) for port in self.digitalPorts]
+        analog = [sensorReading(self.analogScripts.get(port, 0), t, self.packets) for port in self.analogPorts]
+        self.serialWrite(sensorPacket(digital, analog))
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+# Sensor scripts for an emulator with the same sensors as the robot (see
+# ArduinoWrapper)
+ROBOT_DIGITAL = {4: 1, 2: 0, 6: 0}
+ROBOT_ANALOG = {1: 300, 0: 512}
+# How long EmulatedRobot lets the arduino run before timing it, in seconds
+WARM_UP_TIME = 0.5
+
+# Runs an emulator until anything comes in on conn, after sending its path.
+# Sends back its motor speeds and servo angles at the end. This is the target
+# of the process EmulatedRobot starts.
+def runEmulator(conn, baudrate, digital, analog, changesBaud):
+    emulator = ArduinoEmulator(baudrate, digital, analog, changesBaud=changesBaud)
+    emulator.start()
+    conn.send(emulator.path)
+    conn.recv()
+    emulator.stop()
+    emulator.join()
+    conn.send((emulator.motorSpeeds, emulator.servoAngles))
+
+# An Arduino (arduinoClass, from arduino3.py or a subclass of it) wired up
+# like the robot, talking to an ArduinoEmulator in its own process, for the
+# benchmarks. The emulator starts out at emulatorBaudrate, and the rest of
+# the arguments are passed on to the Arduino. Add anything else it needs
+# (like a servo) to arduino before calling run().
+class EmulatedRobot():
+    def __init__(self, arduinoClass=None, baudrate=None, deltaMode=False, emulatorBaudrate=BAUD_RATES[0],
+                 changesBaud=True, digital=ROBOT_DIGITAL, analog=ROBOT_ANALOG):
+        # arduino3.py needs pyusb, the emulator doesn't
+        from arduino3 import Arduino, MotorController, Motor, DigitalSensor, AnalogSensor
+        if arduinoClass == None:
+            arduinoClass = Arduino
+        if baudrate == None:
+            baudrate = emulatorBaudrate
+        self.conn, childConn = Pipe()
+        self.process = Process(target=runEmulator, args=(childConn, emulatorBaudrate, digital, analog, changesBaud))
+        self.process.start()
+        a = arduinoClass(self.conn.recv(), 0, deltaMode, baudrate)
+        # The same as ArduinoWrapper
+        mc0 = MotorController(a, 18, 19)
+        mc1 = MotorController(a, 16, 17)
+        self.motors = [Motor(a, mc0), Motor(a, mc0), Motor(a, mc1), Motor(a, mc1)]
+        self.sensors = [DigitalSensor(a, 4), DigitalSensor(a, 2), DigitalSensor(a, 6),
+                        AnalogSensor(a, 1), AnalogSensor(a, 0)]
+        self.arduino = a
+
+    # Start the arduino, and give it WARM_UP_TIME to get going
+    def run(self):
+        self.arduino.run()
+        time.sleep(WARM_UP_TIME)
+
+    # Calls sample() (which should return whatever is being measured), waits
+    # duration seconds and calls it again. Returns both samples.
+    def timeRun(self, duration, sample):
+        before = sample()
+        time.sleep(duration)
+        return before, sample()
+
+    # Stop the arduino and the emulator. Returns the emulator's motor speeds
+    # and servo angles.
+    def stop(self):
+        self.arduino.stop()
+        self.conn.send("KILL")
+        actuators = self.conn.recv()
+        self.process.join()
+        return actuators
+
+# Turn "PORT=VALUE" into (port, value)
+def parseScript(arg):
+    port, value = arg.split("=")
+    return int(port), float(value)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    baudrate = 9600
+    digital = {}
+    analog = {}
+    changesBaud = "--old" not in args
+    args = [arg for arg in args if arg != "--old"]
+    i = 0
+    while i < len(args) - 1:
+        if args[i] == "--baud":
+            baudrate = int(args[i + 1])
+        elif args[i] == "--digital":
+            port, value = parseScript(args[i + 1])
+            digital[port] = value
+        elif args[i] == "--analog":
+            port, value = parseScript(args[i + 1])
+            analog[port] = value
+        i += 2
+    if i != len(args):
+        print "Usage: python emulator.py [--baud N] [--digital PORT=VALUE]... [--analog PORT=VALUE]... [--old]"
+        sys.exit(1)
+
+    emulator = ArduinoEmulator(baudrate, digital, analog, changesBaud=changesBaud)
+    emulator.start()
+    print "Emulating an Arduino on", emulator.path
+    try:
+        while True:
+            time.sleep(1)
+            print "%d packets, %d bytes in, %d bytes out, motors %s" % (emulator.packets, emulator.bytesIn,
+                emulator.bytesOut, emulator.motorSpeeds)
+    except KeyboardInterrupt:
+        emulator.stop()
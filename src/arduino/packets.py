@@ -0,0 +1,218 @@
+import struct
+
+# Parsing for the packets that go over the serial link to the arduino (see
+# arduino3.py and arduino_firmware.pde)
+
+DIGITAL_CHAR = ord('D')
+ANALOG_CHAR = ord('A')
+DONE_CHAR = ord(';')
+BAUD_CHAR = ord('B')
+
+# The baud rates the firmware can switch to, by index, the same as baudRates
+# in the firmware. It always starts at the first one.
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 230400, 250000, 500000, 1000000]
+
+# The smallest sensor packet there is, "D\x01A\x01;" (no sensors at all)
+MIN_SENSOR_PACKET_SIZE = 5
+
+# Pulls sensor packets out of whatever bytes come in from the arduino, so that
+# we can read everything that's there at once instead of one byte at a time.
+# Bytes can come in any chunks, partial packets are kept until the rest of
+# them shows up.
+#
+# Sensor packet format (the firmware's sendSensorData()):
+#   'D' n+1 <n digital readings, each digitalRead + 1>
+#   'A' m+1 <m analog readings, each low byte + 1 then high byte + 1>
+#   ';'
+# An analog reading's two bytes together are a little endian unsigned short
+# that's 257 more than the reading, so we decode them all with one struct.
+#
+# If it's given how many digital and analog readings there are (what the
+# arduino was initialized with), anything that claims to be a packet with
+# different counts gets skipped as soon as we see them. Without that, a
+# packet that got cut off partway can claim to be hundreds of bytes long,
+# and nothing after it comes out until that many have come in.
+class SensorPacketParser():
+    def __init__(self, numDigital=None, numAnalog=None):
+        self.numDigital = numDigital
+        self.numAnalog = numAnalog
+        self.buffer = bytearray()
+        # Structs for decoding packets, by (digital count, analog count). There's
+        # normally only ever one.
+        self.structs = {}
+        # How many bytes we've thrown out because they weren't part of a packet
+        self.skipped = 0
+
+    # Add bytes that came in from the arduino
+    def feed(self, data):
+        self.buffer.extend(data)
+
+    # Returns how many more bytes we need before the packet at the front of
+    # the buffer is complete, as far as we can tell so far (at least 1)
+    def needed(self):
+        buf = self.buffer
+        size = MIN_SENSOR_PACKET_SIZE
+        if self.numDigital != None:
+            size += self.numDigital + 2 * self.numAnalog
+        elif len(buf) >= 2:
+            numDigital = buf[1] - 1
+            size += numDigital
+            if len(buf) >= 4 + numDigital:
+                size += 2 * (buf[3 + numDigital] - 1)
+        return max(1, size - len(buf))
+
+    # Whether the packet starting at offset has the counts we were told to
+    # expect, as far as we can tell from what's come in so far
+    def hasLayout(self, offset):
+        if self.numDigital == None:
+            return True
+        buf = self.buffer
+        analogStart = offset + 2 + self.numDigital
+        for position, value in [(offset + 1, self.numDigital + 1), (analogStart, ANALOG_CHAR),
+                                (analogStart + 1, self.numAnalog + 1)]:
+            if position < len(buf) and buf[position] != value:
+                return False
+        return True
+
+    def getStruct(self, numDigital, numAnalog):
+        key = (numDigital, numAnalog)
+        if key not in self.structs:
+            self.structs[key] = struct.Struct("<2x%dB2x%dHx" % (numDigital, numAnalog))
+        return self.structs[key]
+
+    # Returns a list of (digital readings, analog readings) for every complete
+    # packet that's come in, oldest first, and forgets about them. Digital
+    # readings are True for HIGH, analog readings are 0 to 1023.
+    def packets(self):
+        buf = self.buffer
+        packets = []
+        offset = 0
+        while True:
+            # Skip anything that isn't the start of a packet
+            start = buf.find(chr(DIGITAL_CHAR), offset)
+            if start == -1:
+                self.skipped += len(buf) - offset
+                offset = len(buf)
+                break
+            self.skipped += start - offset
+            offset = start
+            if not self.hasLayout(offset):
+                self.skipped += 1
+                offset += 1
+                continue
+            if len(buf) - offset < 2:
+                break
+            numDigital = buf[offset + 1] - 1
+            analogStart = offset + 2 + numDigital
+            if len(buf) < analogStart + 2:
+                break
+            numAnalog = buf[analogStart + 1] - 1
+            end = analogStart + 2 + 2 * numAnalog + 1
+            if len(buf) < end:
+                break
+            if numDigital < 0 or numAnalog < 0 or buf[analogStart] != ANALOG_CHAR or buf[end - 1] != DONE_CHAR:
+                # That wasn't really the start of a packet
+                self.skipped += 1
+                offset += 1
+                continue
+            values = self.getStruct(numDigital, numAnalog).unpack_from(buf, offset)
+            digital = [value == 2 for value in values[:numDigital]]
+            analog = [value - 257 for value in values[numDigital:]]
+            packets.append((digital, analog))
+            offset = end
+        del buf[:offset]
+        return packets
+
+MOTOR_CHAR = ord('M')
+STEPPER_CHAR = ord('T')
+SERVO_CHAR = ord('S')
+MOTOR_DELTA_CHAR = ord('m')
+STEPPER_DELTA_CHAR = ord('t')
+SERVO_DELTA_CHAR = ord('s')
+
+# A command packet that's laid out once, when we know how many motors,
+# steppers and servos there are, and then has each value patched in place when
+# it changes. Sending it is just writing out buffer, nothing gets built.
+#
+# Command packet format (the firmware's loop()):
+#   'M' n+1 <n motor speeds, each + 1>
+#   'T' k+1 <k stepper steps>
+#   'S' s+1 <s servo angles, each + 1>
+#   ';'
+#
+# It also keeps track of which values have changed since they were last sent,
+# so it can make delta packets that only have those in them:
+#   'm' c+1 <c (motor index + 1, speed + 1) pairs>
+#   't' c+1 <c (stepper index + 1, steps) pairs>
+#   's' c+1 <c (servo index + 1, angle + 1) pairs>
+#   ';'
+# leaving out any section with nothing in it, so that if nothing changed, the
+# packet is just ';'.
+class CommandPacket():
+    def __init__(self, numMotors, numSteppers, numServos):
+        self.motorOffset = 2
+        self.stepperOffset = self.motorOffset + numMotors + 2
+        self.servoOffset = self.stepperOffset + numSteppers + 2
+        self.buffer = bytearray(self.servoOffset + numServos + 1)
+        self.buffer[0] = MOTOR_CHAR
+        self.buffer[1] = numMotors + 1
+        self.buffer[self.stepperOffset - 2] = STEPPER_CHAR
+        self.buffer[self.stepperOffset - 1] = numSteppers + 1
+        self.buffer[self.servoOffset - 2] = SERVO_CHAR
+        self.buffer[self.servoOffset - 1] = numServos + 1
+        self.buffer[-1] = DONE_CHAR
+        # Whether each byte of buffer has changed since it was last sent
+        self.dirty = bytearray(len(self.buffer))
+        # For clearing all of dirty at once
+        self.zeroes = bytearray(len(self.buffer))
+        self.sections = [(MOTOR_DELTA_CHAR, self.motorOffset, numMotors),
+                         (STEPPER_DELTA_CHAR, self.stepperOffset, numSteppers),
+                         (SERVO_DELTA_CHAR, self.servoOffset, numServos)]
+        for i in range(numMotors):
+            self.setMotorSpeed(i, 0)
+        for i in range(numServos):
+            self.setServoAngle(i, 0)
+
+    # Patch a byte, marking it changed if it did. The value goes in before
+    # the mark, so whoever sends it can never see the mark without it.
+    def patch(self, offset, value):
+        if self.buffer[offset] != value:
+            self.buffer[offset] = value
+            self.dirty[offset] = 1
+
+    # speed is 0 to 254 (Motor turns -126 to 127 into that)
+    def setMotorSpeed(self, motorNum, speed):
+        self.patch(self.motorOffset + motorNum, speed + 1)
+
+    # The firmware steps a stepper when step is 1. Unlike everything else this
+    # doesn't get 1 added to it, so 0 goes out as a null byte, same as always.
+    def stepStepper(self, stepperNum, step):
+        self.patch(self.stepperOffset + stepperNum, int(step))
+
+    def setServoAngle(self, servoNum, angle):
+        self.patch(self.servoOffset + servoNum, angle + 1)
+
+    # Returns the whole packet, everything in it counts as sent
+    def fullPacket(self):
+        self.dirty[:] = self.zeroes
+        return self.buffer
+
+    # Returns a packet with only what's changed since it was last sent. Each
+    # mark is cleared before its value is read, so a value patched while we
+    # do this is either in this packet or marked for the next one.
+    def deltaPacket(self):
+        packet = bytearray()
+        for char, offset, count in self.sections:
+            changed = []
+            for i in range(count):
+                if self.dirty[offset + i]:
+                    self.dirty[offset + i] = 0
+                    changed.append(i)
+            if len(changed) > 0:
+                packet.append(char)
+                packet.append(len(changed) + 1)
+                for i in changed:
+                    packet.append(i + 1)
+                    packet.append(self.buffer[offset + i])
+        packet.append(DONE_CHAR)
+        return packet
@@ -6,10 +6,15 @@
 #define motorChar 'M'
 #define stepperChar 'T'
 #define servoChar 'S'
+// Delta modes, which only set the actuators that changed, by index
+#define motorDeltaChar 'm'
+#define stepperDeltaChar 't'
+#define servoDeltaChar 's'
 #define digitalChar 'D'
 #define analogChar 'A'
 #define initChar 'I'
 #define doneChar ';'
+#define baudChar 'B'
 // The motor controller reset pin (not currently used)
 #define mcResetPin 53
 
@@ -48,6 +53,8 @@ class Stepper
 CompactQik2s9v1** mc;
 // Dynamic array of all the stepper motors
 Stepper** stepper;
+// What each stepper was last told, it steps every loop while this is 1
+int* stepperState;
 // Dynamic array of all the servo ports
 Servo** servo;
 // Dynamic array of all the digital ports
@@ -64,6 +71,11 @@ int numAnalog = 0;
 
 int resetCounter = 0;
 
+// The baud rates python can ask us to switch to, by index. Python has the
+// same list (BAUD_RATES in packets.py). We always start at the first one.
+long baudRates[] = {9600, 19200, 38400, 57600, 115200, 230400, 250000, 500000, 1000000};
+#define numBaudRates 9
+
 
 // The dynamically sized return string
 char* retVal;
@@ -158,11 +170,13 @@ void stepperInit()
     free(stepper[i]);
   }
   free(stepper);
+  free(stepperState);
 
   // Read in the new numSteppers
   numSteppers = (int) serialRead() - 1;
   // Reallocate the stepper array
   stepper = (Stepper**) malloc(sizeof(Stepper*) * numSteppers);
+  stepperState = (int*) malloc(sizeof(int) * numSteppers);
   for (int i = 0; i < numSteppers; i++)
   {
     // Read in the dirPin, stepPin, and enablePin
@@ -171,6 +185,7 @@ void stepperInit()
     // Create the Stepper object and store it in the array
     tempStepper = new Stepper(stepPin, enablePin);
     stepper[i] = tempStepper;
+    stepperState[i] = 0;
   }
 }
 
@@ -283,6 +298,9 @@ void loop()
     // 1234, 5678 = command arguments
     // ; = special mode marker that deliminates the end of the command
     //     packet
+    // In delta mode python uses the lower case modes instead, and only
+    // sends the actuators that changed, each as an (index + 1, argument)
+    // pair. A packet with nothing in it but ';' just asks for sensor data.
 
     // Use the done helper variable to know when to move on
     boolean done = false;
@@ -295,6 +313,12 @@ void loop()
       // Perform actions based on the mode read in
       switch (mode)
       {
+        case baudChar:
+          // Switch to the baud rate python asked for
+          changeBaudRate();
+          return;
+          break;
+
         case initChar:
           // Process all the input data and set up all the dynamic
           // arrays
@@ -319,6 +343,18 @@ void loop()
           // angles
           moveServos();
           break;
+
+        case motorDeltaChar:
+          moveMotorsDelta();
+          break;
+
+        case stepperDeltaChar:
+          stepSteppersDelta();
+          break;
+
+        case servoDeltaChar:
+          moveServosDelta();
+          break;
   
         case doneChar:
           // We're done reading in input from python
@@ -327,6 +363,15 @@ void loop()
       }
     }
 
+    // Step the steppers that are stepping
+    for (int i = 0; i < numSteppers; i++)
+    {
+      if (stepperState[i] == 1)
+      {
+        stepper[i]->step(100);
+      }
+    }
+
 
     //------------- WRITE OUT ALL THE SENSOR DATA -----------
 
@@ -446,18 +491,15 @@ void moveMotors()
   }
 }
 
+// Per stepper, read in the steps. Steppers get stepped once the whole
+// packet is in.
 void stepSteppers()
 {
   // Read in (and cast to an int) the number of steppers
   int numSteppers = (int) serialRead() - 1;
-  // Per stepper, read in the steps and step it
   for (int i = 0; i < numSteppers; i++)
   {
-    int step = (int) serialRead() - 1;
-    if (step == 1)
-    {
-      stepper[i]->step(100);
-    }
+    stepperState[i] = (int) serialRead() - 1;
   }
 }
 
@@ -484,5 +526,65 @@ void moveServos()
   }
 }
 
+// Delta versions of the functions above. Each one reads in the number of
+// actuators that changed, followed by an (index + 1, argument) pair per
+// actuator.
+void moveMotorsDelta()
+{
+  int numChanged = (int) serialRead() - 1;
+  for (int i = 0; i < numChanged; i++)
+  {
+    int index = (int) serialRead() - 1;
+    char in = serialRead();
+    setMotorSpeed(index, (int) in - 1);
+  }
+}
 
+void stepSteppersDelta()
+{
+  int numChanged = (int) serialRead() - 1;
+  for (int i = 0; i < numChanged; i++)
+  {
+    int index = (int) serialRead() - 1;
+    stepperState[index] = (int) serialRead() - 1;
+  }
+}
+
+void moveServosDelta()
+{
+  int numChanged = (int) serialRead() - 1;
+  for (int i = 0; i < numChanged; i++)
+  {
+    int index = (int) serialRead() - 1;
+    setServoAngle(index, (int) serialRead() - 1);
+  }
+}
 
+// Handles the baud rate command, "Bn<index + 1>;". Says yes with
+// "B<index + 1>;" at the old baud rate, then switches. If the index isn't one
+// we know, we say "B\x01;" (the first baud rate, which is what we're at after
+// a reset, and python only asks right after one) and stay where we are.
+// Firmware from before this didn't know 'B', so it just sends sensor data
+// back, which is how python knows to stay at 9600.
+void changeBaudRate()
+{
+  int numArgs = (int) serialRead() - 1;
+  int index = -1;
+  for (int i = 0; i < numArgs; i++)
+  {
+    index = (int) serialRead() - 1;
+  }
+  // Eat the ';' so it doesn't look like a packet of its own
+  serialRead();
+
+  boolean known = index >= 0 && index < numBaudRates;
+  Serial.write(baudChar);
+  Serial.write((uint8_t) (known ? index + 1 : 1));
+  Serial.write(doneChar);
+  if (known)
+  {
+    // Give the answer time to get out before switching
+    delay(10);
+    Serial.begin(baudRates[index]);
+  }
+}
@@ -1,5 +1,6 @@
 from blargh import Blargh
 from state import *
+from world.blackboard import WorldBlackboard
 
 import time
 
@@ -7,29 +8,61 @@ import time
 # <3 Will
 
 # Wrap the world that the World blargh passes in so that we can keep
-# track of time correctly
+# track of time correctly. In lock-step mode the world carries the simulated
+# time, and that gets used instead of the real time.
 class WorldWrapper():
     def __init__(self):
         self.world = None
-        self.startTime = time.time()
+        self.startTime = None
         self.time = 0
     def updateWorld(self, world):
         self.world = world
-        self.time = time.time() - self.startTime
+        if self.startTime == None:
+            self.startTime = self.now()
+        self.time = self.now() - self.startTime
     def resetTime(self):
-        self.startTime = time.time()
+        self.startTime = self.now()
         self.time = 0
+    def now(self):
+        if self.world != None and self.world.time != None:
+            return self.world.time
+        return time.time()
 
 # Takes in the state of the world and puts out some behavior based on
 # previous state (BehaviorBlargh is also a state machine :P)
+# If it's given the path of a world blackboard (see world/blackboard.py), it
+# reads the newest world from there every step instead of being sent one
+# (see sample()).
 class BehaviorBlargh(Blargh):
 
-    def __init__(self):
+    def __init__(self, blackboardPath=None):
         # Set up the State Machine.
         self.worldWrapper = WorldWrapper()
         self.stateMachine = StateMachine(DeadState(self.worldWrapper))
+        self.blackboard = None
+        if blackboardPath != None:
+            self.blackboard = WorldBlackboard(blackboardPath)
+
+    # Read the newest world off the blackboard, if we have one.
+    def sample(self):
+        if self.blackboard == None:
+            return None
+        world, stamps = self.blackboard.snapshot()
+        # Nothing to act on until the world's been published
+        if world == None:
+            return None
+        # What we do is only as fresh as the older of the sensor data and the
+        # frame that went into this world, so our output's latency trace
+        # starts there. That way maxAge on the edge to control still throws
+        # away goals based on a stale world.
+        times = [stamps[source] for source in ("input", "vision") if stamps[source] != None]
+        if len(times) > 0:
+            self.sampledAt = min(times)
+        return world
 
     def step(self, world):
+        if world == None:
+            return None
         # Update the model of the world, then act on it.
         self.worldWrapper.updateWorld(world)
         self.stateMachine.step(self.worldWrapper)
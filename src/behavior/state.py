@@ -111,7 +111,7 @@ class BallAcquisitionState(State):
         # Create and keep track of our state machine
         self.stateMachine = StateMachine(SeekBallState(worldWrapper))
         # Keep track of time for a timeout
-        self.lastTime = time.time()
+        self.lastTime = worldWrapper.time
 
     def step(self, worldWrapper):
         world = worldWrapper.world
@@ -123,7 +123,7 @@ class BallAcquisitionState(State):
 
 
         # Check for a timeout
-        if time.time() - self.lastTime > self.TIMEOUT:
+        if worldWrapper.time - self.lastTime > self.TIMEOUT:
             return EscapeState(worldWrapper), STATE_CHANGE_FLAG
 
         # Check for having lost all the balls
@@ -137,7 +137,7 @@ class BallAcquisitionState(State):
         self.stateMachine.step(worldWrapper)
         # Update our timer
         if self.stateMachine.state != oldState:
-            self.lastTime = time.time()
+            self.lastTime = worldWrapper.time
 
         # Step the state machine
         self.stateMachine.step(worldWrapper)
@@ -363,7 +363,7 @@ class FollowWallState(State):
                 print "We're turned straight"
                 turned = self.TURNED_STRAIGHT
                 
-            if random.random() < timeEqualizedRandom(self.lastTime, worldWrapper.time, 0.1):
+            #if random.random() < timeEqualizedRandom(self.lastTime, worldWrapper.time, 0.1):
                 #return DriveToWallState(worldWrapper), STATE_CHANGE_FLAG
 
 
@@ -0,0 +1,66 @@
+import sys
+sys.path.append("..")
+
+from arduino.arduino3 import Arduino
+from arduino.emulator import EmulatedRobot
+from arduino.packets import BAUD_RATES
+from blargh.clock import monotonicTime
+
+# Negotiates each baud rate (see Arduino.negotiateBaudRate) with an
+# ArduinoEmulator set up like the robot, then prints the rate we ended up
+# at, the round trips per second, the bytes per second both ways together,
+# and the round trip latency (from writing the command packet to having the
+# sensor packet parsed). The last line asks firmware that can't switch for
+# the default rate, which should leave us at 9600.
+#
+# The emulator runs in its own process. On a machine with one CPU the fast
+# rates end up limited by the two processes taking turns rather than by the
+# link.
+
+# How long to run each for, in seconds
+DURATION = 3.0
+
+# Keeps the round trip time of every cycle
+class TimedArduino(Arduino):
+    def __init__(self, *args):
+        Arduino.__init__(self, *args)
+        self.sentAt = None
+        self.roundTrips = []
+
+    def sendCommands(self):
+        self.sentAt = monotonicTime()
+        Arduino.sendCommands(self)
+
+    def readSensorData(self, timeout=None):
+        got = Arduino.readSensorData(self, timeout)
+        if got:
+            self.roundTrips.append(monotonicTime() - self.sentAt)
+        return got
+
+# Returns the value fraction of the way through sorted values
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+# Returns (rate we ended up at, round trips per second, bytes per second,
+# median and 99th percentile round trip latency in milliseconds)
+def measure(baudrate, changesBaud=True):
+    robot = EmulatedRobot(TimedArduino, baudrate, changesBaud=changesBaud)
+    a = robot.arduino
+    robot.run()
+    before, after = robot.timeRun(DURATION, lambda: (len(a.roundTrips), a.getLinkStats()))
+    first, stats = before[0], after[1]
+    roundTrips = sorted(a.roundTrips[first:])
+    robot.stop()
+    return (a.port.baudrate, stats["cycleRate"],
+            stats["cycleRate"] * (stats["sentPerCycle"] + stats["receivedPerCycle"]),
+            percentile(roundTrips, 0.5) * 1e3, percentile(roundTrips, 0.99) * 1e3)
+
+if __name__ == "__main__":
+    results = []
+    for baudrate in BAUD_RATES:
+        results.append(("%d" % baudrate, measure(baudrate)))
+    results.append(("old firmware", measure(115200, False)))
+    print
+    print "%-14s %8s %10s %10s %10s %10s" % ("asked for", "got", "cycles/s", "bytes/s", "p50 ms", "p99 ms")
+    for name, result in results:
+        print "%-14s %8d %10.1f %10.0f %10.2f %10.2f" % ((name,) + result)
@@ -0,0 +1,111 @@
+import sys
+sys.path.append("..")
+
+import os
+import tempfile
+import time
+from multiprocessing import Process, Value
+
+from blargh.clock import monotonicTime
+from blargh.edges import createEdge, MAILBOX_EDGE
+from world.blackboard import WorldBlackboard
+from codec_benchmark import makeMessages
+
+# Compares publishing the World on a world blackboard (see
+# world/blackboard.py) against sending it down a mailbox edge, which is how
+# world and behavior talked before. Prints how long the producer spends per
+# World and how long a reader spends per copy, then how the producer does
+# with more and more readers reading as fast as they can at the same time.
+# Readers never make the producer wait, but on a machine with fewer CPUs
+# than processes they still take turns with it for CPU time. Publishing back
+# to back like that is the worst case for readers too, so last of all it
+# shows how often they have to retry with the producer publishing at
+# PUBLISH_RATE, which is as often as WorldBlargh ever does.
+
+ITERATIONS = 20000
+READER_COUNTS = [0, 1, 2, 4]
+# WorldBlargh's rate, and it only publishes when something new came in
+PUBLISH_RATE = 100
+# How long to publish at PUBLISH_RATE for, in seconds
+PUBLISH_DURATION = 2.0
+
+# Returns the average time in microseconds per call of fn()
+def timeIt(fn):
+    start = monotonicTime()
+    for i in xrange(ITERATIONS):
+        fn()
+    return (monotonicTime() - start) / ITERATIONS * 1e6
+
+# Reads the blackboard at path over and over until stop is set, counting
+# the reads and the retries
+def reader(path, stop, reads, retries):
+    blackboard = WorldBlackboard(path)
+    count = 0
+    while not stop.value:
+        blackboard.snapshot()
+        count += 1
+    reads.value = count
+    retries.value = blackboard.blackboard.retries
+
+# Starts numReaders readers on the blackboard at path. Returns a function
+# that stops them and returns the total reads and retries.
+def startReaders(path, numReaders):
+    stop = Value("b", False)
+    counters = [(Value("l", 0), Value("l", 0)) for i in range(numReaders)]
+    readers = [Process(target=reader, args=(path, stop, reads, retries)) for reads, retries in counters]
+    for proc in readers:
+        proc.start()
+    def stopReaders():
+        stop.value = True
+        for proc in readers:
+            proc.join()
+        return (sum([reads.value for reads, retries in counters]),
+                sum([retries.value for reads, retries in counters]))
+    return stopReaders
+
+# Publishes world on writer PUBLISH_RATE times a second for PUBLISH_DURATION
+def publishAtRate(writer, world):
+    start = monotonicTime()
+    for i in xrange(int(PUBLISH_RATE * PUBLISH_DURATION)):
+        delay = start + float(i) / PUBLISH_RATE - monotonicTime()
+        if delay > 0:
+            time.sleep(delay)
+        writer.publish(world)
+
+if __name__ == "__main__":
+    world = dict(makeMessages())["World"]
+    path = os.path.join(tempfile.gettempdir(), "blargh-benchmark-world")
+    writer = WorldBlackboard(path, create=True)
+    readerBoard = WorldBlackboard(path)
+    mailboxIn, mailboxOut = createEdge(MAILBOX_EDGE)
+    mailboxOut.send(world)
+
+    print "%-12s %12s %12s" % ("", "write us", "read us")
+    print "%-12s %12.2f %12.2f" % ("blackboard", timeIt(lambda: writer.publish(world)),
+        timeIt(readerBoard.snapshot))
+    def mailboxRoundTrip():
+        mailboxOut.send(world)
+        mailboxIn.recv()
+    sendTime = timeIt(lambda: mailboxOut.send(world))
+    print "%-12s %12.2f %12.2f" % ("mailbox", sendTime, timeIt(mailboxRoundTrip) - sendTime)
+    print
+
+    print "%-8s %12s %12s %12s" % ("readers", "write us", "reads/s", "retries")
+    for numReaders in READER_COUNTS:
+        stopReaders = startReaders(path, numReaders)
+        start = monotonicTime()
+        writeTime = timeIt(lambda: writer.publish(world))
+        elapsed = monotonicTime() - start
+        reads, retries = stopReaders()
+        print "%-8d %12.2f %12d %12d" % (numReaders, writeTime, reads / elapsed, retries)
+    print
+
+    print "Publishing %d times a second" % PUBLISH_RATE
+    print "%-8s %12s %12s %16s" % ("readers", "reads/s", "retries", "retries/1k reads")
+    for numReaders in READER_COUNTS[1:]:
+        stopReaders = startReaders(path, numReaders)
+        publishAtRate(writer, world)
+        reads, retries = stopReaders()
+        print "%-8d %12d %12d %16.3f" % (numReaders, reads / PUBLISH_DURATION, retries,
+            retries * 1000.0 / max(reads, 1))
+    os.remove(path)
@@ -0,0 +1,75 @@
+import sys
+sys.path.append("..")
+
+import cPickle
+import time
+
+from blargh import codec
+from world import World, WorldBlargh
+from input import BumpSensorData, IRData
+
+# Compares the blargh message codec against pickling, for each of the
+# message types that actually get sent between blargh processes. Prints the
+# size of each encoded message and how long it takes to encode and decode.
+
+ITERATIONS = 20000
+# How many runs each time is the best of
+REPEATS = 5
+
+def makeMessages():
+    bumpData = BumpSensorData()
+    bumpData.left = False
+    bumpData.right = True
+    bumpData.front = False
+    irData = IRData()
+    irData.leftFront = 14.2
+    irData.leftSide = 9.7
+    balls = [(24.5, 0.31), (40.1, -0.2), (61.0, 0.05)]
+
+    world = World()
+    world.updateBalls(balls)
+    world.updateYellowTheta(0.4)
+    world.updateBumpData(bumpData)
+    world.updateIRData(irData)
+
+    return [("World", world),
+            ("Input", (WorldBlargh.INPUT, (bumpData, irData))),
+            ("Vision", (WorldBlargh.VISION, (balls, 0.4))),
+            ("Goal", (12.0, 0.3)),
+            ("Flag", 0)]
+
+# Returns the average time in microseconds per call of fn(arg) for each of
+# calls, a list of (fn, arg). Each one's time is the fastest of REPEATS runs,
+# and the runs of each are interleaved, so whatever else is running on the
+# machine doesn't decide which format looks faster.
+def timeAll(calls):
+    best = [None] * len(calls)
+    for j in range(REPEATS):
+        for k in range(len(calls)):
+            fn, arg = calls[k]
+            start = time.time()
+            for i in xrange(ITERATIONS):
+                fn(arg)
+            elapsed = time.time() - start
+            if best[k] == None or elapsed < best[k]:
+                best[k] = elapsed
+    return [elapsed / ITERATIONS * 1e6 for elapsed in best]
+
+def pickler(protocol):
+    return lambda obj: cPickle.dumps(obj, protocol)
+
+if __name__ == "__main__":
+    formats = [("pickle 0", pickler(0), cPickle.loads),
+               ("pickle 2", pickler(2), cPickle.loads),
+               ("codec", codec.encode, codec.decode)]
+    print "%-8s %-10s %8s %12s %12s" % ("message", "format", "bytes", "encode us", "decode us")
+    for name, message in makeMessages():
+        calls = []
+        for formatName, encode, decode in formats:
+            calls.append((encode, message))
+            calls.append((decode, encode(message)))
+        times = timeAll(calls)
+        for k in range(len(formats)):
+            formatName, encode, decode = formats[k]
+            print "%-8s %-10s %8d %12.2f %12.2f" % (name, formatName, len(encode(message)),
+                times[2 * k], times[2 * k + 1])
@@ -0,0 +1,68 @@
+import sys
+sys.path.append("..")
+
+import math
+import threading
+import time
+
+from arduino.arduino3 import Servo
+from arduino.emulator import EmulatedRobot
+
+# Compares sending the whole command packet every cycle against delta mode
+# (see Arduino and CommandPacket), against an ArduinoEmulator set up like the
+# robot plus a servo, at 9600 baud. Prints the round trips per second and
+# the bytes each way per round trip, with nothing changing, and with the
+# drive motors getting new speeds CONTROL_RATE times a second like they do
+# from ControlBlargh. Then checks the emulator ended up with the same
+# actuator values as we set.
+
+BAUD_RATE = 9600
+# How often the drive motors change, per second
+CONTROL_RATE = 20
+# How long to run each for, in seconds
+DURATION = 3.0
+
+# Sets new speeds on the drive motors CONTROL_RATE times a second until stop
+# is set
+def control(motors, stop):
+    t = 0
+    while not stop.isSet():
+        speed = int(100 * math.sin(t / 10.0))
+        motors[0].setVal(speed)
+        motors[1].setVal(-speed)
+        t += 1
+        time.sleep(1.0 / CONTROL_RATE)
+
+# Returns the link stats (see Arduino.getLinkStats), and whether the emulator
+# agreed with us about the actuators at the end
+def measure(deltaMode, controlling):
+    robot = EmulatedRobot(deltaMode=deltaMode, emulatorBaudrate=BAUD_RATE)
+    a, motors = robot.arduino, robot.motors
+    servo = Servo(a, 9)
+    robot.run()
+    motors[2].setVal(30)
+    servo.setAngle(90)
+    stop = threading.Event()
+    if controlling:
+        controller = threading.Thread(target=control, args=(motors, stop))
+        controller.start()
+    before, stats = robot.timeRun(DURATION, a.getLinkStats)
+    stop.set()
+    if controlling:
+        controller.join()
+    # Give the last change time to get there
+    time.sleep(0.2)
+    motorSpeeds, servoAngles = robot.stop()
+    # The firmware reads speeds as signed chars
+    expected = [speed - 256 if speed > 127 else speed for speed in a.motorSpeeds]
+    agrees = motorSpeeds == expected and servoAngles == a.servoAngles
+    return stats, agrees
+
+if __name__ == "__main__":
+    print "%-8s %-12s %10s %10s %10s %8s" % ("mode", "load", "cycles/s", "sent/cyc", "recv/cyc", "agrees")
+    for controlling in [False, True]:
+        for deltaMode in [False, True]:
+            stats, agrees = measure(deltaMode, controlling)
+            print "%-8s %-12s %10.1f %10.1f %10.1f %8s" % (["full", "delta"][deltaMode],
+                ["idle", "%d Hz" % CONTROL_RATE][controlling], stats["cycleRate"],
+                stats["sentPerCycle"], stats["receivedPerCycle"], agrees)
@@ -0,0 +1,67 @@
+import sys
+sys.path.append("..")
+
+import time
+
+from blargh import Blargh
+from blargh import cpu
+from blargh.blargh_process import BlarghProcessStarter, startAllBlarghProcesses, killAllBlarghProcesses
+
+# Measures how steadily a control loop ticks while other blargh processes
+# are hogging the CPU, the way vision does on the robot. It runs once with
+# every process left wherever the kernel puts it, and once with the hogs
+# pinned to the first CPU at a high niceness and the control loop pinned to
+# the last CPU at a low one. Negative niceness needs root, so run it as root
+# to see the whole effect.
+
+# How fast the control loop ticks, in Hz
+CONTROL_RATE = 100
+# How many processes hog the CPU
+NUM_HOGS = 2
+# How long each run lasts, in seconds
+DURATION = 5.0
+
+# Settings for the pinned run
+HOG_NICENESS = 10
+CONTROL_NICENESS = -5
+
+# Busy work, like processing a camera frame
+class HogBlargh(Blargh):
+    def step(self, inp):
+        total = 0
+        for i in xrange(20000):
+            total += i * i
+        return None
+
+# Does almost nothing, all that matters is when its ticks run
+class ControlLoopBlargh(Blargh):
+    def step(self, inp):
+        return None
+
+# Run the control loop next to the hogs and return its stats
+def run(hogCpus, hogNiceness, controlCpus, controlNiceness):
+    starters = [BlarghProcessStarter(HogBlargh, [], True, cpus=hogCpus, niceness=hogNiceness)
+                for i in range(NUM_HOGS)]
+    control = BlarghProcessStarter(ControlLoopBlargh, [], True, rate=CONTROL_RATE,
+                                   cpus=controlCpus, niceness=controlNiceness)
+    starters.append(control)
+    blarghMasters = startAllBlarghProcesses(starters)
+    time.sleep(DURATION)
+    stats = control.master.stats()
+    killAllBlarghProcesses(blarghMasters)
+    return stats
+
+def printRun(label, stats):
+    schedule = stats["schedule"]
+    print "%-10s %6d ticks %6d overruns  mean lateness %7.3fms  jitter %7.3fms  worst %7.3fms" % (label,
+        schedule["ticks"], schedule["overruns"], schedule["meanLateness"] * 1000,
+        schedule["jitter"] * 1000, schedule["worstLateness"] * 1000)
+
+if __name__ == "__main__":
+    lastCpu = cpu.cpuCount() - 1
+    results = [("unpinned", run(None, None, None, None)),
+               ("pinned", run([0], HOG_NICENESS, [lastCpu], CONTROL_NICENESS))]
+    print
+    print "%d hogs, control loop at %d Hz on %d cpus" % (NUM_HOGS, CONTROL_RATE, lastCpu + 1)
+    for label, stats in results:
+        printRun(label, stats)
@@ -0,0 +1,72 @@
+import sys
+sys.path.append("..")
+
+import os
+import time
+
+from arduino.arduino3 import Arduino, serialRead
+from arduino.emulator import EmulatedRobot, ROBOT_DIGITAL
+
+# Compares how much CPU time Arduino spends per sensor packet reading them
+# with SensorPacketParser (see arduino/packets.py) against reading them a
+# byte at a time with serialRead() and no read timeout, which is how it used
+# to work. Runs against an ArduinoEmulator (in its own process, so its CPU
+# time isn't counted) set up like the robot, switched to each baud rate.
+
+BAUD_RATES = [9600, 115200]
+# How long to run each reader for, in seconds
+DURATION = 3.0
+
+# The old way of reading sensor packets
+class PerByteArduino(Arduino):
+    def connect(self):
+        opened = Arduino.connect(self)
+        if opened:
+            self.port.timeout = 0
+        return opened
+
+    # (The old way had no timeout, timeout is only here to match)
+    def readSensorData(self, timeout=None):
+        done = False
+        while (not done):
+            type = serialRead(self.port)
+            if (type == 'D'):
+                length = ord(serialRead(self.port))-1
+                for i in range(length):
+                    self.digitalSensors[i] = ord(serialRead(self.port))==2
+            elif (type == 'A'):
+                length = ord(serialRead(self.port))-1
+                for i in range(length):
+                    byte0 = ord(serialRead(self.port))-1
+                    byte1 = ord(serialRead(self.port))-1
+                    self.analogSensors[i] = byte1 * 256 + byte0
+            elif (type == ';'):
+                done = True
+        return True
+
+# Like the robot, but with port 2 changing every packet
+DIGITAL = dict(ROBOT_DIGITAL)
+DIGITAL[2] = [0, 1]
+
+# Returns the CPU time this process has used, in seconds
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+# Returns (cycles per second, CPU microseconds per cycle) for an arduino
+# class talking to an emulator at baudrate
+def measure(arduinoClass, baudrate):
+    robot = EmulatedRobot(arduinoClass, baudrate, digital=DIGITAL)
+    a = robot.arduino
+    robot.run()
+    before, after = robot.timeRun(DURATION, lambda: (a.cycles, cpuTime(), time.time()))
+    cycles, cpu, elapsed = [after[i] - before[i] for i in range(3)]
+    robot.stop()
+    return cycles / elapsed, cpu / max(cycles, 1) * 1e6
+
+if __name__ == "__main__":
+    print "%-8s %-12s %12s %12s" % ("baud", "reader", "packets/s", "CPU us/pkt")
+    for baudrate in BAUD_RATES:
+        for name, arduinoClass in [("per byte", PerByteArduino), ("parser", Arduino)]:
+            rate, cpu = measure(arduinoClass, baudrate)
+            print "%-8d %-12s %12.1f %12.1f" % (baudrate, name, rate, cpu)
@@ -2,6 +2,21 @@
 # designed to be able to chain together so that they can start with some input
 # and have it cascade through all of them to have some final processed output.
 class Blargh():
+    # Blarghs with no inputs start a new latency trace (see tracing.py) every
+    # step. If what a step worked on was really sampled earlier (like a world
+    # read off a blackboard), the blargh can set this to when, as a monotonic
+    # time, and the trace starts from then instead of from the step.
+    sampledAt = None
+
+    # Blarghs that read their input from somewhere other than their edges
+    # (like a world blackboard) should do the reading here instead of in
+    # step(). It gets called before every step that has no input, and
+    # whatever it returns (unless it's None) is passed to step() and goes on
+    # the tape in place of the tick, so replaying the tape (see tape.py) feeds
+    # step() the same thing again.
+    def sample(self):
+        return None
+
     # step() gets called by whatever is running the Blargh
     # Subclasses should override this to do whatever needs to be done
     # each step
@@ -9,6 +24,12 @@ class Blargh():
         # If this is not overriden we should raise an exception
         raise NotImplementedError
 
+# A list of inputs handed to step() all at once, for blarghs run with the
+# FAN_IN_BATCH policy (see blargh_process.py). It's its own type so that a
+# blargh can tell a batch apart from an input that happens to be a list.
+class Batch(list):
+    pass
+
 # A Blargh that actually contains two blarghs cascaded together.
 class CascadeBlargh(Blargh):
     def __init__(self, b1, b2):
@@ -16,6 +37,12 @@ class CascadeBlargh(Blargh):
         self.b1 = b1
         self.b2 = b2
 
+    # The first Blargh is the one that gets to sample
+    def sample(self):
+        inp = self.b1.sample()
+        self.sampledAt = self.b1.sampledAt
+        return inp
+
     def step(self, inp):
         # Cascade the input through the two Blarghs
         out1 = self.b1.step(inp)
@@ -0,0 +1,95 @@
+import ctypes
+import mmap
+import os
+import struct
+import tempfile
+from exceptions import ValueError
+
+# A blackboard is a block of shared memory that one writer publishes fixed
+# layout records into, and any number of readers take copies of whenever
+# they like. Unlike an edge, nothing is queued and nobody waits: the writer
+# just overwrites the record, and a reader always gets the newest one.
+# Readers never make the writer wait, and there can be as many as we want
+# (though with fewer CPUs than processes, they still share CPU time with it).
+#
+# It's backed by a file in /dev/shm that gets mmapped by everyone, so any
+# process can open it by its path, even ones that weren't started by the
+# master (like a debug viewer). Reading and writing are plain memory copies,
+# the kernel isn't involved at all.
+#
+# Readers get consistent copies using a seqlock: a sequence number in front
+# of the record that the writer makes odd before it starts writing and even
+# again once it's done. A reader copies the record out, and if the sequence
+# number was odd, or changed while it was copying, it tries again. This
+# relies on x86 keeping stores in order and loads in order, which is what
+# every robot we run on has. It also needs the sequence number stored and
+# loaded in one go, so it goes through a ctypes integer laid over the memory
+# rather than struct, which copies it a byte at a time (so a reader could
+# see it half way from one number to the next).
+#
+#   Offset 0: the sequence number ("<Q")
+#   Offset 8: the record
+
+SEQUENCE = struct.Struct("<Q")
+# Where blackboards go by default. /dev/shm is in memory, so nothing ever
+# gets written to disk.
+DEFAULT_DIRECTORY = "/dev/shm"
+# How many times a reader tries for a consistent copy before giving up. The
+# writer only ever holds the sequence odd for a few microseconds, so running
+# out means it died halfway through a write.
+MAX_READ_TRIES = 1000
+
+# Returns where the blackboard called name goes
+def blackboardPath(name):
+    directory = DEFAULT_DIRECTORY
+    if not os.path.isdir(directory):
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, "blargh-%s" % name)
+
+class Blackboard():
+    # Open the blackboard at path for records of size bytes. The writer
+    # should create it (before any readers start), which also clears it.
+    def __init__(self, path, size, create=False):
+        self.path = path
+        self.size = size
+        if create:
+            f = open(path, "w+b")
+            f.truncate(SEQUENCE.size + size)
+        else:
+            f = open(path, "r+b")
+        self.memory = mmap.mmap(f.fileno(), SEQUENCE.size + size)
+        f.close()
+        self.sequenceValue = ctypes.c_uint64.from_buffer(self.memory)
+        # Only the writer uses this, the sequence number it last wrote
+        self.sequence = self.sequenceValue.value
+        # How many times readers had to try again because of a write
+        self.retries = 0
+
+    # Publish a new record (a string of exactly size bytes)
+    def write(self, record):
+        if len(record) != self.size:
+            print "Blackboard record is", len(record), "bytes, not", self.size
+            raise ValueError
+        self.sequence += 1
+        self.sequenceValue.value = self.sequence
+        self.memory[SEQUENCE.size:] = record
+        self.sequence += 1
+        self.sequenceValue.value = self.sequence
+
+    # Returns a consistent copy of the newest record and its sequence number
+    # (0 means nothing has been published yet), or (None, None) if the writer
+    # died halfway through a write
+    def read(self):
+        for i in xrange(MAX_READ_TRIES):
+            before = self.sequenceValue.value
+            if before % 2 == 0:
+                record = self.memory[SEQUENCE.size:]
+                if self.sequenceValue.value == before:
+                    return record, before / 2
+            self.retries += 1
+        return None, None
+
+    def close(self):
+        # The memory can't be touched through sequenceValue once it's closed
+        self.sequenceValue = None
+        self.memory.close()
@@ -1,110 +1,716 @@
-from exceptions import ValueError
+from exceptions import EOFError, ValueError
 from multiprocessing import Process, Pipe
-import time
+import random
+import signal
+import threading
+
+from blargh import Blargh, CascadeBlargh, Batch
+from clock import monotonicTime, threadCpuTime
+import cpu
+from edges import createEdge, PIPE_EDGE, RING_EDGE, MAILBOX_EDGE, LOCAL_EDGE
+from overload import OverloadMonitor, OverloadSupervisor, MIN_THROTTLED_RATE
+from profiling import startProfile, stopProfile
+from sampling import startSampling, stopSampling, selectInterruptible
+from scheduler import TickScheduler
+from stats import BlarghStats, printStats, saveStats
+from tape import openTape, TICK_EDGE
+from tracing import LatencyTracker, addHop
 
 # Function that wraps a Blargh and is run in its own process. It keeps track
 # of the input pipes and output pipes to interface with other blargh processes.
+# If rate (in Hz) is given for an async blargh, it gets stepped at that rate
+# instead of as fast as possible. name is what the blargh is called in its
+# stats (the name of BlarghClass by default). If barrier is True, once the
+# blargh is initialized the process tells the master it's "READY" and then
+# waits for a "GO" before it starts stepping (see startAllBlarghProcesses).
+# fanIn is how messages from more than one inPipe get turned into steps, one
+# of the fan in policies below. budget is how long (in seconds) a step should
+# take, see overload.py for what happens when steps take longer. Going in and
+# out of degraded mode gets reported on eventConn. If seed is given, the
+# random module gets seeded with it before the blargh is created, so that
+# blarghs that use random numbers do the same thing every run.
+
+def blarghProcess(BlarghClass, args, masterConn, inPipes, outPipes, async, rate=None, name=None, barrier=False, fanIn=None,
+                  budget=None, eventConn=None, seed=None):
+    if fanIn == None:
+        fanIn = FAN_IN_ORDER
+    if fanIn not in FAN_IN_POLICIES:
+        print "Unknown fan in policy", fanIn
+        raise ValueError
 
-def blarghProcess(BlarghClass, args, masterConn, inPipes, outPipes, async):
+    if name == None:
+        name = BlarghClass.__name__
+    # Sample where the CPU time goes, if sampling is turned on (see
+    # sampling.py). This starts before the blargh is created, so that slow
+    # initialization shows up too.
+    startSampling(name)
 
     # Initialize the blargh
+    if seed != None:
+        random.seed(seed)
+    initStart = monotonicTime()
     blargh = BlarghClass(*args)
 
-    # Send out an output to all the outPipes
-    def sendOut(output):
-        for pipe in outPipes:
-            pipe.send(output)
-        for pipe in outPipes:
-            pipe.recv()
-
-    # Main polling loop
-    while True:
-        inp = None
-        # Poll the master pipe
-        if (masterConn.poll()):
-            # If there was something, receive it
-            cmd, arg = masterConn.recv()
-            # Process the command
-            if (cmd == "KILL"):
-                print "Blargh", blargh, "dying!"
-                return 0
+    # Performance counters that the master can ask for with "STATS"
+    stats = BlarghStats(name, inPipes, outPipes)
+    # Where to record everything we receive, if recording is turned on
+    tape = openTape(name, inPipes)
+    # Latencies of the data passing through us (see tracing.py). If we have
+    # no outputs we're the end of the line, so we keep the full breakdown.
+    latency = LatencyTracker(len(outPipes) == 0)
+    # Don't let a consumer that has stopped taking messages (like one that
+    # was just killed) keep us from hearing from the master
+    for pipe in outPipes:
+        pipe.wakeOn = masterConn
+    # Keeps an eye on our step times, if we have a budget
+    overload = None
+    if budget != None:
+        overload = OverloadMonitor(budget)
+
+    # Wait for everything else to be ready too before any data starts flowing
+    if barrier:
+        masterConn.send(("READY", (monotonicTime(), monotonicTime() - initStart)))
+        cmd, arg = masterConn.recv()
+        if (cmd == "KILL"):
+            print "Blargh", blargh, "killed before it got going"
+            if tape != None:
+                tape.close()
+            stopSampling()
+            return 0
+        elif (cmd != "GO"):
+            print cmd, arg
+            raise ValueError
+
+    # Step the blargh, keeping track of how long it took. Returns the output
+    # and the latency trace that goes along with it. source is where inp came
+    # from, for the tape: the index of the inPipe it came in on, a list of
+    # them for a Batch, TICK_EDGE for a scheduled tick, or None to leave the
+    # step off the tape. With no input, the blargh gets to sample its own
+    # (see Blargh.sample), and that always goes on the tape, so that the step
+    # can be replayed.
+    def step(inp, trace, source=None):
+        sampleTime = 0
+        sampled = False
+        if inp == None:
+            sampleStart = monotonicTime()
+            inp = blargh.sample()
+            sampleTime = monotonicTime() - sampleStart
+            sampled = inp != None
+        if tape != None and sampled:
+            tape.recordSample(inp)
+        elif tape != None and source != None:
+            if source == TICK_EDGE:
+                tape.recordTick()
+            elif isinstance(inp, Batch):
+                tape.recordBatch(source, inp)
             else:
-                print cmd, arg
-                raise ValueError
-        # Poll all the other inPipes
-        for pipe in inPipes:
-            if (pipe.poll()):
-                # If there's something waiting, receive it
-                inp = pipe.recv()
-                # Tell the other end of the pipe we got it
-                pipe.send("RECVD")
-                sendOut(blargh.step(inp))
-
-        # If there was no input, step with no input if we're running
-        # async, otherwise don't step at all
-        if (inp == None and async):
-            sendOut(blargh.step(None))
+                tape.recordMessage(source, inp)
+        # Reading the sample counts as part of the step
+        stepStart = monotonicTime() - sampleTime
+        output = blargh.step(inp)
+        stepEnd = monotonicTime()
+        stats.recordStep(stepEnd - stepStart)
+        if overload != None:
+            degraded = overload.recordStep(stepEnd - stepStart, stepEnd)
+            if degraded != None:
+                if degraded:
+                    print "Blargh %s is over its %.2fms budget (%.2fms per step), shedding load" % (name,
+                        budget * 1000, overload.meanStepTime * 1000)
+                else:
+                    print "Blargh %s is back under its %.2fms budget (%.2fms per step)" % (name,
+                        budget * 1000, overload.meanStepTime * 1000)
+                if eventConn != None:
+                    eventConn.send(("OVERLOAD", degraded))
+
+        # The output carries on the input's trace. With no input, it's based
+        # on the newest thing we've received, or if we never receive
+        # anything, on whatever we just sampled (see Blargh.sampledAt).
+        outTrace = trace
+        if outTrace == None:
+            outTrace = latency.latestTrace
+        if outTrace == None and len(inPipes) == 0:
+            origin = blargh.sampledAt
+            if origin == None:
+                origin = stepStart
+            outTrace = (origin, ())
+        if outTrace != None:
+            outTrace = addHop(outTrace, name, stepStart, stepEnd)
+            if trace != None and latency.isSink:
+                latency.recordComplete(outTrace)
+        return output, outTrace
+
+    # Send out an output (and its trace) to all the outPipes. Sending only
+    # blocks if an edge's consumer has fallen too far behind, and the time
+    # spent blocked is kept by the edge itself (see edges.py).
+    def sendOut(output, trace):
+        for i in range(len(outPipes)):
+            sendStart = threadCpuTime()
+            outPipes[i].send(output, trace)
+            stats.sendCpuTimes[i] += threadCpuTime() - sendStart
+            stats.messagesOut[i] += 1
+        for i in range(len(outPipes)):
+            ackStart = threadCpuTime()
+            outPipes[i].waitAck()
+            stats.sendCpuTimes[i] += threadCpuTime() - ackStart
+
+    # Step with no input, sending out whatever comes of it unless it's None
+    def idleStep(source=None):
+        output, trace = step(None, None, source)
+        if output != None:
+            sendOut(output, trace)
+
+    # Receive a message from inPipes[i] and keep track of it. Returns the
+    # message and its trace.
+    def receive(i):
+        recvStart = threadCpuTime()
+        inp, trace = inPipes[i].recv()
+        stats.recvCpuTimes[i] += threadCpuTime() - recvStart
+        receivedAt = monotonicTime()
+        stats.messagesIn[i] += 1
+        if trace != None:
+            latency.recordInput(trace, receivedAt)
+            latency.latestTrace = trace
+            # The last hop is the blargh that sent it
+            origin, hops = trace
+            if len(hops) > 0:
+                stats.transit[i].add(receivedAt - hops[-1][2])
+        return inp, trace
+
+    # Receive everything waiting on all the inPipes (up to MAX_DRAIN from
+    # each, so a producer that's faster than us can't keep us here forever).
+    # Returns a Batch of the messages, the trace of the newest one, and which
+    # inPipe each message came in on.
+    def receiveBatch():
+        batch = Batch()
+        batchTrace = None
+        sources = []
+        for i in range(len(inPipes)):
+            for j in range(MAX_DRAIN):
+                if not inPipes[i].poll():
+                    break
+                inp, trace = receive(i)
+                batch.append(inp)
+                sources.append(i)
+                if trace != None:
+                    batchTrace = trace
+        return batch, batchTrace, sources
+
+    # Async blarghs with a rate get their steps from a scheduler
+    startTime = monotonicTime()
+    scheduler = None
+    if async and rate != None:
+        scheduler = TickScheduler(rate)
+        scheduler.start(startTime)
+
+    # Everything that can wake us up: the master pipe and all the inPipes.
+    # Batches with a scheduler only get taken on a tick, so new messages
+    # don't need to wake us up. Joins only need to wake up for the inPipes
+    # that don't have anything waiting yet.
+    def getWaitables():
+        if fanIn == FAN_IN_BATCH and scheduler != None:
+            return [masterConn]
+        if fanIn == FAN_IN_JOIN:
+            return [masterConn] + [pipe for pipe in inPipes if not pipe.poll()]
+        return [masterConn] + inPipes
+    waitables = getWaitables()
+    # Which inPipe gets looked at first (this only moves for FAN_IN_ROUND_ROBIN)
+    firstPipe = 0
+    # Profile the main loop, if profiling is turned on (see profiling.py)
+    profiler = startProfile()
+
+    # Main loop. However it ends (a KILL from the master, a Ctrl-C, which
+    # every process in the group gets, or a SIGTERM), the stats, the tape,
+    # the profile and the samples all get written out.
+    if isinstance(threading.current_thread(), threading._MainThread):
+        signal.signal(signal.SIGTERM, interruptOnTerm)
+    try:
+        while True:
+            stepped = False
+            # Sleep until one of our pipes has something for us or it's time for
+            # the next tick. Async blarghs without a rate are always due for
+            # another step so they never sleep.
+            if not async:
+                timeout = None
+            elif scheduler != None:
+                timeout = scheduler.timeUntilTick(monotonicTime())
+            else:
+                timeout = 0
+            if fanIn == FAN_IN_JOIN:
+                waitables = getWaitables()
+                # Every inPipe already has something, so don't wait for any more
+                if len(inPipes) > 0 and len(waitables) == 1:
+                    timeout = 0
+            if timeout != 0:
+                waitStart = monotonicTime()
+                selectInterruptible(waitables, timeout)
+                stats.idleTime += monotonicTime() - waitStart
+
+            # Poll the master pipe
+            if (masterConn.poll()):
+                # If there was something, receive it
+                cmd, arg = masterConn.recv()
+                # Process the command
+                if (cmd == "KILL"):
+                    print "Blargh", blargh, "dying!"
+                    return 0
+                elif (cmd == "STATS"):
+                    masterConn.send(stats.snapshot(monotonicTime() - startTime, scheduler, latency, overload))
+                elif (cmd == "TRACES"):
+                    masterConn.send(latency.slowestTraces())
+                elif (cmd == "RATE"):
+                    # Something downstream is overloaded (or not any more), so
+                    # step at arg times our usual rate. Blarghs that usually go as
+                    # fast as they can get a scheduler while they're slowed down.
+                    if rate != None and scheduler != None:
+                        scheduler.setRate(rate * arg)
+                    elif async and arg < 1.0:
+                        uptime = monotonicTime() - startTime
+                        scheduler = TickScheduler(max(MIN_THROTTLED_RATE, stats.steps / uptime * arg))
+                        scheduler.start(monotonicTime())
+                    elif async:
+                        scheduler = None
+                    waitables = getWaitables()
+                else:
+                    print cmd, arg
+                    raise ValueError
+            # Poll all the other inPipes, and step on what's there the way the
+            # fan in policy says to. While degraded, only the newest messages
+            # get stepped on.
+            policy = fanIn
+            if overload != None and overload.degraded and fanIn != FAN_IN_BATCH and fanIn != FAN_IN_JOIN:
+                policy = FAN_IN_LATEST
+            if policy == FAN_IN_ORDER or policy == FAN_IN_ROUND_ROBIN:
+                # One message from each inPipe that has something waiting
+                for j in range(len(inPipes)):
+                    i = (firstPipe + j) % len(inPipes)
+                    if (inPipes[i].poll()):
+                        inp, trace = receive(i)
+                        sendOut(*step(inp, trace, i))
+                        stepped = True
+                if policy == FAN_IN_ROUND_ROBIN and len(inPipes) > 0:
+                    firstPipe = (firstPipe + 1) % len(inPipes)
+            elif policy == FAN_IN_LATEST:
+                # Only the newest message from each inPipe, the rest are skipped
+                for i in range(len(inPipes)):
+                    latest = None
+                    for j in range(MAX_DRAIN):
+                        if not inPipes[i].poll():
+                            break
+                        if latest != None and policy == fanIn:
+                            stats.coalesced += 1
+                        elif latest != None:
+                            stats.shed += 1
+                        latest = receive(i)
+                    if latest != None:
+                        inp, trace = latest
+                        sendOut(*step(inp, trace, i))
+                        stepped = True
+            elif policy == FAN_IN_JOIN:
+                # One message from every inPipe, all in one step, once every
+                # inPipe has one
+                if len(inPipes) > 0 and len([pipe for pipe in inPipes if not pipe.poll()]) == 0:
+                    batch = Batch()
+                    batchTrace = None
+                    for i in range(len(inPipes)):
+                        inp, trace = receive(i)
+                        batch.append(inp)
+                        if trace != None:
+                            batchTrace = trace
+                    sendOut(*step(batch, batchTrace, range(len(inPipes))))
+                    stepped = True
+            elif policy == FAN_IN_BATCH and scheduler == None:
+                # Everything waiting, all in one step
+                batch, batchTrace, sources = receiveBatch()
+                if len(batch) > 0:
+                    stats.coalesced += len(batch) - 1
+                    sendOut(*step(batch, batchTrace, sources))
+                    stepped = True
+
+            # Async blarghs with a rate step whenever a tick is due, with a batch
+            # of everything that came in since the last tick if their fan in
+            # policy is FAN_IN_BATCH, and no input otherwise. Otherwise, if there
+            # was no input, step with no input if we're running async, otherwise
+            # don't step at all. A step with no input that comes up with nothing
+            # (None) doesn't send anything, so it can't bury the last real output
+            # under a mailbox edge, or wake everything downstream for nothing.
+            if scheduler != None:
+                now = monotonicTime()
+                if scheduler.isDue(now):
+                    scheduler.tick(now)
+                    batch = []
+                    if fanIn == FAN_IN_BATCH:
+                        batch, batchTrace, sources = receiveBatch()
+                    if len(batch) > 0:
+                        stats.coalesced += len(batch) - 1
+                        sendOut(*step(batch, batchTrace, sources))
+                    else:
+                        idleStep(TICK_EDGE)
+            elif (not stepped and async):
+                idleStep()
+    except KeyboardInterrupt:
+        print "Blargh", blargh, "interrupted!"
+        return 0
+    finally:
+        snapshot = stats.snapshot(monotonicTime() - startTime, scheduler, latency, overload)
+        printStats(snapshot)
+        saveStats(snapshot)
+        if tape != None:
+            tape.close()
+        if profiler != None:
+            stopProfile(profiler, name)
+        stopSampling()
+
+# Signal handler that makes a SIGTERM (what Process.terminate sends) stop a
+# blargh process the same way a Ctrl-C does
+def interruptOnTerm(signum, frame):
+    raise KeyboardInterrupt
+
+# A chain of blarghs run together in one process, with each one's output fed
+# straight into the next one's step. stages is a list of (BlarghClass, args)
+# pairs, which get created in order inside the process running the chain.
+class FusedBlargh(Blargh):
+    def __init__(self, stages):
+        BlarghClass, args = stages[0]
+        self.cascade = BlarghClass(*args)
+        for BlarghClass, args in stages[1:]:
+            self.cascade = CascadeBlargh(self.cascade, BlarghClass(*args))
+
+    def sample(self):
+        inp = self.cascade.sample()
+        self.sampledAt = self.cascade.sampledAt
+        return inp
+
+    def step(self, inp):
+        return self.cascade.step(inp)
 
 
 # Called from the master process to send the kill signal and join the
 # blargh process
 def killBlarghProcess(blarghMaster):
-    blarghMaster.conn.send(("KILL", None))
+    blarghMaster.command("KILL")
     blarghMaster.proc.join()
 
-# Called from the master process to kill all blargh processes in the list
+# Blarghs in a fused chain share a BlarghMaster, so a list of them can have
+# the same one more than once. This gets rid of the repeats, keeping the order.
+def uniqueBlarghMasters(blarghMasters):
+    unique = []
+    for blarghMaster in blarghMasters:
+        if blarghMaster not in unique:
+            unique.append(blarghMaster)
+    return unique
+
+# Called from the master process to kill all blargh processes in the list.
+# Ones that already stopped on their own (like after a Ctrl-C) just get
+# joined.
 def killAllBlarghProcesses(blarghMasters):
+    blarghMasters = uniqueBlarghMasters(blarghMasters)
     # Send all the KILL's first, then join them all for efficiency
     for blarghMaster in blarghMasters:
+        if not blarghMaster.proc.is_alive():
+            continue
         print "BlarghMaster", blarghMaster, "killing"
-        blarghMaster.conn.send(("KILL", None))
+        try:
+            blarghMaster.command("KILL")
+        except IOError:
+            # It stopped between checking and sending
+            pass
     for blarghMaster in blarghMasters:
         print "BlarghMaster", blarghMaster, "joining"
         blarghMaster.proc.join()
 
+# Start all the BlarghProcessStarters in the list at once, wait until every
+# one of them has initialized its blargh, and only then let them all start
+# stepping. That way slow starters (like vision) don't leave the rest of the
+# pipeline running with holes in it. timeout is how many seconds to wait for
+# everything to be ready (None means forever). Returns the BlarghMasters,
+# with startupTime (seconds from being started to being ready) and initTime
+# (seconds spent creating the blargh) filled in.
+def startAllBlarghProcesses(starters, timeout=None):
+    launchTime = monotonicTime()
+    blarghMasters = uniqueBlarghMasters([bps.start(barrier=True) for bps in starters])
+    # Give up on starting anything if one of them can't get ready
+    def giveUp(blarghMaster, reason):
+        print "BlarghMaster", blarghMaster.name, reason
+        killAllBlarghProcesses([other for other in blarghMasters if other.proc.is_alive()])
+        raise ValueError
+    for blarghMaster in blarghMasters:
+        # Keep an eye out for processes that die while getting ready
+        while not blarghMaster.conn.poll(0.1):
+            if not blarghMaster.proc.is_alive():
+                giveUp(blarghMaster, "died before it was ready")
+            if timeout != None and monotonicTime() - launchTime > timeout:
+                giveUp(blarghMaster, "wasn't ready after %g seconds" % timeout)
+        try:
+            cmd, (readyTime, initTime) = blarghMaster.conn.recv()
+        except EOFError:
+            blarghMaster.proc.join()
+            giveUp(blarghMaster, "died before it was ready")
+        blarghMaster.startupTime = readyTime - launchTime
+        blarghMaster.initTime = initTime
+    for blarghMaster in blarghMasters:
+        blarghMaster.command("GO")
+    # Slow things down upstream of any blargh that falls behind its budget
+    if len([bps for bps in starters if bps.chainHead().budget != None]) > 0:
+        OverloadSupervisor(starters).start()
+    return blarghMasters
+
+# Print out how long each of the BlarghMasters from startAllBlarghProcesses
+# took to get ready
+def printStartupTimes(blarghMasters):
+    for blarghMaster in blarghMasters:
+        print "%-30s ready after %.3fs (%.3fs initializing)" % (blarghMaster.name,
+            blarghMaster.startupTime, blarghMaster.initTime)
+
 # Join all blargh processes
 def joinAllBlarghProcesses(blarghMasters):
     for blarghMaster in blarghMasters:
         blarghMaster.proc.join()
 
+# Ask all the blargh processes in the list for their stats and return them
+# in the same order (leaving out any repeats)
+def getAllBlarghStats(blarghMasters):
+    blarghMasters = uniqueBlarghMasters(blarghMasters)
+    # Send all the requests first so the processes answer in parallel
+    for blarghMaster in blarghMasters:
+        blarghMaster.command("STATS")
+    return [blarghMaster.conn.recv() for blarghMaster in blarghMasters]
+
+# Print out the stats of all the blargh processes in the list
+def printAllBlarghStats(blarghMasters):
+    for stats in getAllBlarghStats(blarghMasters):
+        printStats(stats)
+
+# The ways a BlarghProcessStarter can run its blargh
+# In its own process
+PROCESS_MODE = "PROCESS"
+# In a thread inside the master process, so that it doesn't need a process
+# of its own. Edges between two threaded blarghs don't copy messages at all.
+THREAD_MODE = "THREAD"
+# Inside whatever blargh it gets cascaded from, as a CascadeBlargh. The
+# output of the blargh before it is passed straight into its step. The
+# chain runs with the async and rate settings of the blargh at its head.
+FUSED_MODE = "FUSED"
+
+# The ways a blargh with more than one inPipe can take in its messages
+# Step once for every message, going through the inPipes in order and taking
+# one message from each of them at a time
+FAN_IN_ORDER = "ORDER"
+# The same, but starting from the next inPipe along each time, so the first
+# inPipe doesn't always go first
+FAN_IN_ROUND_ROBIN = "ROUND_ROBIN"
+# Step once for each inPipe with only its newest message, skipping the older
+# ones. Good for blarghs where every message replaces the last one.
+FAN_IN_LATEST = "LATEST"
+# Step once with a Batch (see blargh.py) of every message waiting on every
+# inPipe. Async blarghs with a rate take the batch once per tick. The
+# BlarghClass has to know what to do with a Batch.
+FAN_IN_BATCH = "BATCH"
+# Wait until every inPipe has a message, then step once with a Batch of one
+# message from each of them, in the same order as the inPipes. Nothing gets
+# skipped and the steps don't depend on timing, which is what lock-step mode
+# (see lockstep.py) needs.
+FAN_IN_JOIN = "JOIN"
+FAN_IN_POLICIES = [FAN_IN_ORDER, FAN_IN_ROUND_ROBIN, FAN_IN_LATEST, FAN_IN_BATCH, FAN_IN_JOIN]
+
+# Most messages taken off one inPipe at a time by FAN_IN_LATEST and
+# FAN_IN_BATCH before moving on
+MAX_DRAIN = 100
+
 # Called from the master process to send the correct signals to cascade
 # two blargh processes together. Accepts two BlarghProcessStarters and
-# sets up their inPipes and outPipes so that they are connected
-def cascadeBlarghProcesses(bps1, bps2):
-    inPipe, outPipe = Pipe()
+# sets up their inPipes and outPipes so that they are connected. The edgeType
+# (see edges.py) picks how the two are connected, by default it's whatever
+# edgeType bps1 was created with (or a LOCAL_EDGE if both blarghs run as
+# threads). Any extra options are passed on to the edge, like window (how
+# many messages a pipe edge can have in flight) or capacity (how many bytes
+# a ring buffer or mailbox edge holds) or maxAge (how many seconds old a
+# message can be before it gets thrown away instead of received). If bps2 is
+# in FUSED_MODE there's no edge at all, it just gets added onto the end of
+# bps1.
+def cascadeBlarghProcesses(bps1, bps2, edgeType=None, **edgeOptions):
+    if bps2.mode == FUSED_MODE:
+        bps1.fuse(bps2)
+        return
+    if edgeType == None:
+        if bps1.mode == THREAD_MODE and bps2.mode == THREAD_MODE:
+            edgeType = LOCAL_EDGE
+        else:
+            edgeType = bps1.edgeType
+    inPipe, outPipe = createEdge(edgeType, **edgeOptions)
+    inPipe.name = outPipe.name = "%s -> %s" % (bps1.BlarghClass.__name__, bps2.BlarghClass.__name__)
     bps1.addOutPipe(outPipe)
     bps2.addInPipe(inPipe)
+    bps2.upstream.append(bps1)
 
 # The master process's class to set up and then start a blargh process.
 # It keeps track of the blargh, inPipes and outPipes. Use this to set up
 # all the connections, then call start on all the BlarghProcessStarters
-# to actaully start them.
+# to actaully start them. edgeType is the default type of edge used for the
+# outputs of this blargh. rate is how many times per second an async blargh
+# should step (None means as fast as it can). mode is how the blargh gets
+# run, one of the modes above. fanIn is how it takes in messages from more
+# than one inPipe, one of the fan in policies above. cpus is a list of the
+# CPUs (numbered from 0) the process is allowed to run on, and niceness is
+# its niceness from -20 (greediest) to 19 (nicest). None leaves them as they
+# are. Both only work in PROCESS_MODE, threads run however the master does.
+# budget is how long (in seconds) a step should take, see overload.py for
+# what happens when the blargh goes over it (this only works when started
+# with startAllBlarghProcesses). seed is what the random module gets seeded
+# with in the blargh's process (None leaves it alone). Fused blarghs get the
+# settings of the head of their chain.
 class BlarghProcessStarter():
-    def __init__(self, BlarghClass, args, async):
+    def __init__(self, BlarghClass, args, async, edgeType=PIPE_EDGE, rate=None, mode=PROCESS_MODE, fanIn=FAN_IN_ORDER,
+                 cpus=None, niceness=None, budget=None, seed=None):
         self.BlarghClass = BlarghClass
         self.args = args
         self.async = async
+        self.edgeType = edgeType
+        self.rate = rate
+        self.mode = mode
+        self.fanIn = fanIn
+        self.cpus = cpus
+        self.niceness = niceness
+        self.budget = budget
+        self.seed = seed
         self.inPipes = []
         self.outPipes = []
+        # The starters that were cascaded into this one
+        self.upstream = []
+        # For fused blarghs, the starter at the head of the chain and the
+        # next starter fused onto this one
+        self.fusedInto = None
+        self.fusedNext = None
+        # The BlarghMaster, once we've been started
+        self.master = None
 
     # Use these functions to set up all the inPipes and outPipes before
     # starting the blarghProcess
     def addInPipe(self, inPipe):
+        if self.fusedInto != None:
+            print "Can't give", self.BlarghClass.__name__, "another input, it's fused"
+            raise ValueError
         self.inPipes.append(inPipe)
     def addOutPipe(self, outPipe):
+        if self.fusedNext != None:
+            # Outputs go to whatever is at the end of the fused chain
+            print "Can't give", self.BlarghClass.__name__, "another output, it's fused"
+            raise ValueError
         self.outPipes.append(outPipe)
 
-    # Create the process and return a BlarghMaster wrapper object that
-    # contains the process and pipe to it
-    def start(self):
+    # Add bps onto the end of this blargh's fused chain
+    def fuse(self, bps):
+        if bps.fusedInto != None or len(bps.inPipes) > 0:
+            print "Can't fuse", bps.BlarghClass.__name__, "it already has an input"
+            raise ValueError
+        if self.fusedNext != None or len(self.outPipes) > 0:
+            print "Can't fuse onto", self.BlarghClass.__name__, "it already has an output"
+            raise ValueError
+        self.fusedNext = bps
+        if self.fusedInto != None:
+            bps.fusedInto = self.fusedInto
+        else:
+            bps.fusedInto = self
+
+    # Returns the starter at the head of this one's fused chain
+    def chainHead(self):
+        if self.fusedInto != None:
+            return self.fusedInto
+        return self
+
+    # Returns all the starters in this one's fused chain, starting with this one
+    def fusedChain(self):
+        chain = [self]
+        while chain[-1].fusedNext != None:
+            chain.append(chain[-1].fusedNext)
+        return chain
+
+    # Create the process (or thread) and return a BlarghMaster wrapper object
+    # that contains the process and pipe to it. Blarghs in a fused chain all
+    # share the same BlarghMaster. If barrier is True the blargh won't start
+    # stepping until the master sends it a "GO" (startAllBlarghProcesses
+    # takes care of this).
+    def start(self, barrier=False):
+        if self.fusedInto != None:
+            return self.fusedInto.start(barrier)
+        if self.mode == FUSED_MODE:
+            print "Can't start", self.BlarghClass.__name__, "it isn't fused to anything"
+            raise ValueError
+        if self.master != None:
+            return self.master
+        if self.mode == THREAD_MODE and (self.cpus != None or self.niceness != None):
+            print "Can't set cpus or niceness for", self.BlarghClass.__name__, "it runs as a thread"
+            raise ValueError
+
+        chain = self.fusedChain()
+        if len(chain) > 1:
+            BlarghClass = FusedBlargh
+            args = [[(bps.BlarghClass, bps.args) for bps in chain]]
+        else:
+            BlarghClass = self.BlarghClass
+            args = self.args
+        name = "+".join([bps.BlarghClass.__name__ for bps in chain])
+
         parentMasterConn, childMasterConn = Pipe()
-        proc = Process(target = blarghProcess, args = (self.BlarghClass, self.args, childMasterConn, self.inPipes, self.outPipes, self.async))
+        # A one way pipe for the blargh to tell the master about things
+        # without being asked
+        eventsIn, eventsOut = Pipe(False)
+        procArgs = (BlarghClass, args, childMasterConn, self.inPipes, chain[-1].outPipes, self.async, self.rate, name, barrier,
+                    self.fanIn, self.budget, eventsOut, self.seed)
+        if self.mode == THREAD_MODE:
+            proc = threading.Thread(target = blarghProcess, args = procArgs, name = name)
+        else:
+            proc = Process(target = blarghProcess, args = procArgs)
         proc.start()
-        return BlarghMaster(proc, parentMasterConn)
+        if self.mode == PROCESS_MODE:
+            self.applyCpuSettings(proc.pid, name)
+            # Only the blargh process writes to this, and closing our copy
+            # means the master sees the end of it when the process exits
+            eventsOut.close()
+        self.master = BlarghMaster(proc, parentMasterConn, name, eventsIn)
+        return self.master
+
+    # Pin the process to its cpus and set its niceness. The robot is better
+    # off running without them than not running at all, so failing (like not
+    # being root when asking for a negative niceness) only gets a warning.
+    def applyCpuSettings(self, pid, name):
+        try:
+            if self.cpus != None:
+                cpu.setAffinity(pid, self.cpus)
+            if self.niceness != None:
+                cpu.setNiceness(pid, self.niceness)
+        except OSError, e:
+            print "Warning: couldn't set cpus", self.cpus, "and niceness", self.niceness, "for", name, e
 
 # The master process's wrapper for the blargh process, storing both the
 # process and the pipe connecting to it
 class BlarghMaster():
-    def __init__(self, proc, masterConn):
+    def __init__(self, proc, masterConn, name=None, events=None):
         self.proc = proc
         self.conn = masterConn
+        self.name = name
+        # Where the blargh process sends things without being asked (see
+        # OverloadSupervisor)
+        self.events = events
+        # Commands can come from more than one thread of the master process
+        self.lock = threading.Lock()
+        # Filled in by startAllBlarghProcesses
+        self.startupTime = None
+        self.initTime = None
+
+    # Ask the blargh process for its performance counters. See
+    # BlarghStats.snapshot for what's in there.
+    def stats(self):
+        self.command("STATS")
+        return self.conn.recv()
+
+    # Ask the blargh process for the latency traces of the slowest data to
+    # make it through the pipeline, as (total latency, trace) pairs. Only
+    # blarghs at the end of the pipeline (with no outputs) keep these.
+    def slowestTraces(self):
+        self.command("TRACES")
+        return self.conn.recv()
+
+    # Send the blargh process a command
+    def command(self, cmd, arg=None):
+        with self.lock:
+            self.conn.send((cmd, arg))
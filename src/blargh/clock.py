@@ -0,0 +1,52 @@
+import ctypes, ctypes.util
+import os
+import threading
+import time
+
+# time.time() can jump around whenever the system clock gets adjusted, which
+# is bad news for anything that schedules or measures intervals. Python 2
+# doesn't have time.monotonic(), so go straight to clock_gettime() instead.
+# This gets called several times per step, so the timespec it fills in is
+# made once per thread and passed by reference rather than created each call.
+
+CLOCK_MONOTONIC = 1
+CLOCK_THREAD_CPUTIME_ID = 3
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+try:
+    librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1", use_errno=True)
+    clock_gettime = librt.clock_gettime
+except (OSError, AttributeError):
+    clock_gettime = None
+
+# Each thread gets its own timespec, since ctypes lets go of the GIL while
+# clock_gettime runs
+threadState = threading.local()
+
+# Seconds since some arbitrary point in the past that never goes backwards.
+# Only differences between two calls mean anything.
+def monotonicTime():
+    if clock_gettime == None:
+        return time.time()
+    return getTime(CLOCK_MONOTONIC)
+
+# Seconds of CPU time the calling thread has used. Unlike monotonicTime, this
+# doesn't count time spent blocked, or time other processes got the CPU for
+# in the middle of whatever is being measured.
+def threadCpuTime():
+    if clock_gettime == None:
+        return time.clock()
+    return getTime(CLOCK_THREAD_CPUTIME_ID)
+
+def getTime(clock):
+    try:
+        t = threadState.timespec
+    except AttributeError:
+        t = threadState.timespec = timespec()
+        threadState.ref = ctypes.byref(t)
+    if clock_gettime(clock, threadState.ref) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return t.tv_sec + t.tv_nsec * 1e-9
@@ -0,0 +1,302 @@
+import cPickle
+import new
+import struct
+from exceptions import ValueError
+
+# A compact binary format for the messages that get passed between blargh
+# processes. Pickling a World every tick costs a lot of bytes (every class
+# and attribute name gets written out) and a lot of time, but the messages
+# we actually send always have the same shape. Each message type gets
+# turned into a single precompiled struct (objects are described by an
+# ObjectSchema, ball lists by a BallStruct), so encoding is one struct.pack
+# of a flat list of values.
+#
+# It's only worth it where it beats cPickle on CPU time, not just on bytes
+# (see benchmarks/codec_benchmark.py). cPickle is already fast on plain
+# tuples of floats, so vision's outputs are left to it, and anything that
+# isn't a registered type is pickled with nothing put in front of it.
+#
+# Every encoded message starts with a one character tag saying what it is.
+# The codec itself knows about:
+#   'N' - None
+#   'F' - a control flag (an int goal like STATE_CHANGE_FLAG)
+#   'G' - a control goal, (r, theta)
+#   '\x80' - anything else, pickled (that's how protocol 2 pickles start)
+# Everything else gets registered by whatever defines the messages, with
+# registerClass() for objects of one class and registerKeyed() for
+# (key, payload) tuples with an int key. The robot's messages are registered
+# by input (its 'I' messages) and world ('W' for a World), so any process
+# that decodes them has to have imported those. Decoding always gives back
+# something equal to what was encoded (same attributes, same types),
+# otherwise the message is pickled instead.
+
+# The kinds of fields a schema can have
+# True, False or None. Packed as 'B'.
+BOOL = "bool"
+# An int, a float or None. Packed as 'Bd', ints are sent as doubles.
+NUMBER = "number"
+
+# Field states, sent in front of every field so that missing attributes and
+# None come back exactly as they were
+ABSENT = 0
+NONE = 1
+FALSE = 2
+TRUE = 3
+INT = 2
+FLOAT = 3
+
+# Biggest int that can make it through a double unchanged
+MAX_EXACT_INT = 2 ** 53
+# Flags are sent as 32 bit ints
+MAX_FLAG = 2 ** 31
+
+# Thrown (and caught right away) when a message doesn't fit its schema
+class CantEncode(Exception):
+    pass
+
+# Describes how to flatten the attributes of an object into struct values
+# and build the object back up from them. The object itself can also be
+# missing or None, so there's always one extra state byte in front. This is
+# on the hot path for every message, so each field is handled inline rather
+# than with a helper call per field, and objects are built straight from
+# their attribute dictionary without calling __init__ (so cls has to be an
+# old style class).
+class ObjectSchema():
+    def __init__(self, cls, fields):
+        self.cls = cls
+        self.fields = fields
+        self.names = set([name for name, kind in fields])
+        self.format = "B"
+        # What gets packed for a None object
+        self.noneValues = [NONE]
+        # (name, whether it's a BOOL, where its state is) for each field,
+        # counting from the object's own state
+        self.layout = []
+        for name, kind in fields:
+            self.layout.append((name, kind == BOOL, len(self.format)))
+            if kind == BOOL:
+                self.format += "B"
+                self.noneValues.append(ABSENT)
+            else:
+                self.format += "Bd"
+                self.noneValues.extend((ABSENT, 0.0))
+        # How many struct values an object takes up
+        self.count = len(self.format)
+
+    # Append the struct values for obj onto out
+    def flatten(self, obj, out):
+        if obj is None:
+            out.extend(self.noneValues)
+            return
+        if obj.__class__ is not self.cls:
+            raise CantEncode
+        attributes = obj.__dict__
+        if not self.names.issuperset(attributes):
+            raise CantEncode
+        append = out.append
+        append(TRUE)
+        for name, isBool, offset in self.layout:
+            if name not in attributes:
+                # Not in the instance dictionary (but maybe on the class)
+                append(ABSENT)
+                if not isBool:
+                    append(0.0)
+                continue
+            value = attributes[name]
+            if isBool:
+                if value is True:
+                    append(TRUE)
+                elif value is False:
+                    append(FALSE)
+                elif value is None:
+                    append(NONE)
+                else:
+                    raise CantEncode
+            else:
+                valueType = type(value)
+                if valueType is float:
+                    append(FLOAT)
+                    append(value)
+                elif valueType is int and -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+                    append(INT)
+                    append(float(value))
+                elif value is None:
+                    append(NONE)
+                    append(0.0)
+                else:
+                    raise CantEncode
+
+    # Build the object back up from values, starting at index i. Returns the
+    # object and the index after the last value used.
+    def unflatten(self, values, i):
+        if values[i] == NONE:
+            return None, i + self.count
+        attributes = {}
+        for name, isBool, offset in self.layout:
+            state = values[i + offset]
+            if state == ABSENT:
+                continue
+            if isBool:
+                attributes[name] = BOOL_VALUES[state]
+            elif state == FLOAT:
+                attributes[name] = values[i + offset + 1]
+            elif state == INT:
+                attributes[name] = int(values[i + offset + 1])
+            else:
+                attributes[name] = None
+        return new.instance(self.cls, attributes), i + self.count
+
+# What each BOOL state decodes to
+BOOL_VALUES = (None, None, False, True)
+
+# Turn a single number (an int, a float or None) into its struct values and
+# back
+def packNumber(value):
+    if value is None:
+        return (NONE, 0.0)
+    if type(value) is float:
+        return (FLOAT, value)
+    if type(value) is int and abs(value) <= MAX_EXACT_INT:
+        return (INT, float(value))
+    raise CantEncode
+def unpackNumber(state, value):
+    if state == NONE:
+        return None
+    if state == INT:
+        return int(value)
+    return value
+
+# Ball lists are sent as a count followed by two doubles per ball. None is
+# sent as a count of 0xFFFF. Append the struct values for balls onto out.
+NO_BALLS = 0xFFFF
+def flattenBalls(balls, out):
+    if balls is None:
+        out.append(NO_BALLS)
+        return
+    if type(balls) is not list or len(balls) >= NO_BALLS:
+        raise CantEncode
+    out.append(len(balls))
+    append = out.append
+    for ball in balls:
+        if type(ball) is not tuple or len(ball) != 2:
+            raise CantEncode
+        x, y = ball
+        if type(x) is not float or type(y) is not float:
+            raise CantEncode
+        append(x)
+        append(y)
+
+# A message made of a fixed part (format, which has to end with the ball
+# count) followed by a ball list. Each registered class that sends balls gets
+# one of these, and it precompiles one struct.Struct for each number of balls
+# it's seen, so packing or unpacking a message is always one struct call.
+class BallStruct():
+    def __init__(self, format):
+        self.format = format
+        self.fixedSize = struct.calcsize(format)
+        # How many values are in the fixed part
+        self.fixedCount = len(struct.unpack(format, "\0" * self.fixedSize))
+        # Precompiled structs, by how many doubles follow the fixed part
+        self.structs = {}
+
+    def structFor(self, doubles):
+        packer = self.structs.get(doubles)
+        if packer is None:
+            packer = struct.Struct(self.format + "d" * doubles)
+            self.structs[doubles] = packer
+        return packer
+
+    # Pack values, the fixed part followed by the balls' doubles
+    def pack(self, values):
+        doubles = len(values) - self.fixedCount
+        packer = self.structs.get(doubles) or self.structFor(doubles)
+        return packer.pack(*values)
+
+    # Returns the values (the fixed part followed by the balls' doubles) and
+    # the ball list
+    def unpack(self, data):
+        doubles = (len(data) - self.fixedSize) / 8
+        unpacker = self.structs.get(doubles) or self.structFor(doubles)
+        values = unpacker.unpack(data)
+        fixedCount = self.fixedCount
+        if values[fixedCount - 1] == NO_BALLS:
+            return values, None
+        return values, zip(values[fixedCount::2], values[fixedCount + 1::2])
+
+# The struct for each message type the codec knows itself
+FLAG_STRUCT = struct.Struct("<ci")
+GOAL_STRUCT = struct.Struct("<cdd")
+# Everything else is pickled with this protocol, and its pickles always
+# start with this byte (the PROTO opcode), so that works as its tag without
+# having to copy the pickle to put one in front
+PICKLE_PROTOCOL = 2
+PICKLE_TAG = "\x80"
+# Tags the codec uses itself, which can't be registered
+BUILTIN_TAGS = "NFG" + PICKLE_TAG
+
+# Registered message types. Encoders return the whole encoded message, tag
+# and all, or raise CantEncode if the message doesn't fit. Decoders get the
+# whole encoded message back.
+classEncoders = {}
+keyedEncoders = {}
+decoders = {}
+
+def registerTag(tag, decoder):
+    if len(tag) != 1 or tag in BUILTIN_TAGS or tag in decoders:
+        print "Message tag", repr(tag), "is already taken"
+        raise ValueError
+    decoders[tag] = decoder
+
+# Register a message type for objects of exactly class cls
+def registerClass(cls, tag, encoder, decoder):
+    registerTag(tag, decoder)
+    classEncoders[cls] = encoder
+
+# Register a message type for (key, payload) tuples, where key is an int
+def registerKeyed(key, tag, encoder, decoder):
+    registerTag(tag, decoder)
+    keyedEncoders[key] = encoder
+
+# Turn a message into a string of bytes. Anything that isn't one of the
+# message types below goes straight to cPickle, so it costs no more than
+# pickling always did.
+def encode(obj):
+    objType = type(obj)
+    encoder = None
+    if objType is tuple and len(obj) == 2:
+        # Indexed rather than unpacked into locals: cPickle only memoizes
+        # objects that something else holds a reference to, so holding onto
+        # them would make their pickles bigger and slower
+        if type(obj[0]) is float and type(obj[1]) is float:
+            return GOAL_STRUCT.pack("G", obj[0], obj[1])
+        if type(obj[0]) is int:
+            encoder = keyedEncoders.get(obj[0])
+    elif obj is None:
+        return "N"
+    elif objType is int and -MAX_FLAG <= obj < MAX_FLAG:
+        return FLAG_STRUCT.pack("F", obj)
+    else:
+        encoder = classEncoders.get(obj.__class__)
+    if encoder != None:
+        try:
+            return encoder(obj)
+        except CantEncode:
+            pass
+    return cPickle.dumps(obj, PICKLE_PROTOCOL)
+
+# Turn a string of bytes from encode back into the message
+def decode(data):
+    tag = data[0]
+    if tag == PICKLE_TAG:
+        return cPickle.loads(data)
+    if tag == "N":
+        return None
+    if tag == "F":
+        return FLAG_STRUCT.unpack(data)[1]
+    if tag == "G":
+        tag, r, theta = GOAL_STRUCT.unpack(data)
+        return (r, theta)
+    if tag in decoders:
+        return decoders[tag](data)
+    print "Unknown message tag", repr(tag), "(has whatever registers it been imported?)"
+    raise ValueError
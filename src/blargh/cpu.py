@@ -0,0 +1,72 @@
+import ctypes, ctypes.util
+import os
+
+# Control over which CPUs a process is allowed to run on and how nice it is
+# to other processes. Python 2's os module can only change the niceness of
+# the calling process and can't touch affinity at all, so this goes to libc
+# through ctypes, the same way clock.py does. Everything takes a pid, and a
+# pid of 0 means the calling process.
+
+PRIO_PROCESS = 0
+
+# Big enough for 1024 CPUs, same as glibc's cpu_set_t
+CPU_SET_WORDS = 1024 / (8 * ctypes.sizeof(ctypes.c_ulong))
+WORD_BITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+class cpu_set_t(ctypes.Structure):
+    _fields_ = [("bits", ctypes.c_ulong * CPU_SET_WORDS)]
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    sched_setaffinity = libc.sched_setaffinity
+    sched_getaffinity = libc.sched_getaffinity
+    setpriority = libc.setpriority
+    getpriority = libc.getpriority
+except (OSError, AttributeError):
+    libc = None
+
+def checkAvailable():
+    if libc == None:
+        raise OSError("CPU affinity and niceness aren't supported here")
+
+def raiseErrno():
+    errno = ctypes.get_errno()
+    raise OSError(errno, os.strerror(errno))
+
+# The number of CPUs in the machine
+def cpuCount():
+    return os.sysconf("SC_NPROCESSORS_ONLN")
+
+# Only let the process run on the CPUs (numbered from 0) in the list cpus
+def setAffinity(pid, cpus):
+    checkAvailable()
+    cpuSet = cpu_set_t()
+    for cpu in cpus:
+        cpuSet.bits[cpu / WORD_BITS] |= 1 << (cpu % WORD_BITS)
+    if sched_setaffinity(pid, ctypes.sizeof(cpuSet), ctypes.byref(cpuSet)) != 0:
+        raiseErrno()
+
+# Returns the sorted list of CPUs the process is allowed to run on
+def getAffinity(pid):
+    checkAvailable()
+    cpuSet = cpu_set_t()
+    if sched_getaffinity(pid, ctypes.sizeof(cpuSet), ctypes.byref(cpuSet)) != 0:
+        raiseErrno()
+    return [cpu for cpu in range(CPU_SET_WORDS * WORD_BITS)
+            if cpuSet.bits[cpu / WORD_BITS] & (1 << (cpu % WORD_BITS))]
+
+# Set the niceness of the process, from -20 (greediest) to 19 (nicest).
+# Going below 0 needs root.
+def setNiceness(pid, niceness):
+    checkAvailable()
+    if setpriority(PRIO_PROCESS, pid, niceness) != 0:
+        raiseErrno()
+
+def getNiceness(pid):
+    checkAvailable()
+    # -1 is a perfectly good niceness, so errors can only be told apart by
+    # errno
+    ctypes.set_errno(0)
+    niceness = getpriority(PRIO_PROCESS, pid)
+    if niceness == -1 and ctypes.get_errno() != 0:
+        raiseErrno()
+    return niceness
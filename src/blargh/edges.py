@@ -0,0 +1,475 @@
+import collections
+import errno
+import fcntl
+import os
+import struct
+from exceptions import ValueError
+from multiprocessing import Pipe, RawArray, RawValue
+
+import codec
+from blackboard import MAX_READ_TRIES
+from clock import monotonicTime
+from sampling import selectInterruptible
+from tracing import encodeTrace, decodeTrace
+
+# Edges are what connect two blargh processes together. Every edge has an
+# "in end" that the consuming blargh process reads from and an "out end" that
+# the producing blargh process writes to. Both ends of every edge type support
+# the same small set of functions, so blarghProcess doesn't need to care what
+# kind of edge it's talking to:
+#   In end:  poll(), recv(), fileno()
+#   Out end: send(obj, trace), waitAck()
+# recv() returns (obj, trace), where trace is the latency trace (see
+# tracing.py) that was sent along with obj, or None.
+# Both ends also have a name (set by whoever connects them), dropped(), the
+# number of messages that were thrown away on the edge, and waitTime(), the
+# number of seconds the producer has spent blocked waiting on the consumer.
+# If the out end's wakeOn is set to something that can be select()ed, the
+# producer stops waiting on the consumer as soon as it's readable. In ends
+# also have expired(), the number of messages that were too old to use (see
+# ExpiringInEnd).
+
+# The types of edges that can be created
+# A multiprocessing.Pipe with credit based flow control. The producer can have
+# up to window messages in flight before it has to wait for the consumer to
+# hand back credits, which it does in batches.
+PIPE_EDGE = "PIPE"
+# A shared memory ring buffer with no acknowledgements
+RING_EDGE = "RING"
+# A shared memory slot that only ever holds the newest message. Older messages
+# that were never read get overwritten and counted as dropped.
+MAILBOX_EDGE = "MAILBOX"
+# An in-memory queue for blarghs running as threads in the same process.
+# Messages aren't copied or encoded at all, the other end gets the very same
+# object, so don't use this between two different processes.
+LOCAL_EDGE = "LOCAL"
+
+# Default number of unacknowledged messages a pipe edge can have in flight
+DEFAULT_PIPE_WINDOW = 8
+# Default number of bytes of shared memory for a ring buffer edge
+DEFAULT_RING_CAPACITY = 1 << 16
+# Default number of bytes of shared memory for a mailbox edge
+DEFAULT_MAILBOX_CAPACITY = 1 << 16
+
+# Header in front of every message in a ring buffer (the message length)
+RECORD_HEADER = struct.Struct("<I")
+# A batch of credits handed back on a pipe edge (the number of credits)
+CREDIT_MESSAGE = struct.Struct("<I")
+
+# Create an edge of the given type and return its (inEnd, outEnd). Options
+# are window for pipe edges, capacity for ring buffer and mailbox edges, and
+# maxAge for any edge (see ExpiringInEnd).
+def createEdge(edgeType, **options):
+    inEnd, outEnd = createPlainEdge(edgeType, **options)
+    if options.get("maxAge") != None:
+        inEnd = ExpiringInEnd(inEnd, options["maxAge"])
+    return inEnd, outEnd
+
+def createPlainEdge(edgeType, **options):
+    if (edgeType == PIPE_EDGE):
+        window = options.get("window", DEFAULT_PIPE_WINDOW)
+        if (window < 1):
+            print "Pipe edge window has to be at least 1, not", window
+            raise ValueError
+        inPipe, outPipe = Pipe()
+        return PipeInEnd(inPipe, window), PipeOutEnd(outPipe, window)
+    elif (edgeType == RING_EDGE):
+        ring = RingBuffer(options.get("capacity", DEFAULT_RING_CAPACITY))
+        return RingInEnd(ring), RingOutEnd(ring)
+    elif (edgeType == MAILBOX_EDGE):
+        mailbox = Mailbox(options.get("capacity", DEFAULT_MAILBOX_CAPACITY))
+        return MailboxInEnd(mailbox), MailboxOutEnd(mailbox)
+    elif (edgeType == LOCAL_EDGE):
+        queue = LocalQueue()
+        return LocalInEnd(queue), LocalOutEnd(queue)
+    else:
+        print "Unknown edge type", edgeType
+        raise ValueError
+
+# Things every edge end has, regardless of its type
+class EdgeEnd():
+    name = "unnamed edge"
+    wakeOn = None
+    def dropped(self):
+        return 0
+    def waitTime(self):
+        return 0.0
+    def expired(self):
+        return 0
+
+# Turn a message and its trace into a string of bytes and back again (see
+# codec.py and tracing.py)
+def encodeMessage(obj, trace):
+    return encodeTrace(trace) + codec.encode(obj)
+def decodeMessage(data):
+    trace, offset = decodeTrace(data)
+    return codec.decode(data[offset:]), trace
+
+
+# Wraps the in end of any edge and throws away messages that are older than
+# maxAge seconds, so that after a stall the consumer goes straight to fresh
+# data instead of working through a backlog of stale messages. A message's
+# age comes from its trace: how long ago the data it's based on was sampled.
+# Messages with no trace never expire.
+class ExpiringInEnd(EdgeEnd):
+    def __init__(self, inEnd, maxAge):
+        self.inEnd = inEnd
+        self.maxAge = maxAge
+        # The next message that wasn't too old, once poll finds one
+        self.pending = None
+        self.expiredCount = 0
+    def poll(self):
+        while self.pending == None and self.inEnd.poll():
+            message = self.inEnd.recv()
+            trace = message[1]
+            if trace != None and monotonicTime() - trace[0] > self.maxAge:
+                self.expiredCount += 1
+            else:
+                self.pending = message
+        return self.pending != None
+    def recv(self):
+        if not self.poll():
+            print "Nothing to receive on", self.name
+            raise ValueError
+        message = self.pending
+        self.pending = None
+        return message
+    def fileno(self):
+        return self.inEnd.fileno()
+    def dropped(self):
+        return self.inEnd.dropped()
+    def expired(self):
+        return self.expiredCount
+
+
+#---------------------------------- Pipe edges --------------------------------
+
+# The consuming end of a Pipe edge. Every message received uses up one of the
+# producer's credits. They get handed back once half the window has been
+# received, so the producer only hears from us every few messages, but never
+# runs out of credits while we're keeping up.
+class PipeInEnd(EdgeEnd):
+    def __init__(self, conn, window):
+        self.conn = conn
+        self.batch = max(1, window / 2)
+        # Messages received that we haven't handed the credits back for yet
+        self.unacked = 0
+    def poll(self):
+        return self.conn.poll()
+    def recv(self):
+        inp = decodeMessage(self.conn.recv_bytes())
+        self.unacked += 1
+        if self.unacked >= self.batch:
+            self.conn.send_bytes(CREDIT_MESSAGE.pack(self.unacked))
+            self.unacked = 0
+        return inp
+    def fileno(self):
+        return self.conn.fileno()
+
+# The producing end of a Pipe edge. Sending uses up a credit, and only blocks
+# when there are none left, until the consumer hands some back. If wakeOn
+# wakes us up first, the message goes out anyway and the window is overdrawn
+# until the credits come back.
+class PipeOutEnd(EdgeEnd):
+    def __init__(self, conn, window):
+        self.conn = conn
+        self.credits = window
+        self.blockedTime = 0.0
+    def send(self, obj, trace=None):
+        if self.credits <= 0:
+            waitStart = monotonicTime()
+            waitables = [self.conn]
+            if self.wakeOn != None:
+                waitables.append(self.wakeOn)
+            while self.credits <= 0:
+                ready = selectInterruptible(waitables)
+                if self.conn in ready:
+                    self.takeCredits()
+                elif self.wakeOn in ready:
+                    break
+            self.blockedTime += monotonicTime() - waitStart
+        self.conn.send_bytes(encodeMessage(obj, trace))
+        self.credits -= 1
+    # Nothing to wait for, but pick up any credits that have come back so
+    # they don't pile up in the pipe
+    def waitAck(self):
+        while self.conn.poll():
+            self.takeCredits()
+    # Block until the consumer hands back a batch of credits
+    def takeCredits(self):
+        self.credits += CREDIT_MESSAGE.unpack(self.conn.recv_bytes())[0]
+    def waitTime(self):
+        return self.blockedTime
+
+
+#------------------------------ Shared memory edges ----------------------------
+
+# A doorbell lets one process wake up another one that is blocked waiting on
+# it. It's backed by an os.pipe so that the waiting side can select() on it
+# together with everything else it's waiting on. The rung flag lives in shared
+# memory so that the ringing side only makes a syscall when the bell isn't
+# already rung.
+class Doorbell():
+    def __init__(self):
+        self.readFd, self.writeFd = os.pipe()
+        for fd in (self.readFd, self.writeFd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.rung = RawValue('i', 0)
+
+    # Wake up whoever is waiting on the bell
+    def ring(self):
+        if not self.rung.value:
+            self.rung.value = 1
+            try:
+                os.write(self.writeFd, "!")
+            except OSError, e:
+                # The pipe being full means the bell is plenty rung already
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    # Reset the bell. Always re-check whatever condition you're waiting on
+    # after clearing it, otherwise a ring can be missed.
+    def clear(self):
+        # Empty the pipe before lowering the flag. The other way round, a ring
+        # that lands in between has its byte read away here while the flag
+        # stays up, and every ring after that is skipped.
+        try:
+            while os.read(self.readFd, 4096):
+                pass
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+        self.rung.value = 0
+
+    # Block until the bell is rung or the timeout (in seconds) runs out
+    def wait(self, timeout=None):
+        selectInterruptible([self.readFd], timeout)
+
+    def fileno(self):
+        return self.readFd
+
+# A single producer, single consumer ring buffer of length-prefixed messages
+# in shared memory. head and tail count the total number of bytes ever written
+# and read, so the amount of data waiting is always head - tail.
+class RingBuffer():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = RawArray('c', capacity)
+        self.head = RawValue('L', 0)
+        self.tail = RawValue('L', 0)
+        # Rung by the producer when there's new data, and by the consumer
+        # when it frees up space
+        self.dataBell = Doorbell()
+        self.spaceBell = Doorbell()
+
+    def isEmpty(self):
+        return self.head.value == self.tail.value
+
+    def freeSpace(self):
+        return self.capacity - (self.head.value - self.tail.value)
+
+    # Append a message, blocking while the buffer is too full to take it
+    def write(self, payload):
+        record = RECORD_HEADER.pack(len(payload)) + payload
+        if (len(record) > self.capacity):
+            print "Message of", len(record), "bytes can't fit in a ring of", self.capacity
+            raise ValueError
+        while self.freeSpace() < len(record):
+            self.spaceBell.clear()
+            if self.freeSpace() >= len(record):
+                break
+            self.spaceBell.wait()
+        self.copyIn(self.head.value, record)
+        # Only publish the message once all of its bytes are in place
+        self.head.value += len(record)
+        self.dataBell.ring()
+
+    # Take the oldest message out of the buffer. Only call this when the
+    # buffer isn't empty.
+    def read(self):
+        tail = self.tail.value
+        length, = RECORD_HEADER.unpack(self.copyOut(tail, RECORD_HEADER.size))
+        payload = self.copyOut(tail + RECORD_HEADER.size, length)
+        self.tail.value = tail + RECORD_HEADER.size + length
+        self.spaceBell.ring()
+        return payload
+
+    # Helpers to copy bytes in and out of the buffer, wrapping around the end
+    def copyIn(self, position, s):
+        start = position % self.capacity
+        first = min(len(s), self.capacity - start)
+        self.data[start:start + first] = s[:first]
+        if first < len(s):
+            self.data[0:len(s) - first] = s[first:]
+    def copyOut(self, position, length):
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        out = self.data[start:start + first]
+        if first < length:
+            out += self.data[0:length - first]
+        return out
+
+# The consuming end of a ring buffer edge
+class RingInEnd(EdgeEnd):
+    def __init__(self, ring):
+        self.ring = ring
+    def poll(self):
+        if not self.ring.isEmpty():
+            return True
+        # Nothing waiting, so reset the doorbell (if it was rung) before
+        # checking one last time. That way any message that shows up after
+        # this is guaranteed to ring it again.
+        if self.ring.dataBell.rung.value:
+            self.ring.dataBell.clear()
+        return not self.ring.isEmpty()
+    def recv(self):
+        return decodeMessage(self.ring.read())
+    def fileno(self):
+        return self.ring.dataBell.fileno()
+
+# The producing end of a ring buffer edge. There's nothing to wait for after
+# sending, the ring buffer itself provides the back pressure.
+class RingOutEnd(EdgeEnd):
+    def __init__(self, ring):
+        self.ring = ring
+    def send(self, obj, trace=None):
+        self.ring.write(encodeMessage(obj, trace))
+    def waitAck(self):
+        pass
+
+# A latest-value slot in shared memory, guarded by a sequence lock. The
+# producer never waits: every write replaces whatever was in the slot. The
+# consumer always gets the newest message, and any messages it never got to
+# see are counted in dropped.
+class Mailbox():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = RawArray('c', capacity)
+        self.length = RawValue('L', 0)
+        # Odd while the producer is in the middle of a write
+        self.seq = RawValue('L', 0)
+        # Number of messages ever written
+        self.written = RawValue('L', 0)
+        # Number of messages the consumer never saw
+        self.dropped = RawValue('L', 0)
+        self.dataBell = Doorbell()
+
+    def write(self, payload):
+        if (len(payload) > self.capacity):
+            print "Message of", len(payload), "bytes can't fit in a mailbox of", self.capacity
+            raise ValueError
+        self.seq.value += 1
+        self.data[0:len(payload)] = payload
+        self.length.value = len(payload)
+        self.written.value += 1
+        self.seq.value += 1
+        self.dataBell.ring()
+
+    # Returns the newest message and how many messages were written in total
+    # when it was taken, or (None, None) if the producer was part way through
+    # a write for all MAX_READ_TRIES tries (same bound as a blackboard), so a
+    # producer that died halfway through a write can't keep us spinning
+    def read(self):
+        for i in xrange(MAX_READ_TRIES):
+            seq = self.seq.value
+            if seq % 2 == 1:
+                # The producer is part way through a write, try again
+                continue
+            written = self.written.value
+            payload = self.data[0:self.length.value]
+            if self.seq.value == seq:
+                return payload, written
+        return None, None
+
+# The consuming end of a mailbox edge
+class MailboxInEnd(EdgeEnd):
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        # How many messages had been written the last time we read
+        self.lastWritten = 0
+        # The (payload, written) poll() read, that recv() hasn't taken yet
+        self.pending = None
+    # The message is read here rather than in recv(), so that if the producer
+    # is stuck halfway through a write there's just nothing new yet. The
+    # doorbell is cleared before reading, so finishing the write wakes us up.
+    def poll(self):
+        if self.pending != None:
+            return True
+        if self.mailbox.written.value == self.lastWritten:
+            # Same trick as RingInEnd.poll to make sure a ring isn't missed
+            if self.mailbox.dataBell.rung.value:
+                self.mailbox.dataBell.clear()
+            if self.mailbox.written.value == self.lastWritten:
+                return False
+        elif self.mailbox.dataBell.rung.value:
+            self.mailbox.dataBell.clear()
+        payload, written = self.mailbox.read()
+        if payload == None:
+            return False
+        self.pending = (payload, written)
+        return True
+    def recv(self):
+        if not self.poll():
+            print "Nothing to receive on", self.name
+            raise ValueError
+        payload, written = self.pending
+        self.pending = None
+        # Everything between what we last saw and this one got overwritten
+        if written > self.lastWritten + 1:
+            self.mailbox.dropped.value += written - self.lastWritten - 1
+        self.lastWritten = written
+        return decodeMessage(payload)
+    def fileno(self):
+        return self.mailbox.dataBell.fileno()
+    def dropped(self):
+        return self.mailbox.dropped.value
+
+# The producing end of a mailbox edge. Sending never blocks and there's never
+# anything to wait for.
+class MailboxOutEnd(EdgeEnd):
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+    def send(self, obj, trace=None):
+        self.mailbox.write(encodeMessage(obj, trace))
+    def waitAck(self):
+        pass
+    def dropped(self):
+        return self.mailbox.dropped.value
+
+
+#---------------------------------- Local edges -------------------------------
+
+# A queue of messages between two threads. deque's append and popleft are
+# thread safe, and the doorbell lets the consumer select() on it just like
+# on any other edge.
+class LocalQueue():
+    def __init__(self):
+        self.messages = collections.deque()
+        self.dataBell = Doorbell()
+
+# The consuming end of a local edge
+class LocalInEnd(EdgeEnd):
+    def __init__(self, queue):
+        self.queue = queue
+    def poll(self):
+        if self.queue.messages:
+            return True
+        # Same trick as RingInEnd.poll to make sure a ring isn't missed
+        if self.queue.dataBell.rung.value:
+            self.queue.dataBell.clear()
+        return len(self.queue.messages) > 0
+    def recv(self):
+        return self.queue.messages.popleft()
+    def fileno(self):
+        return self.queue.dataBell.fileno()
+
+# The producing end of a local edge
+class LocalOutEnd(EdgeEnd):
+    def __init__(self, queue):
+        self.queue = queue
+    def send(self, obj, trace=None):
+        self.queue.messages.append((obj, trace))
+        self.queue.dataBell.ring()
+    def waitAck(self):
+        pass
@@ -0,0 +1,127 @@
+from blargh import Blargh
+from clock import monotonicTime
+from blargh_process import THREAD_MODE, FAN_IN_JOIN
+from edges import createEdge, PIPE_EDGE
+from sampling import selectInterruptible
+from topology import STAGE_DEFAULTS
+
+# Lock-step mode runs a topology (see topology.py) one global tick at a time,
+# instead of letting every stage run freely against the wall clock. Whatever
+# drives the ticks (like the simulator) holds a LockStepClock. On every tick:
+#   - The clock sends the tick (the simulated time, in seconds) to every
+#     stage with no inputs
+#   - Every stage steps exactly once, on the outputs of the stages before it
+#   - Once every stage with no outputs has stepped, the clock hears back
+# and only then does the next tick go out. Nothing depends on how long
+# anything takes, so the same run gives the same results every time, and it
+# goes as fast as the stages can step rather than in real time.
+
+# Simulated seconds per tick by default
+DEFAULT_TICK_PERIOD = 0.01
+# Stages get seeded with this plus their position in the topology, so that
+# each one gets its own random numbers, but the same ones every run
+DEFAULT_SEED = 6270
+
+# Passes the tick it gets straight on, so one tick can go out to every stage
+# with no inputs
+class TickBlargh(Blargh):
+    def step(self, inp):
+        return inp
+
+# Steps once every stage with no outputs has stepped (with FAN_IN_JOIN), and
+# tells the clock the tick is done
+class DoneBlargh(Blargh):
+    def step(self, inp):
+        return True
+
+# The driving side of lock-step mode. Create it before whatever drives the
+# ticks is started, pass it to lockStepTopology to build the topology that
+# it drives, and pass it to the driving process, which calls tick() and then
+# waits for finished(). It can be select()ed on, it's readable once the tick
+# is done.
+class LockStepClock():
+    def __init__(self, period=DEFAULT_TICK_PERIOD):
+        self.period = period
+        self.ticks = 0
+        self.tickIn, self.tickOut = createEdge(PIPE_EDGE)
+        self.doneIn, self.doneOut = createEdge(PIPE_EDGE)
+        self.tickIn.name = self.tickOut.name = "clock -> TickBlargh"
+        self.doneIn.name = self.doneOut.name = "DoneBlargh -> clock"
+
+    # The simulated time of the tick that's going (or about to go) through
+    def time(self):
+        return self.ticks * self.period
+
+    # Send out the next tick. Its latency trace (see tracing.py) starts now.
+    def tick(self):
+        self.tickOut.send(self.time(), (monotonicTime(), ()))
+        self.tickOut.waitAck()
+
+    # Returns True once the tick has made it all the way through. After
+    # that the next one can be sent.
+    def finished(self):
+        if not self.doneIn.poll():
+            return False
+        self.doneIn.recv()
+        self.ticks += 1
+        return True
+
+    # Wait until the tick has made it all the way through, or until one of
+    # readables (for example pipes with requests from the blarghs) can be
+    # read. Returns the readables that can be read, and whether the tick is
+    # finished.
+    def wait(self, readables):
+        ready = selectInterruptible(readables + [self.doneIn])
+        return [conn for conn in ready if conn is not self.doneIn], self.finished()
+
+    def fileno(self):
+        return self.doneIn.fileno()
+
+# Returns a copy of topology set up to run in lock-step with clock:
+#   - Every stage runs sync, so it only steps when its inputs arrive. Rates
+#     and budgets go away, since they're all about wall clock time.
+#   - Stages with more than one input take one message from each of them per
+#     step (FAN_IN_JOIN)
+#   - Every edge is a plain pipe edge with no maxAge, so no message is ever
+#     overwritten or thrown away
+#   - Every stage gets its own seed
+#   - A "tick" stage takes the ticks from the clock and passes them on to all
+#     the stages with no inputs, and a "done" stage tells the clock when all
+#     the stages with no outputs have stepped. Both run as threads.
+def lockStepTopology(topology, clock, seed=DEFAULT_SEED):
+    stages = []
+    hasOutputs = set()
+    inputCounts = {}
+    for edge in topology.get("edges", []):
+        hasOutputs.add(edge.get("from"))
+        inputCounts[edge.get("to")] = inputCounts.get(edge.get("to"), 0) + 1
+
+    for i in range(len(topology["stages"])):
+        stage = dict(topology["stages"][i])
+        stage["async"] = False
+        stage["rate"] = None
+        stage["budget"] = None
+        stage["edgeType"] = PIPE_EDGE
+        stage["seed"] = seed + i
+        if inputCounts.get(stage["name"], 0) > 1:
+            stage["fanIn"] = FAN_IN_JOIN
+        else:
+            stage["fanIn"] = STAGE_DEFAULTS["fanIn"]
+        stages.append(stage)
+    stages.append({"name": "tick", "blargh": TickBlargh, "mode": THREAD_MODE})
+    stages.append({"name": "done", "blargh": DoneBlargh, "mode": THREAD_MODE, "fanIn": FAN_IN_JOIN})
+
+    edges = [{"to": "tick", "inEnd": clock.tickIn}]
+    for stage in topology["stages"]:
+        if stage["name"] not in inputCounts:
+            edges.append({"from": "tick", "to": stage["name"]})
+    for edge in topology.get("edges", []):
+        if "from" in edge and "to" in edge:
+            edges.append({"from": edge["from"], "to": edge["to"]})
+        else:
+            edges.append(dict(edge))
+    for stage in topology["stages"]:
+        if stage["name"] not in hasOutputs:
+            edges.append({"from": stage["name"], "to": "done"})
+    edges.append({"from": "done", "outEnd": clock.doneOut})
+    return {"stages": stages, "edges": edges}
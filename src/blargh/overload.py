@@ -0,0 +1,132 @@
+import threading
+
+from clock import monotonicTime
+from sampling import selectInterruptible
+
+# Load shedding for blarghs that can't keep up. A blargh can be given a
+# budget: how long (in seconds) its steps are supposed to take. If its steps
+# start taking longer than that on average, it goes into degraded mode:
+#   - Instead of stepping on every message it receives, it only steps on the
+#     newest message from each inPipe and skips the rest (like FAN_IN_LATEST)
+#   - It tells the master, which slows down the async blarghs upstream of it
+#     by sending them a "RATE" command, so there's less coming in to skip
+#   - Going in and out of degraded mode gets printed out
+# Once its steps are comfortably back under budget, everything goes back to
+# normal.
+
+# How much weight the newest step time gets in the running average. Lower
+# means slower to react, but less bothered by the odd slow step.
+SMOOTHING = 0.1
+# Degraded mode ends when the average step time drops below this fraction
+# of the budget, so that a blargh right on its budget doesn't flip back and
+# forth on every step
+RECOVERY_FRACTION = 0.8
+# How much upstream blarghs get slowed down by while something downstream of
+# them is degraded
+DEGRADED_RATE_SCALE = 0.5
+# The slowest an upstream blargh that normally runs as fast as it can gets
+# slowed down to, in Hz
+MIN_THROTTLED_RATE = 1.0
+
+# Lives in the blargh process and decides when it's overloaded
+class OverloadMonitor():
+    def __init__(self, budget):
+        self.budget = budget
+        self.meanStepTime = None
+        self.degraded = False
+        # How many times we went into degraded mode, and for how long in total
+        self.overloads = 0
+        self.degradedTime = 0.0
+        self.degradedSince = None
+
+    # Record how long a step took. Returns True when this step put us into
+    # degraded mode, False when it took us out again, and None otherwise.
+    def recordStep(self, duration, now):
+        if self.meanStepTime == None:
+            self.meanStepTime = duration
+        else:
+            self.meanStepTime += SMOOTHING * (duration - self.meanStepTime)
+        if not self.degraded and self.meanStepTime > self.budget:
+            self.degraded = True
+            self.overloads += 1
+            self.degradedSince = now
+            return True
+        if self.degraded and self.meanStepTime < self.budget * RECOVERY_FRACTION:
+            self.degraded = False
+            self.degradedTime += now - self.degradedSince
+            return False
+        return None
+
+    def getStats(self, now):
+        degradedTime = self.degradedTime
+        if self.degraded:
+            degradedTime += now - self.degradedSince
+        return {"budget": self.budget,
+                "meanStepTime": self.meanStepTime or 0.0,
+                "degraded": self.degraded,
+                "overloads": self.overloads,
+                "degradedTime": degradedTime}
+
+# Lives in the master process. Listens for blargh processes going in and out
+# of degraded mode, and slows down or speeds back up the async blarghs
+# upstream of them. Upstream of a sync blargh means upstream of whatever it
+# gets its input from, since a sync blargh only runs as fast as its input.
+class OverloadSupervisor(threading.Thread):
+    def __init__(self, starters):
+        threading.Thread.__init__(self, name="OverloadSupervisor")
+        self.daemon = True
+        # BlarghMasters by the event pipe they listen on
+        self.masters = {}
+        # The starters at the heads of all the chains, by BlarghMaster
+        self.heads = {}
+        for bps in starters:
+            head = bps.chainHead()
+            self.heads[head.master] = head
+            self.masters[head.master.events] = head.master
+        # BlarghMasters that are degraded right now
+        self.degraded = set()
+        # The rate scale each BlarghMaster has been told to run at
+        self.scales = {}
+
+    # The BlarghMasters of the async blarghs that feed into head's chain
+    def asyncUpstream(self, head, seen):
+        upstream = []
+        for bps in head.upstream:
+            bps = bps.chainHead()
+            if bps in seen:
+                continue
+            seen.add(bps)
+            if bps.async:
+                upstream.append(bps.master)
+            else:
+                upstream.extend(self.asyncUpstream(bps, seen))
+        return upstream
+
+    def run(self):
+        while len(self.masters) > 0:
+            for conn in selectInterruptible(self.masters.keys()):
+                blarghMaster = self.masters[conn]
+                try:
+                    event, degraded = conn.recv()
+                except EOFError:
+                    # The process is gone
+                    del self.masters[conn]
+                    self.degraded.discard(blarghMaster)
+                    continue
+                if degraded:
+                    self.degraded.add(blarghMaster)
+                else:
+                    self.degraded.discard(blarghMaster)
+                self.updateRates()
+
+    # Tell every async blargh what rate scale it should be running at now
+    def updateRates(self):
+        throttled = set()
+        for blarghMaster in self.degraded:
+            throttled.update(self.asyncUpstream(self.heads[blarghMaster], set()))
+        for blarghMaster in self.heads:
+            scale = DEGRADED_RATE_SCALE if blarghMaster in throttled else 1.0
+            if self.scales.get(blarghMaster, 1.0) != scale and blarghMaster.proc.is_alive():
+                print "Overload: running", blarghMaster.name, "at", scale, "times its rate"
+                blarghMaster.command("RATE", scale)
+                self.scales[blarghMaster] = scale
@@ -0,0 +1,225 @@
+import glob
+import json
+import os
+from collections import OrderedDict
+
+from blargh_process import FUSED_MODE
+from topology import STAGE_DEFAULTS
+
+# Works out which blarghs in a topology (see topology.py) are worth fusing
+# into one process, from the stats saved on a real run (see saveStats in
+# stats.py). Every edge between two processes costs CPU time to serialize,
+# send and receive each message, and adds latency while the message is in
+# flight. Fusing the two blarghs on either end into a CascadeBlargh gets rid
+# of both, but:
+#   - The second blargh now steps on every output of the first, so if it
+#     used to skip some of them (a mailbox edge, or FAN_IN_LATEST) it ends up
+#     doing more steps than before
+#   - The first blargh's steps now take as long as both steps together, which
+#     has to fit in its tick if it has a rate
+#   - Both blarghs now share one CPU
+# So an edge only gets fused if it saves CPU time overall, and fusing it
+# doesn't leave a process too busy or too slow for its rate.
+
+# Most of a CPU a fused chain of blarghs is allowed to keep busy, so that it
+# has some room left to cope with the odd slow step
+MAX_FUSED_LOAD = 0.7
+
+# Load the stats saved in directory. Returns a dictionary of stats by blargh
+# name. If the same blargh was saved more than once, the newest one is kept.
+def loadStats(directory):
+    allStats = {}
+    paths = glob.glob(os.path.join(directory, "*.json"))
+    paths.sort(key=os.path.getmtime)
+    for path in paths:
+        stats = json.load(open(path))
+        allStats[stats["name"]] = stats
+    return allStats
+
+# Find the stats of the edge called name in a list of edge stats
+def findEdge(edges, name):
+    for edge in edges:
+        if edge["name"] == name:
+            return edge
+    return None
+
+# Decide which edges of topology to fuse, given allStats from loadStats. The
+# stats have to come from a run of the same topology, before anything was
+# fused. Returns a list of advice, one for each edge, in the same order as
+# the edges. Each one is a dictionary with from and to (the stage names),
+# fuse (True or False), reason, and for edges that could be fused, cpuSaved
+# (the fraction of a CPU fusing saves) and latencySaved (in seconds, the
+# median time messages spent on the edge).
+def advisePlacement(topology, allStats):
+    stages = OrderedDict()
+    for stage in topology["stages"]:
+        settings = dict(STAGE_DEFAULTS)
+        settings.update(stage)
+        stages[stage["name"]] = settings
+    inputs = dict([(name, 0) for name in stages])
+    outputs = dict([(name, 0) for name in stages])
+    for edge in topology.get("edges", []):
+        if "from" in edge:
+            outputs[edge["from"]] += 1
+        if "to" in edge:
+            inputs[edge["to"]] += 1
+    # Edges to things outside the topology can't be fused
+    edges = [edge for edge in topology.get("edges", []) if "from" in edge and "to" in edge]
+
+    # Stats are saved under the name of the BlarghClass
+    stageStats = {}
+    for name, stage in stages.items():
+        stageStats[name] = allStats.get(stage["blargh"].__name__)
+
+    advice = []
+    candidates = []
+    for edge in edges:
+        source = edge["from"]
+        destination = edge["to"]
+        entry = {"from": source, "to": destination, "fuse": False, "cpuSaved": 0.0, "latencySaved": 0.0}
+        advice.append(entry)
+        sourceStats = stageStats[source]
+        destinationStats = stageStats[destination]
+        if stages[destination]["mode"] == FUSED_MODE:
+            entry["fuse"] = True
+            entry["reason"] = "already fused"
+        elif sourceStats == None or destinationStats == None:
+            entry["reason"] = "no stats for %s" % (source if sourceStats == None else destination)
+        elif outputs[source] != 1:
+            entry["reason"] = "%s sends to more than one blargh" % source
+        elif inputs[destination] != 1:
+            entry["reason"] = "%s takes input from more than one blargh" % destination
+        elif stages[destination]["async"]:
+            entry["reason"] = "%s is async, it steps on its own schedule" % destination
+        else:
+            edgeName = "%s -> %s" % (stages[source]["blargh"].__name__, stages[destination]["blargh"].__name__)
+            outEdge = findEdge(sourceStats["outEdges"], edgeName)
+            inEdge = findEdge(destinationStats["inEdges"], edgeName)
+            if outEdge == None or inEdge == None:
+                entry["reason"] = "no stats for the edge, was it fused already?"
+                continue
+            uptime = destinationStats["uptime"]
+            # What the edge costs on both ends
+            edgeTime = outEdge["sendCpuTime"] + inEdge["recvCpuTime"]
+            # Fused, the destination steps on everything the source sends
+            extraSteps = max(0, outEdge["messages"] - destinationStats["steps"])
+            extraTime = extraSteps * destinationStats["stepTime"]["mean"]
+            entry["cpuSaved"] = (edgeTime - extraTime) / uptime
+            entry["latencySaved"] = inEdge["transit"]["p50"]
+            if entry["cpuSaved"] <= 0:
+                entry["reason"] = "costs more than it saves, %s would take %d more steps" % (destination, extraSteps)
+            else:
+                candidates.append(entry)
+
+    # Fuse the edges that save the most first, into chains. Each stage's
+    # group is the chain it's in, in order, and load is how much of a CPU
+    # that chain keeps busy.
+    groups = dict([(name, [name]) for name in stages])
+    load = {}
+    for name in stages:
+        if stageStats[name] != None:
+            load[name] = stageStats[name]["busyTime"] / stageStats[name]["uptime"]
+    candidates.sort(key=lambda entry: entry["cpuSaved"], reverse=True)
+    for entry in candidates:
+        chain = groups[entry["from"]] + groups[entry["to"]]
+        head = stages[chain[0]]
+        chainLoad = load[entry["from"]] + load[entry["to"]] - entry["cpuSaved"]
+        chainStep = sum([stageStats[name]["stepTime"]["p99"] for name in chain])
+        if chainLoad > MAX_FUSED_LOAD:
+            entry["reason"] = "together they would keep a CPU %d%% busy" % (chainLoad * 100)
+        elif head["async"] and head["rate"] != None and chainStep > 1.0 / head["rate"]:
+            entry["reason"] = "a step would take %.2fms, too long for %s's %g Hz" % (chainStep * 1000,
+                chain[0], head["rate"])
+        else:
+            entry["fuse"] = True
+            entry["reason"] = "saves %.1f%% of a CPU and %.2fms" % (entry["cpuSaved"] * 100,
+                entry["latencySaved"] * 1000)
+            for name in chain:
+                groups[name] = chain
+                load[name] = chainLoad
+    return advice
+
+# Print out advice from advisePlacement, along with how much it saves in total
+def printAdvice(advice):
+    cpuSaved = 0.0
+    for entry in advice:
+        print "%-4s %-15s -> %-15s %s" % ("FUSE" if entry["fuse"] else "KEEP", entry["from"], entry["to"],
+            entry["reason"])
+        if entry["fuse"]:
+            cpuSaved += entry["cpuSaved"]
+    print "Fusing saves %.1f%% of a CPU in total" % (cpuSaved * 100)
+    latencySaved = sum([entry["latencySaved"] for entry in advice if entry["fuse"]])
+    print "and up to %.2fms of latency for data that goes through every fused edge" % (latencySaved * 1000)
+
+# Returns a copy of topology with the advice from advisePlacement applied to
+# it, that can be passed straight to launchTopology. Fused stages run with
+# the settings of the head of their chain, and a chain's budget is the
+# budgets of its stages added together.
+def applyPlacement(topology, advice):
+    stages = [dict(stage) for stage in topology["stages"]]
+    byName = dict([(stage["name"], stage) for stage in stages])
+    fused = set([(entry["from"], entry["to"]) for entry in advice if entry["fuse"]])
+    edges = []
+    for edge in topology.get("edges", []):
+        if (edge.get("from"), edge.get("to")) in fused:
+            # Fused edges aren't really edges, so they don't take options
+            edges.append({"from": edge["from"], "to": edge["to"]})
+            byName[edge["to"]]["mode"] = FUSED_MODE
+        else:
+            edges.append(dict(edge))
+    # Add up the budgets of each chain onto its head
+    heads = {}
+    for edge in edges:
+        if (edge.get("from"), edge.get("to")) in fused:
+            heads[edge["to"]] = edge["from"]
+    for name in heads:
+        if byName[name].get("budget") == None:
+            continue
+        head = heads[name]
+        while head in heads:
+            head = heads[head]
+        byName[head]["budget"] = (byName[head].get("budget") or 0.0) + byName[name]["budget"]
+    return {"stages": stages, "edges": edges}
+
+# Order the settings of a stage get written out in by formatTopology
+SETTING_ORDER = ["async", "edgeType", "rate", "mode", "fanIn", "cpus", "niceness", "budget", "seed"]
+
+def formatValue(value):
+    if isinstance(value, basestring):
+        return '"%s"' % value
+    return repr(value)
+
+# Write out a topology as the source of a Python function that returns it,
+# so it can be pasted into pipeline.py. Settings that are the same as the
+# defaults are left out. Blarghs with args get them from an argument of the
+# function called <stage name>Args.
+def formatTopology(topology, functionName="advisedTopology"):
+    imports = []
+    argNames = []
+    stageLines = []
+    for stage in topology["stages"]:
+        BlarghClass = stage["blargh"]
+        line = "from %s import %s" % (BlarghClass.__module__, BlarghClass.__name__)
+        if line not in imports:
+            imports.append(line)
+        parts = ['"name": "%s"' % stage["name"], '"blargh": %s' % BlarghClass.__name__]
+        if len(stage.get("args", [])) > 0:
+            argNames.append(stage["name"] + "Args")
+            parts.append('"args": %s' % argNames[-1])
+        for key in SETTING_ORDER:
+            if key in stage and stage[key] != STAGE_DEFAULTS[key]:
+                parts.append('"%s": %s' % (key, formatValue(stage[key])))
+        stageLines.append("{" + ", ".join(parts) + "}")
+    edgeLines = []
+    for edge in topology.get("edges", []):
+        parts = ['"from": "%s"' % edge["from"], '"to": "%s"' % edge["to"]]
+        for key in sorted(edge):
+            if key not in ("from", "to"):
+                parts.append('"%s": %s' % (key, formatValue(edge[key])))
+        edgeLines.append("{" + ", ".join(parts) + "}")
+    indent = " " * len('    return {"stages": [')
+    edgeIndent = " " * len('            "edges": [')
+    lines = imports + ["", "def %s(%s):" % (functionName, ", ".join(argNames))]
+    lines.append('    return {"stages": [' + (",\n" + indent).join(stageLines) + "],")
+    lines.append('            "edges": [' + (",\n" + edgeIndent).join(edgeLines) + "]}")
+    return "\n".join(lines)
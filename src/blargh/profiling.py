@@ -0,0 +1,36 @@
+import cProfile
+import os
+
+# Profiling runs every blargh process under cProfile, so that the whole
+# multi-process robot can be profiled without touching any blargh code. Each
+# process writes its own profile when it stops (killed by the master, Ctrl-C
+# or SIGTERM), called <blargh name>.<pid>.prof, and merge_profiles.py puts
+# them all together.
+#
+# Profiling is turned on by setting this environment variable to the
+# directory the profiles should go in (launchTopology can also set it).
+PROFILE_DIR_VARIABLE = "BLARGH_PROFILE_DIR"
+
+# Start profiling a blargh process, if profiling is turned on. Returns the
+# profiler, or None if it isn't.
+def startProfile():
+    if not os.environ.get(PROFILE_DIR_VARIABLE):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+# Stop profiling and write the profile out. Returns the path it was written to.
+def stopProfile(profiler, name):
+    profiler.disable()
+    directory = os.environ[PROFILE_DIR_VARIABLE]
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # Every process tries to make it, so it's fine if it's already there
+        if not os.path.isdir(directory):
+            raise
+    path = os.path.join(directory, "%s.%d.prof" % (name, os.getpid()))
+    profiler.dump_stats(path)
+    print "Wrote profile of", name, "to", path
+    return path
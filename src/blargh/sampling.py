@@ -0,0 +1,134 @@
+import errno
+import os
+import select
+import signal
+import sys
+import threading
+from multiprocessing import util
+
+from clock import monotonicTime
+
+# A sampling profiler that can run in every process of the robot at once
+# without throwing off their timing the way cProfile does (see profiling.py).
+# A SIGPROF timer interrupts the process every so often while it's using the
+# CPU, and the stack of every thread gets counted. Time spent blocked in
+# select() or sleeping uses no CPU, so it never shows up: the samples show
+# where the CPU time actually goes.
+#
+# Each process writes its samples to <name>.<pid>.folded in the collapsed
+# stack format flamegraph.pl takes, one "thread;outer;...;inner count" line
+# per distinct stack.
+#
+# Sampling is turned on by setting this environment variable to the
+# directory the samples should go in (setDiagnosticDirs and launchTopology in
+# topology.py can also set it). Only processes started after it's set get
+# sampled.
+SAMPLE_DIR_VARIABLE = "BLARGH_SAMPLE_DIR"
+# Samples per second of CPU time. The default is a little off from the round
+# rates the blarghs run at so the samples don't line up with their loops.
+SAMPLE_RATE_VARIABLE = "BLARGH_SAMPLE_RATE"
+DEFAULT_SAMPLE_RATE = 97
+
+# How often the samples are written out while running, in seconds, so that
+# a process that never gets killed cleanly still leaves them behind
+FLUSH_INTERVAL = 10.0
+
+class StackSampler():
+    def __init__(self, name, directory, rate):
+        self.name = name
+        self.path = os.path.join(directory, "%s.%d.folded" % (name, os.getpid()))
+        self.period = 1.0 / rate
+        self.pid = os.getpid()
+        # Number of samples of each stack, keyed by a tuple of frame names
+        # from the outermost in
+        self.counts = {}
+        self.lastFlush = monotonicTime()
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Every process tries to make it, so it's fine if it's already there
+            if not os.path.isdir(directory):
+                raise
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        # Have interrupted reads and writes carry on instead of failing
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.period, self.period)
+        # Write everything out when the process exits, even if it's never
+        # stopped properly
+        util.Finalize(self, self.write, exitpriority=0)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        self.write()
+
+    # The SIGPROF handler. frame is wherever the main thread got interrupted,
+    # the other threads are wherever they were left.
+    def sample(self, signum, frame):
+        mainThread = threading.current_thread()
+        self.count(mainThread.name, frame)
+        for ident, threadFrame in sys._current_frames().items():
+            if ident != mainThread.ident:
+                thread = threading._active.get(ident)
+                self.count(thread.name if thread != None else str(ident), threadFrame)
+        if monotonicTime() - self.lastFlush > FLUSH_INTERVAL:
+            self.write()
+
+    def count(self, threadName, frame):
+        stack = []
+        while frame != None:
+            code = frame.f_code
+            stack.append("%s (%s)" % (code.co_name, os.path.basename(code.co_filename)))
+            frame = frame.f_back
+        stack.append(threadName)
+        stack.reverse()
+        stack = tuple(stack)
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    # Write out all the samples so far, replacing whatever was written before
+    def write(self):
+        self.lastFlush = monotonicTime()
+        tempPath = self.path + ".tmp"
+        out = open(tempPath, "w")
+        for stack, count in self.counts.items():
+            out.write("%s %d\n" % (";".join(stack), count))
+        out.close()
+        os.rename(tempPath, self.path)
+
+# The sampler for this process. There can only be one, since there's only
+# one SIGPROF timer.
+sampler = None
+
+# Start sampling this process, if sampling is turned on and it isn't already
+# going. Only the main thread can handle signals, so blarghs running as
+# threads are sampled by whoever started sampling the master process.
+# Returns the sampler, or None if nothing was started.
+def startSampling(name):
+    global sampler
+    directory = os.environ.get(SAMPLE_DIR_VARIABLE)
+    if not directory or not isinstance(threading.current_thread(), threading._MainThread):
+        return None
+    # A sampler that came along when this process was forked doesn't count,
+    # the timer doesn't carry over
+    if sampler != None and sampler.pid == os.getpid():
+        return None
+    rate = float(os.environ.get(SAMPLE_RATE_VARIABLE, DEFAULT_SAMPLE_RATE))
+    sampler = StackSampler(name, directory, rate)
+    sampler.start()
+    return sampler
+
+# Stop sampling this process and write out the samples, if it's being sampled
+def stopSampling():
+    if sampler != None and sampler.pid == os.getpid():
+        sampler.stop()
+
+# select.select, except that being interrupted by a signal (like SIGPROF)
+# counts as the timeout running out instead of being an error
+def selectInterruptible(readables, timeout=None):
+    try:
+        return select.select(readables, [], [], timeout)[0]
+    except select.error, e:
+        if e.args[0] != errno.EINTR:
+            raise
+        return []
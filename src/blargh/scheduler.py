@@ -0,0 +1,78 @@
+import math
+
+# Keeps an async blargh stepping at a fixed rate. Tick deadlines are always
+# start + n * period rather than "last tick + period", so small delays don't
+# add up into drift. If a step runs so long that whole ticks go by, those
+# ticks are skipped (and counted) rather than run back to back to catch up.
+class TickScheduler():
+    def __init__(self, rate):
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.nextTick = None
+
+        # How many ticks actually ran
+        self.ticks = 0
+        # How many times we fell a whole period (or more) behind, and how
+        # many ticks got skipped because of it
+        self.overruns = 0
+        self.missedTicks = 0
+        # How late ticks ran compared to their deadline, in seconds
+        self.worstLateness = 0.0
+        self.sumLateness = 0.0
+        self.sumSquaredLateness = 0.0
+
+    # Change how many times per second ticks are due. The next deadline stays
+    # where it is, the new period starts after it.
+    def setRate(self, rate):
+        self.rate = rate
+        self.period = 1.0 / rate
+
+    # Set the first deadline. Call this once, right before the loop starts.
+    def start(self, now):
+        self.nextTick = now
+
+    # Returns how long until the next tick is due (0 if it already is)
+    def timeUntilTick(self, now):
+        return max(0.0, self.nextTick - now)
+
+    def isDue(self, now):
+        return now >= self.nextTick
+
+    # Record that a due tick is being run now and move on to the next deadline
+    def tick(self, now):
+        lateness = now - self.nextTick
+        self.ticks += 1
+        self.worstLateness = max(self.worstLateness, lateness)
+        self.sumLateness += lateness
+        self.sumSquaredLateness += lateness * lateness
+
+        self.nextTick += self.period
+        if self.nextTick <= now:
+            # We're more than a whole period behind, skip the ticks we missed
+            missed = int((now - self.nextTick) / self.period) + 1
+            self.overruns += 1
+            self.missedTicks += missed
+            self.nextTick += missed * self.period
+
+    # Average lateness of a tick, in seconds
+    def meanLateness(self):
+        if self.ticks == 0:
+            return 0.0
+        return self.sumLateness / self.ticks
+
+    # Jitter is the standard deviation of the lateness, in seconds
+    def jitter(self):
+        if self.ticks == 0:
+            return 0.0
+        mean = self.meanLateness()
+        return math.sqrt(max(0.0, self.sumSquaredLateness / self.ticks - mean * mean))
+
+    # All the numbers above in one dictionary
+    def getStats(self):
+        return {"rate": self.rate,
+                "ticks": self.ticks,
+                "overruns": self.overruns,
+                "missedTicks": self.missedTicks,
+                "worstLateness": self.worstLateness,
+                "meanLateness": self.meanLateness(),
+                "jitter": self.jitter()}
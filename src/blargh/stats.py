@@ -0,0 +1,211 @@
+import json
+import math
+import os
+
+import cpu
+from clock import monotonicTime
+from tracing import RollingWindow
+
+# A histogram of durations with buckets that grow by a constant factor, so it
+# can cover everything from microseconds to minutes in a small fixed amount of
+# memory. Percentiles come back as the upper edge of the bucket they land in,
+# which is never off by more than the growth factor.
+class Histogram():
+    # Smallest bucket edge in seconds and how much each bucket grows by
+    MIN_VALUE = 1e-6
+    GROWTH = 1.25
+    NUM_BUCKETS = 100
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.buckets[self.bucketFor(value)] += 1
+
+    def bucketFor(self, value):
+        if value <= self.MIN_VALUE:
+            return 0
+        index = int(math.ceil(math.log(value / self.MIN_VALUE, self.GROWTH)))
+        return min(index, self.NUM_BUCKETS - 1)
+
+    def bucketTop(self, index):
+        return self.MIN_VALUE * self.GROWTH ** index
+
+    # Returns the value that fraction (0 to 1) of everything added is below
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0.0
+        needed = fraction * self.count
+        seen = 0
+        for i in range(self.NUM_BUCKETS):
+            seen += self.buckets[i]
+            if seen >= needed:
+                # The last bucket is open ended, and nothing is above max
+                return min(self.bucketTop(i), self.max)
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def summary(self):
+        return {"count": self.count,
+                "mean": self.mean(),
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "max": self.max}
+
+# All the performance counters for one blargh process. blarghProcess fills
+# these in as it runs and sends back a snapshot when the master asks for one.
+class BlarghStats():
+    def __init__(self, name, inPipes, outPipes):
+        self.name = name
+        self.inPipes = inPipes
+        self.outPipes = outPipes
+        self.steps = 0
+        self.stepTimes = Histogram()
+        self.messagesIn = [0] * len(inPipes)
+        self.messagesOut = [0] * len(outPipes)
+        # CPU time spent in send and waitAck on each outPipe, and in recv on
+        # each inPipe. This is what serializing and passing messages between
+        # processes costs.
+        self.sendCpuTimes = [0.0] * len(outPipes)
+        self.recvCpuTimes = [0.0] * len(inPipes)
+        # How long messages took to get here on each inPipe, from the blargh
+        # that sent them finishing its step to us receiving them
+        self.transit = [RollingWindow() for pipe in inPipes]
+        # Messages that were received but never stepped on by themselves,
+        # because of the fan in policy
+        self.coalesced = 0
+        # Messages that were skipped because we were overloaded
+        self.shed = 0
+        # Time spent sleeping with nothing to do
+        self.idleTime = 0.0
+
+    def recordStep(self, duration):
+        self.steps += 1
+        self.stepTimes.add(duration)
+
+    # Everything as a plain dictionary that can be sent down a pipe. scheduler
+    # is the process's TickScheduler, if it has one, latency is its
+    # LatencyTracker and overload is its OverloadMonitor, if it has a budget.
+    def snapshot(self, uptime, scheduler=None, latency=None, overload=None):
+        inEdges = []
+        for i in range(len(self.inPipes)):
+            inEdges.append({"name": self.inPipes[i].name,
+                            "messages": self.messagesIn[i],
+                            "dropped": self.inPipes[i].dropped(),
+                            "expired": self.inPipes[i].expired(),
+                            "recvCpuTime": self.recvCpuTimes[i],
+                            "transit": self.transit[i].summary()})
+        outEdges = []
+        for i in range(len(self.outPipes)):
+            outEdges.append({"name": self.outPipes[i].name,
+                             "messages": self.messagesOut[i],
+                             "dropped": self.outPipes[i].dropped(),
+                             "waitTime": self.outPipes[i].waitTime(),
+                             "sendCpuTime": self.sendCpuTimes[i]})
+        stats = {"name": self.name,
+                 "uptime": uptime,
+                 "steps": self.steps,
+                 "stepTime": self.stepTimes.summary(),
+                 "inEdges": inEdges,
+                 "outEdges": outEdges,
+                 # Time spent waiting for the other end of outPipes to
+                 # take messages
+                 "ackWaitTime": sum([edge["waitTime"] for edge in outEdges]),
+                 "idleTime": self.idleTime,
+                 "busyTime": uptime - self.idleTime,
+                 "dropped": sum([edge["dropped"] for edge in inEdges]),
+                 "expired": sum([edge["expired"] for edge in inEdges]),
+                 "coalesced": self.coalesced,
+                 "shed": self.shed}
+        # Where and how greedily we're running (see BlarghProcessStarter)
+        try:
+            stats["cpus"] = cpu.getAffinity(0)
+            stats["niceness"] = cpu.getNiceness(0)
+        except OSError:
+            stats["cpus"] = None
+            stats["niceness"] = None
+        if scheduler != None:
+            stats["schedule"] = scheduler.getStats()
+        if latency != None:
+            stats["latency"] = latency.summary()
+        if overload != None:
+            stats["overload"] = overload.getStats(monotonicTime())
+        return stats
+
+# Print out a snapshot (as returned by BlarghMaster.stats) in a readable way
+def printStats(stats):
+    stepTime = stats["stepTime"]
+    print "%s: %d steps, step time p50 %.2fms p99 %.2fms max %.2fms" % (
+        stats["name"], stats["steps"], stepTime["p50"] * 1000,
+        stepTime["p99"] * 1000, stepTime["max"] * 1000)
+    print "    busy %.2fs, idle %.2fs, waiting on acks %.2fs, %d dropped, %d coalesced" % (
+        stats["busyTime"], stats["idleTime"], stats["ackWaitTime"], stats["dropped"], stats["coalesced"])
+    if stats["cpus"] != None:
+        print "    on cpus %s, niceness %d" % (",".join([str(c) for c in stats["cpus"]]), stats["niceness"])
+    for edge in stats["inEdges"]:
+        print "    in  %-30s %8d messages %8d dropped %8d expired %6.2fs receiving, transit p50 %.2fms" % (
+            edge["name"], edge["messages"], edge["dropped"], edge["expired"], edge["recvCpuTime"],
+            edge["transit"]["p50"] * 1000)
+    for edge in stats["outEdges"]:
+        print "    out %-30s %8d messages %8d dropped %6.2fs waiting %6.2fs sending" % (edge["name"],
+            edge["messages"], edge["dropped"], edge["waitTime"], edge["sendCpuTime"])
+    if "schedule" in stats:
+        schedule = stats["schedule"]
+        print "    %g Hz: %d ticks, %d overruns, worst lateness %.2fms, jitter %.2fms" % (
+            schedule["rate"], schedule["ticks"], schedule["overruns"],
+            schedule["worstLateness"] * 1000, schedule["jitter"] * 1000)
+    if "overload" in stats:
+        overload = stats["overload"]
+        print "    budget %.2fms, mean step %.2fms, %s, %d overloads, %.2fs degraded, %d shed" % (
+            overload["budget"] * 1000, overload["meanStepTime"] * 1000,
+            "degraded" if overload["degraded"] else "normal", overload["overloads"],
+            overload["degradedTime"], stats["shed"])
+    if "latency" in stats:
+        latency = stats["latency"]
+        if latency["age"]["count"] > 0:
+            printWindow("input age", latency["age"])
+        if "total" in latency:
+            printWindow("sensor to here", latency["total"])
+            for name, window in latency["stages"].items():
+                printWindow("  " + name, window)
+
+# Print one RollingWindow summary (see tracing.py) in milliseconds
+def printWindow(label, window):
+    print "    %-30s p50 %7.2fms p90 %7.2fms p99 %7.2fms max %7.2fms (%d samples)" % (
+        label, window["p50"] * 1000, window["p90"] * 1000, window["p99"] * 1000,
+        window["max"] * 1000, window["count"])
+
+# Snapshots can also be saved to disk when each blargh process stops, so
+# that a whole run can be looked at afterwards (see placement.py). Each one
+# goes in <blargh name>.<pid>.json. Saving is turned on by setting this
+# environment variable to the directory they should go in (launchTopology
+# can also set it).
+STATS_DIR_VARIABLE = "BLARGH_STATS_DIR"
+
+# Save a snapshot, if saving is turned on. Returns the path it was saved to,
+# or None if it wasn't.
+def saveStats(stats):
+    directory = os.environ.get(STATS_DIR_VARIABLE)
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # Every process tries to make it, so it's fine if it's already there
+        if not os.path.isdir(directory):
+            raise
+    path = os.path.join(directory, "%s.%d.json" % (stats["name"], os.getpid()))
+    out = open(path, "w")
+    json.dump(stats, out, indent=1)
+    out.close()
+    return path
@@ -0,0 +1,224 @@
+import mmap
+import os
+import struct
+import time
+from exceptions import ValueError
+
+import codec
+from blargh import Batch
+from clock import monotonicTime
+from stats import Histogram
+
+# Tapes record every step a blargh process takes on its inputs, so that the
+# blargh can be fed the exact same inputs again later without the rest of the
+# robot (see replay.py). Each record is one step, the way the process's fan
+# in policy put it together: one message, a Batch of messages, something the
+# blargh sampled itself (see Blargh.sample), or a scheduled tick with no
+# input. Messages that never got stepped on (like the ones
+# FAN_IN_LATEST skips) aren't on the tape.
+#
+# Recording is turned on by setting this environment variable to the
+# directory the tapes should go in. Each blargh process writes its own tape
+# called <blargh name>.<pid>.tape.
+TAPE_DIR_VARIABLE = "BLARGH_TAPE_DIR"
+
+# Tape file format: the MAGIC string, followed by records. Every record is a
+# RECORD_HEADER followed by length bytes of payload. A record kind of '\0'
+# (or the end of the file) means there are no more records, so a tape from a
+# process that died without closing it properly can still be read.
+MAGIC = "BLARGHTAPE3\n"
+RECORD_HEADER = struct.Struct("<cdhI")
+# Record kinds
+# Names an edge: the edge field is its index and the payload is its name.
+# These all come first.
+EDGE_RECORD = "E"
+# A step on one message received on an edge, with the payload encoded by
+# codec.py
+MESSAGE_RECORD = "M"
+# A step on a Batch of messages, which can each be from a different edge.
+# The edge field is how many messages there are, and the payload is each of
+# them as a BATCH_ENTRY (edge index, length) followed by the message encoded
+# by codec.py.
+BATCH_RECORD = "B"
+BATCH_ENTRY = struct.Struct("<hI")
+# A step on what the blargh's sample() returned, with the payload encoded by
+# codec.py
+SAMPLE_RECORD = "S"
+# A scheduled step with no input (from an async blargh with a rate)
+TICK_RECORD = "T"
+END_RECORD = "\0"
+
+# Edge indices used for tick and sample records
+TICK_EDGE = -1
+SAMPLE_EDGE = -2
+
+# Open a tape for a blargh process, if recording is turned on. Returns None
+# if it isn't.
+def openTape(name, inPipes):
+    directory = os.environ.get(TAPE_DIR_VARIABLE)
+    if not directory:
+        return None
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, "%s.%d.tape" % (name, os.getpid()))
+    print "Recording", name, "to", path
+    return TapeWriter(path, [pipe.name for pipe in inPipes])
+
+# Writes a tape through a memory map of the file, growing it a chunk at a
+# time so that appending a record is normally just a copy into memory.
+class TapeWriter():
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path, edgeNames):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.map = None
+        self.size = 0
+        self.offset = 0
+        self.append(MAGIC)
+        for i in range(len(edgeNames)):
+            self.writeRecord(EDGE_RECORD, 0.0, i, edgeNames[i])
+
+    def recordMessage(self, edgeIndex, message):
+        self.writeRecord(MESSAGE_RECORD, monotonicTime(), edgeIndex, codec.encode(message))
+
+    # edgeIndices is which edge each message in batch came in on
+    def recordBatch(self, edgeIndices, batch):
+        payload = []
+        for i in range(len(batch)):
+            data = codec.encode(batch[i])
+            payload.append(BATCH_ENTRY.pack(edgeIndices[i], len(data)))
+            payload.append(data)
+        self.writeRecord(BATCH_RECORD, monotonicTime(), len(batch), "".join(payload))
+
+    def recordSample(self, message):
+        self.writeRecord(SAMPLE_RECORD, monotonicTime(), SAMPLE_EDGE, codec.encode(message))
+
+    def recordTick(self):
+        self.writeRecord(TICK_RECORD, monotonicTime(), TICK_EDGE, "")
+
+    def writeRecord(self, kind, timestamp, edgeIndex, payload):
+        self.append(RECORD_HEADER.pack(kind, timestamp, edgeIndex, len(payload)) + payload)
+
+    def append(self, data):
+        if self.offset + len(data) > self.size:
+            self.grow(len(data))
+        self.map[self.offset:self.offset + len(data)] = data
+        self.offset += len(data)
+
+    # Make the file (and the map) bigger by at least needed bytes
+    def grow(self, needed):
+        chunks = (self.offset + needed - self.size) / self.CHUNK_SIZE + 1
+        self.size += chunks * self.CHUNK_SIZE
+        if self.map != None:
+            self.map.close()
+        self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    # Flush everything out and cut the file down to what was actually written
+    def close(self):
+        if self.map != None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+        self.file.truncate(self.offset)
+        self.file.close()
+
+# Reads a tape back. edgeNames is the list of edge names in index order, and
+# records() gives back (kind, timestamp, edgeIndex, message) for every
+# message, batch, sample and tick record, in the order they were recorded. For a
+# batch, message is the Batch and edgeIndex is the list of which edge each
+# message in it came in on.
+class TapeReader():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[0:len(MAGIC)] != MAGIC:
+            print path, "isn't a blargh tape (or it's from an older version)"
+            raise ValueError
+        self.edgeNames = []
+        self.start = len(MAGIC)
+        for kind, timestamp, edgeIndex, payload, end in self.rawRecords(self.start):
+            if kind != EDGE_RECORD:
+                break
+            self.edgeNames.append(payload)
+            self.start = end
+
+    def rawRecords(self, offset):
+        while offset + RECORD_HEADER.size <= len(self.map):
+            kind, timestamp, edgeIndex, length = RECORD_HEADER.unpack_from(self.map, offset)
+            if kind == END_RECORD:
+                return
+            payloadStart = offset + RECORD_HEADER.size
+            offset = payloadStart + length
+            yield kind, timestamp, edgeIndex, self.map[payloadStart:offset], offset
+
+    def records(self):
+        for kind, timestamp, edgeIndex, payload, end in self.rawRecords(self.start):
+            if kind == MESSAGE_RECORD or kind == SAMPLE_RECORD:
+                yield kind, timestamp, edgeIndex, codec.decode(payload)
+            elif kind == BATCH_RECORD:
+                edgeIndices, batch = self.decodeBatch(edgeIndex, payload)
+                yield kind, timestamp, edgeIndices, batch
+            elif kind == TICK_RECORD:
+                yield kind, timestamp, edgeIndex, None
+
+    def decodeBatch(self, count, payload):
+        edgeIndices = []
+        batch = Batch()
+        offset = 0
+        for i in range(count):
+            edgeIndex, length = BATCH_ENTRY.unpack_from(payload, offset)
+            offset += BATCH_ENTRY.size
+            edgeIndices.append(edgeIndex)
+            batch.append(codec.decode(payload[offset:offset + length]))
+            offset += length
+        return edgeIndices, batch
+
+    def edgeName(self, edgeIndex):
+        if edgeIndex == TICK_EDGE:
+            return "tick"
+        if edgeIndex == SAMPLE_EDGE:
+            return "sample"
+        return self.edgeNames[edgeIndex]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# Feed everything on a tape into blargh.step, in order, one step per record.
+# If realTime is True, the steps are spaced out the same way they were when
+# the tape was recorded, otherwise they happen as fast as possible. edges is
+# a list of edge names to replay (None means all of them), batches keep only
+# the messages from those edges. Returns a dictionary of how it went, with
+# the step times summarized like in BlarghStats.
+def replayTape(path, blargh, realTime=False, edges=None):
+    tape = TapeReader(path)
+    stepTimes = Histogram()
+    outputs = 0
+    firstTimestamp = None
+    replayStart = monotonicTime()
+    for kind, timestamp, edgeIndex, message in tape.records():
+        if edges != None and kind == BATCH_RECORD:
+            message = Batch([message[i] for i in range(len(message)) if tape.edgeName(edgeIndex[i]) in edges])
+            if len(message) == 0:
+                continue
+        elif edges != None and tape.edgeName(edgeIndex) not in edges:
+            continue
+        if firstTimestamp == None:
+            firstTimestamp = timestamp
+        if realTime:
+            delay = (timestamp - firstTimestamp) - (monotonicTime() - replayStart)
+            if delay > 0:
+                time.sleep(delay)
+        stepStart = monotonicTime()
+        output = blargh.step(message)
+        stepTimes.add(monotonicTime() - stepStart)
+        if output != None:
+            outputs += 1
+    tape.close()
+    return {"steps": stepTimes.count,
+            "outputs": outputs,
+            "totalTime": monotonicTime() - replayStart,
+            "stepTime": stepTimes.summary()}
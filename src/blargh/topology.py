@@ -0,0 +1,111 @@
+import os
+from exceptions import ValueError
+
+from blargh_process import BlarghProcessStarter, cascadeBlarghProcesses, startAllBlarghProcesses, printStartupTimes, PROCESS_MODE, FAN_IN_ORDER
+from edges import PIPE_EDGE
+from profiling import PROFILE_DIR_VARIABLE
+from sampling import SAMPLE_DIR_VARIABLE, startSampling
+from stats import STATS_DIR_VARIABLE
+
+# A topology describes a whole pipeline of blarghs as a plain dictionary, so
+# that it can be written down once and launched by launchTopology instead of
+# wiring up BlarghProcessStarters by hand. It looks like:
+#
+#   {"stages": [{"name": "input", "blargh": InputBlargh, "args": [wrapper],
+#                "async": True, "rate": 50},
+#               {"name": "world", "blargh": WorldBlargh, "async": True},
+#               ...],
+#    "edges": [{"from": "input", "to": "world"},
+#              {"from": "world", "to": "behavior", "edgeType": MAILBOX_EDGE},
+#              ...]}
+#
+# Stages take the same settings as BlarghProcessStarter: blargh is the
+# BlarghClass, and args, async, edgeType, rate, mode, fanIn, cpus, niceness,
+# budget and seed are optional.
+# Edges are cascaded in the order they're listed, and anything other than
+# from and to (edgeType, window, capacity, maxAge, ...) is passed on to
+# cascadeBlarghProcesses. An edge can also connect a stage to something
+# outside of the topology, by giving an inEnd instead of from, or an outEnd
+# instead of to (the ends of an edge made with createEdge, see edges.py).
+
+# Settings a stage can have, and what they are if they're left out
+STAGE_DEFAULTS = {"args": [], "async": False, "edgeType": PIPE_EDGE, "rate": None, "mode": PROCESS_MODE,
+                  "fanIn": FAN_IN_ORDER, "cpus": None, "niceness": None,
+                  "budget": None, "seed": None}
+STAGE_REQUIRED = ["name", "blargh"]
+
+# Turn a topology into BlarghProcessStarters with all their edges connected.
+# Returns a list of (stage name, BlarghProcessStarter), in the same order as
+# the stages.
+def buildTopology(topology):
+    starters = []
+    byName = {}
+    for stage in topology["stages"]:
+        for key in STAGE_REQUIRED:
+            if key not in stage:
+                print "Stage", stage, "has no", key
+                raise ValueError
+        for key in stage:
+            if key not in STAGE_DEFAULTS and key not in STAGE_REQUIRED:
+                print "Stage", stage["name"], "has an unknown setting", key
+                raise ValueError
+        if stage["name"] in byName:
+            print "There's more than one stage called", stage["name"]
+            raise ValueError
+        settings = dict(STAGE_DEFAULTS)
+        settings.update(stage)
+        bps = BlarghProcessStarter(settings["blargh"], settings["args"], settings["async"],
+                                   settings["edgeType"], settings["rate"], settings["mode"], settings["fanIn"],
+                                   settings["cpus"], settings["niceness"], settings["budget"], settings["seed"])
+        starters.append((stage["name"], bps))
+        byName[stage["name"]] = bps
+
+    for edge in topology.get("edges", []):
+        options = dict(edge)
+        source = options.pop("from", None)
+        destination = options.pop("to", None)
+        inEnd = options.pop("inEnd", None)
+        outEnd = options.pop("outEnd", None)
+        for stageName in (source, destination):
+            if stageName not in byName and not (stageName == None and (inEnd != None or outEnd != None)):
+                print "Edge", edge, "connects to unknown stage", stageName
+                raise ValueError
+        if inEnd != None:
+            byName[destination].addInPipe(inEnd)
+        elif outEnd != None:
+            byName[source].addOutPipe(outEnd)
+        else:
+            cascadeBlarghProcesses(byName[source], byName[destination], **options)
+    return starters
+
+# Turn on profiling (see profiling.py), stack sampling (see sampling.py) or
+# saving stats (see stats.py) for every process started after this, with
+# whatever each of them writes going in the given directory. Processes that
+# were already forked don't see it, so call this before creating the arduino
+# or simulator interface if they should be sampled too.
+def setDiagnosticDirs(profileDir=None, sampleDir=None, statsDir=None):
+    if profileDir != None:
+        os.environ[PROFILE_DIR_VARIABLE] = profileDir
+    if sampleDir != None:
+        os.environ[SAMPLE_DIR_VARIABLE] = sampleDir
+    if statsDir != None:
+        os.environ[STATS_DIR_VARIABLE] = statsDir
+
+# Build a topology and start every stage of it at once. Nothing starts
+# stepping until every stage has finished initializing, and then how long
+# each one took to get ready is printed out. timeout is how many seconds to
+# wait for that (None means forever). If profileDir is given, every stage is
+# profiled and writes its profile there when it stops. If sampleDir is
+# given, every stage and this process (along with any stages running as
+# threads in it) have their stacks sampled, and the samples go there. Only
+# processes started from here on see it though, so to sample the arduino or
+# simulator interface too, use setDiagnosticDirs before creating it. If
+# statsDir is given, every stage saves its stats there when it stops.
+# Returns the BlarghMasters.
+def launchTopology(topology, timeout=None, profileDir=None, sampleDir=None, statsDir=None):
+    setDiagnosticDirs(profileDir, sampleDir, statsDir)
+    startSampling("master")
+    starters = buildTopology(topology)
+    blarghMasters = startAllBlarghProcesses([bps for stageName, bps in starters], timeout)
+    printStartupTimes(blarghMasters)
+    return blarghMasters
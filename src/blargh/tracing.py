@@ -0,0 +1,134 @@
+import heapq
+import struct
+from collections import deque, OrderedDict
+
+# Latency tracing follows data from where it was sampled (a blargh with no
+# inputs, like InputBlargh or VisionBlargh) all the way to where it ends up
+# (a blargh with no outputs, like ControlBlargh). Every message carries a
+# trace along with it: (origin, hops), where origin is the monotonic time the
+# data was sampled, and hops is a tuple of (stage name, step start, step end)
+# for every blargh the data has been through. Blarghs themselves never see
+# any of this, blarghProcess takes care of it.
+#
+# When a blargh steps with no input (an async blargh ticking), its output
+# carries on the trace of the newest input it got, since that's the data its
+# state is based on. Blarghs with no inputs start a brand new trace instead,
+# from the step, or from Blargh.sampledAt if the blargh set it.
+
+# Wire format for a trace: hop count (NO_TRACE if there's no trace) and
+# origin, then for each hop its start, end and name length, then the name
+TRACE_HEADER = struct.Struct("<Bd")
+HOP_HEADER = struct.Struct("<ddB")
+NO_TRACE = 0xFF
+# Only the last MAX_HOPS hops are kept, in case data goes around in a loop
+MAX_HOPS = 32
+
+# Turn a trace into bytes. Returns a string.
+def encodeTrace(trace):
+    if trace == None:
+        return TRACE_HEADER.pack(NO_TRACE, 0.0)
+    origin, hops = trace
+    parts = [TRACE_HEADER.pack(len(hops), origin)]
+    for name, start, end in hops:
+        parts.append(HOP_HEADER.pack(start, end, len(name)))
+        parts.append(name)
+    return "".join(parts)
+
+# Read a trace back out of data, starting at offset. Returns the trace and
+# the offset just after it.
+def decodeTrace(data, offset=0):
+    numHops, origin = TRACE_HEADER.unpack_from(data, offset)
+    offset += TRACE_HEADER.size
+    if numHops == NO_TRACE:
+        return None, offset
+    hops = []
+    for i in range(numHops):
+        start, end, nameLength = HOP_HEADER.unpack_from(data, offset)
+        offset += HOP_HEADER.size
+        hops.append((data[offset:offset + nameLength], start, end))
+        offset += nameLength
+    return (origin, tuple(hops)), offset
+
+# Returns a new trace with one more hop on the end
+def addHop(trace, name, start, end):
+    origin, hops = trace
+    return (origin, hops[-(MAX_HOPS - 1):] + ((name, start, end),))
+
+# Keeps the last size values around so that percentiles can be worked out
+# over a rolling window
+class RollingWindow():
+    def __init__(self, size=1000):
+        self.values = deque(maxlen=size)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def summary(self):
+        values = sorted(self.values)
+        if len(values) == 0:
+            return {"count": 0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+        def percentile(fraction):
+            return values[min(len(values) - 1, int(fraction * len(values)))]
+        return {"count": len(values),
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+                "max": values[-1]}
+
+# Keeps track of the latencies seen by one blargh process. Every process
+# keeps track of how old its inputs are. Processes at the end of the
+# pipeline also break the total latency down stage by stage, and keep the
+# full traces of the slowest iterations.
+class LatencyTracker():
+    def __init__(self, isSink, numSlowest=10):
+        self.isSink = isSink
+        self.numSlowest = numSlowest
+        # How old inputs are when they get here
+        self.age = RollingWindow()
+        # Sensor to actuator latency, and how much of it each stage took
+        self.total = RollingWindow()
+        self.stages = OrderedDict()
+        # Heap of (total latency, trace) for the slowest iterations
+        self.slowest = []
+        # Trace of the newest input received
+        self.latestTrace = None
+
+    def recordInput(self, trace, receivedAt):
+        self.age.add(receivedAt - trace[0])
+
+    # Record a trace that has made it all the way through the pipeline
+    def recordComplete(self, trace):
+        origin, hops = trace
+        total = hops[-1][2] - origin
+        self.total.add(total)
+        # Each stage is responsible for the time between the previous stage
+        # finishing and it finishing, including sitting in queues
+        previousEnd = origin
+        for name, start, end in hops:
+            if name not in self.stages:
+                self.stages[name] = RollingWindow()
+            self.stages[name].add(end - previousEnd)
+            previousEnd = end
+        if len(self.slowest) < self.numSlowest:
+            heapq.heappush(self.slowest, (total, trace))
+        elif total > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (total, trace))
+
+    def summary(self):
+        summary = {"age": self.age.summary()}
+        if self.isSink:
+            summary["total"] = self.total.summary()
+            summary["stages"] = OrderedDict([(name, window.summary()) for name, window in self.stages.items()])
+        return summary
+
+    # The slowest traces seen, slowest first
+    def slowestTraces(self):
+        return sorted(self.slowest, reverse=True)
+
+# Print out traces (as returned by BlarghMaster.slowestTraces) hop by hop,
+# with all the times in milliseconds since the data was sampled
+def printTraces(traces):
+    for total, (origin, hops) in traces:
+        print "%.2fms total:" % (total * 1000)
+        for name, start, end in hops:
+            print "    %-30s start %8.2fms end %8.2fms" % (name, (start - origin) * 1000, (end - origin) * 1000)
@@ -1,6 +1,11 @@
-from blargh import Blargh
+import struct
+
+from blargh import Blargh, codec
 from exceptions import Exception
 
+# The key InputBlargh's outputs start with, (INPUT_MESSAGE, (bumpData, irData))
+INPUT_MESSAGE = 1
+
 # Gets input from the arduinoInterfaceInputWrapper and possibly processes it
 # to some degree
 class InputBlargh(Blargh):
@@ -9,7 +14,8 @@ class InputBlargh(Blargh):
         self.ardInWrapper = arduinoInterfaceWrapper
         
 
-    # Get input from aiw and possible process it
+    # Get input from aiw and possible process it. In lock-step mode (see
+    # blargh/lockstep.py) inp is the simulated time, which gets passed on.
     def step(self, inp):
         bumpData = BumpSensorData()
         irData = IRData()
@@ -19,7 +25,9 @@ class InputBlargh(Blargh):
         irData.leftFront = self.ardInWrapper.getIRDist(0)
         irData.leftSide = self.ardInWrapper.getIRDist(1)
         #print irData.left, irData.right
-        return (1, (bumpData, irData))
+        if inp != None:
+            return (INPUT_MESSAGE, (bumpData, irData, inp))
+        return (INPUT_MESSAGE, (bumpData, irData))
 
 class BumpSensorData():
     left = False
@@ -34,4 +42,29 @@ class IRData():
     def __init__(self):
         pass
 
+# How sensor data gets sent between blargh processes (see blargh/codec.py)
+BUMP_SCHEMA = codec.ObjectSchema(BumpSensorData,
+    [("left", codec.BOOL), ("right", codec.BOOL), ("front", codec.BOOL), ("back", codec.BOOL),
+     ("power", codec.BOOL)])
+IR_SCHEMA = codec.ObjectSchema(IRData,
+    [("left", codec.NUMBER), ("right", codec.NUMBER), ("leftFront", codec.NUMBER),
+     ("leftSide", codec.NUMBER)])
+INPUT_STRUCT = struct.Struct("<c" + BUMP_SCHEMA.format + IR_SCHEMA.format)
+
+def encodeInput(message):
+    key, data = message
+    # Inputs carrying a lock-step time get pickled
+    if type(data) is not tuple or len(data) != 2:
+        raise codec.CantEncode
+    values = ["I"]
+    BUMP_SCHEMA.flatten(data[0], values)
+    IR_SCHEMA.flatten(data[1], values)
+    return INPUT_STRUCT.pack(*values)
+
+def decodeInput(data):
+    values = INPUT_STRUCT.unpack(data)
+    bumpData, i = BUMP_SCHEMA.unflatten(values, 1)
+    irData, i = IR_SCHEMA.unflatten(values, i)
+    return (INPUT_MESSAGE, (bumpData, irData))
 
+codec.registerKeyed(INPUT_MESSAGE, "I", encodeInput, decodeInput)
@@ -6,19 +6,24 @@ import os
 import time
 
 from blargh.blargh_process import *
+from blargh.topology import launchTopology, setDiagnosticDirs
+from pipeline import robotTopology
 from vision import VisionBlargh
-from world import WorldBlargh
-from behavior import BehaviorBlargh
-from control import ControlBlargh
-from input import InputBlargh
+from world.blackboard import WorldBlackboard, worldBlackboardPath
 
 from arduino import createArduinoInterface, ArduinoInterfaceWrapper
 
 # This is the master process, it should control everything. It's also
 # what should get called to run this whole thing.
+#   python main.py --sample <dir>
+# samples the stacks of every process into dir (see blargh/sampling.py).
 
 
 if __name__ == "__main__":
+    # Has to be set before anything is forked, so the arduino interface gets
+    # sampled too
+    if "--sample" in sys.argv:
+        setDiagnosticDirs(sampleDir=sys.argv[sys.argv.index("--sample") + 1])
 
     # Create the arduino interface
     masterConn, inputConn, controlConn = createArduinoInterface(3)
@@ -26,7 +31,7 @@ if __name__ == "__main__":
     arduinoControlWrapper = ArduinoInterfaceWrapper(controlConn)
 
     '''
-    Example for creating blargh structure:
+    Example for creating blargh structure by hand:
     b1 = ExampleBlargh1()
     b2 = ExampleBlargh2()
     b12 = CascadeBlargh(b1, b2)
@@ -39,22 +44,21 @@ if __name__ == "__main__":
     so it will wait for actual inputs coming in through the pipe to
     step b3.
     '''
-    #Create the structure for checkpoint 4.
-    input = BlarghProcessStarter( InputBlargh, [arduinoInputWrapper], True )
-    vision = BlarghProcessStarter( VisionBlargh, [], True )
-    world = BlarghProcessStarter( WorldBlargh, [], True) #Async for Odometry purposes.
-    behavior = BlarghProcessStarter( BehaviorBlargh, [], False) #Async because this has timeouts, etc.
-    control = BlarghProcessStarter( ControlBlargh, [arduinoControlWrapper], True )
-
-
-    cascadeBlarghProcesses(input, world);
-    cascadeBlarghProcesses(vision, world)
-    cascadeBlarghProcesses(world, behavior)
-    cascadeBlarghProcesses(behavior, control)
-    #Start Everything, and store it in a ist.
-    processes = [input.start(), vision.start(), world.start(), behavior.start(), control.start()]
-
-    # Wait for everything else to die before quitting
-    joinAllBlarghProcesses(processes)
+    # Create the blackboard the world gets published on, before anything
+    # that reads it starts
+    WorldBlackboard(worldBlackboardPath(), create=True)
+
+    # Create the structure for checkpoint 4 and start everything at once.
+    # Data only starts flowing once every blargh is ready.
+    topology = robotTopology([arduinoInputWrapper], VisionBlargh, [], [arduinoControlWrapper], worldBlackboardPath())
+    processes = launchTopology(topology)
+
+    # Wait for everything else to die before quitting. Ctrl-C stops every
+    # blargh process on its own (they get it too), but any that didn't get
+    # it, like ones running as threads, still need to be told.
+    try:
+        joinAllBlarghProcesses(processes)
+    except KeyboardInterrupt:
+        killAllBlarghProcesses(processes)
 
         
@@ -0,0 +1,60 @@
+import sys
+sys.path.append("../lib")
+
+import glob
+import os
+import pstats
+
+# Merges the profiles written by blarghs run with profiling turned on (see
+# blargh/profiling.py) into one report, sorted by where the time went across
+# all the processes. Record profiles by running main.py or simulated_main.py
+# with BLARGH_PROFILE_DIR set and stopping it with Ctrl-C, then for example:
+#   python merge_profiles.py profiles
+#   python merge_profiles.py profiles/WorldBlargh.*.prof --sort tottime --limit 50
+
+SORT_KEYS = ["cumulative", "tottime", "calls", "ncalls", "name", "file"]
+DEFAULT_SORT = "cumulative"
+DEFAULT_LIMIT = 30
+
+# Turn the arguments into a list of profile files. Directories stand for all
+# the profiles in them.
+def findProfiles(paths):
+    profiles = []
+    for path in paths:
+        if os.path.isdir(path):
+            profiles.extend(sorted(glob.glob(os.path.join(path, "*.prof"))))
+        else:
+            profiles.append(path)
+    return profiles
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sort = DEFAULT_SORT
+    limit = DEFAULT_LIMIT
+    paths = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--sort" and i + 1 < len(args):
+            sort = args[i + 1]
+            i += 2
+        elif args[i] == "--limit" and i + 1 < len(args):
+            limit = int(args[i + 1])
+            i += 2
+        else:
+            paths.append(args[i])
+            i += 1
+    profiles = findProfiles(paths)
+    if len(profiles) == 0 or sort not in SORT_KEYS:
+        print "Usage: python merge_profiles.py <profile or directory>... [--sort %s] [--limit N]" % "|".join(SORT_KEYS)
+        sys.exit(1)
+
+    # How much time each process spent in total, so the merged numbers can be
+    # put in perspective
+    for profile in profiles:
+        print "%-50s %8.3fs" % (os.path.basename(profile), pstats.Stats(profile).total_tt)
+    print
+
+    merged = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        merged.add(profile)
+    merged.strip_dirs().sort_stats(sort).print_stats(limit)
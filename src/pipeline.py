@@ -0,0 +1,48 @@
+from blargh.blargh_process import FAN_IN_BATCH
+from blargh.edges import MAILBOX_EDGE
+from world import WorldBlargh
+from behavior import BehaviorBlargh
+from control import ControlBlargh
+from input import InputBlargh
+
+# The structure for checkpoint 4, shared by main.py and simulated_main.py
+# (see blargh/topology.py for what goes in a topology). The only thing that
+# changes between the real robot and the simulator is what the blarghs talk
+# to, so the vision blargh and the arguments for the blarghs that need an
+# interface are passed in. If blackboardPath is given (a world blackboard
+# made with WorldBlackboard, see world/blackboard.py), world publishes there
+# and behavior reads from it at its own rate, instead of world sending every
+# World to behavior.
+def robotTopology(inputArgs, VisionBlarghClass, visionArgs, controlArgs, blackboardPath=None):
+    topology = {"stages": [{"name": "input", "blargh": InputBlargh, "args": inputArgs, "async": True, "rate": 50},
+                           {"name": "vision", "blargh": VisionBlarghClass, "args": visionArgs, "async": True},
+                           # Async for Odometry purposes. Every sensor packet
+                           # and every frame replaces the last one, so everything
+                           # that came in since the last step goes in together
+                           # instead of making a new World for each of them.
+                           # Ticking at twice input's rate keeps it from spinning
+                           # while waiting, and adds at most 10ms.
+                           {"name": "world", "blargh": WorldBlargh, "async": True, "rate": 100,
+                            "fanIn": FAN_IN_BATCH},
+                           # If behavior or control can't keep up (control has
+                           # to fit in its 10ms tick), world gets slowed down and
+                           # they skip to the newest input (see overload.py)
+                           {"name": "behavior", "blargh": BehaviorBlargh, "async": False, "budget": 0.02},
+                           {"name": "control", "blargh": ControlBlargh, "args": controlArgs, "async": True, "rate": 100,
+                            "budget": 0.01}],
+                "edges": [{"from": "input", "to": "world"},
+                          {"from": "vision", "to": "world"},
+                          # Behavior only ever cares about the newest world, so
+                          # let old ones get overwritten instead of queueing up
+                          # behind it
+                          {"from": "world", "to": "behavior", "edgeType": MAILBOX_EDGE},
+                          # Steering toward where a ball was a while ago is
+                          # worse than not steering at all
+                          {"from": "behavior", "to": "control", "maxAge": 0.25}]}
+    if blackboardPath != None:
+        # Behavior goes at the same rate new sensor data comes in
+        stages = dict([(stage["name"], stage) for stage in topology["stages"]])
+        stages["world"]["args"] = [blackboardPath]
+        stages["behavior"].update({"args": [blackboardPath], "async": True, "rate": 50})
+        topology["edges"] = [edge for edge in topology["edges"] if edge["to"] != "behavior"]
+    return topology
@@ -0,0 +1,57 @@
+import sys
+sys.path.append("../lib")
+
+import inspect
+
+from blargh.tape import replayTape, TapeReader
+# These register the robot's messages with the codec, so tapes can be read
+import input
+import world
+
+# Replays a tape recorded by a blargh process into a fresh copy of a blargh,
+# without the rest of the robot. Record tapes by running main.py or
+# simulated_main.py with BLARGH_TAPE_DIR set, then for example:
+#   python replay.py tapes/ControlBlargh.1234.tape control ControlBlargh
+#   python replay.py tapes/BehaviorBlargh.1234.tape behavior BehaviorBlargh --realtime
+# Blarghs that need an arduino or simulator interface get a FakeInterface.
+# Blarghs that read from a blackboard get what they read back off the tape.
+
+# Stands in for an arduino or simulator interface wrapper. Every function
+# called on it just gets counted, and returns None.
+class FakeInterface():
+    def __init__(self):
+        self.calls = {}
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls[name] = self.calls.get(name, 0) + 1
+        return call
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print "Usage: python replay.py <tape> <module> <BlarghClass> [--realtime]"
+        sys.exit(1)
+    path, moduleName, className = sys.argv[1:4]
+    realTime = "--realtime" in sys.argv[4:]
+
+    # Create the blargh, giving it fake interfaces for the arguments it has
+    # to have. The rest (like a blackboard path) are left as their defaults,
+    # so it gets everything from the tape instead.
+    module = __import__(moduleName)
+    BlarghClass = getattr(module, className)
+    argSpec = inspect.getargspec(BlarghClass.__init__)
+    numArgs = len(argSpec.args) - 1 - len(argSpec.defaults or ())
+    interfaces = [FakeInterface() for i in range(numArgs)]
+    blargh = BlarghClass(*interfaces)
+
+    tape = TapeReader(path)
+    print "Replaying", path, "into", className, "from edges", tape.edgeNames
+    tape.close()
+
+    result = replayTape(path, blargh, realTime)
+    stepTime = result["stepTime"]
+    print "Replayed %d steps in %.2fs, %d outputs" % (result["steps"], result["totalTime"], result["outputs"])
+    print "Step time p50 %.3fms p99 %.3fms max %.3fms mean %.3fms" % (stepTime["p50"] * 1000,
+        stepTime["p99"] * 1000, stepTime["max"] * 1000, stepTime["mean"] * 1000)
+    for interface in interfaces:
+        if interface.calls:
+            print "Interface calls:", interface.calls
@@ -5,37 +5,69 @@ import time
 import threading
 import os
 
-from blargh.blargh_process import BlarghProcessStarter, cascadeBlarghProcesses, joinAllBlarghProcesses
-from world import WorldBlargh
-from behavior import BehaviorBlargh
-from control import ControlBlargh
-from input import InputBlargh
+from blargh.blargh_process import joinAllBlarghProcesses, killAllBlarghProcesses
+from blargh.lockstep import LockStepClock, lockStepTopology
+from blargh.topology import launchTopology, setDiagnosticDirs
+from pipeline import robotTopology
+from world.blackboard import WorldBlackboard, worldBlackboardPath
 
 from simulator import *
 
 # This is the master process, it should control everything. It's also
 # what should get called to run this whole thing.
+#   python simulated_main.py
+# runs everything in real time, and
+#   python simulated_main.py --lockstep [ticks]
+# runs everything in lock-step with the simulator (see blargh/lockstep.py),
+# as fast as it can go, and stops after that many ticks if it's given. Either
+# way, adding
+#   --sample <dir>
+# samples the stacks of every process into dir (see blargh/sampling.py).
 
 if __name__ == "__main__":
+    # Has to be set before anything is forked, so the simulator interface
+    # gets sampled too
+    if "--sample" in sys.argv:
+        i = sys.argv.index("--sample")
+        setDiagnosticDirs(sampleDir=sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
+    clock = None
+    ticks = None
+    if len(sys.argv) > 1 and sys.argv[1] == "--lockstep":
+        clock = LockStepClock()
+        if len(sys.argv) > 2:
+            ticks = int(sys.argv[2])
+
     # Create the simulator interface, and wrappers
-    masterConn, inputConn, visionConn, controlConn = createSimulatorInterface(4)
+    masterConn, inputConn, visionConn, controlConn = createSimulatorInterface(4, clock, ticks)
     inputSimulatorInterface = SimulatorInterfaceWrapper(inputConn)
     visionSimulatorInterface = SimulatorInterfaceWrapper(visionConn)
     controlSimulatorInterface = SimulatorInterfaceWrapper(controlConn)
 
-    # Create the structure for checkpoint 4
-    input = BlarghProcessStarter(InputBlargh, [inputSimulatorInterface], True)
-    vision = BlarghProcessStarter(VisionBlargh, [visionSimulatorInterface], True)
-    world = BlarghProcessStarter(WorldBlargh, [], True)
-    behavior = BlarghProcessStarter(BehaviorBlargh, [], False)
-    control = BlarghProcessStarter(ControlBlargh, [controlSimulatorInterface], True)
-
-    cascadeBlarghProcesses(input, world)
-    cascadeBlarghProcesses(vision, world)
-    cascadeBlarghProcesses(world, behavior)
-    cascadeBlarghProcesses(behavior, control)
-
-    # Start Everything, and store it in a list.
-    processes = [input.start(), vision.start(), world.start(), behavior.start(), control.start()]
+    # Create the structure for checkpoint 4 and start everything at once.
+    # Data only starts flowing once every blargh is ready.
+    # Lock-step mode needs behavior to step on exactly the world from the
+    # same tick, so only the real time mode uses the world blackboard
+    blackboardPath = None
+    if clock == None:
+        blackboardPath = worldBlackboardPath()
+        WorldBlackboard(blackboardPath, create=True)
+    topology = robotTopology([inputSimulatorInterface], VisionBlargh, [visionSimulatorInterface], [controlSimulatorInterface],
+                             blackboardPath)
+    if clock != None:
+        topology = lockStepTopology(topology, clock)
+    processes = launchTopology(topology)
 
-    joinAllBlarghProcesses(processes)
+    # Ctrl-C stops every blargh process on its own (they get it too), but
+    # any that didn't get it, like ones running as threads, still need to be
+    # told
+    try:
+        if ticks != None:
+            # Wait for the simulator to run all the ticks, then stop everything
+            cmd, arg = masterConn.recv()
+            killAllBlarghProcesses(processes)
+            masterConn.send(("KILL", None))
+        joinAllBlarghProcesses(processes)
+    except KeyboardInterrupt:
+        killAllBlarghProcesses(processes)
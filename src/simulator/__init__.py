@@ -1,8 +1,20 @@
 from multiprocessing import Pipe, Process
 from simulator import *
+from blargh.clock import monotonicTime
+from blargh.sampling import startSampling, stopSampling, selectInterruptible
 
-# The process in which the simulator runs
-def simulatorInterface(pipes):
+# How often the screen gets redrawn in lock-step mode, in seconds of real
+# time. Drawing every tick would slow the whole thing down to the frame rate.
+LOCK_STEP_DRAW_INTERVAL = 1.0 / 30
+
+# The process in which the simulator runs. If clock (a LockStepClock, see
+# blargh/lockstep.py) is given, the simulator drives the blarghs one tick at a
+# time instead of running freely, and stops after ticks ticks (None means
+# never). When it stops it sends ("FINISHED", ticks) down the first pipe.
+def simulatorInterface(pipes, clock=None, ticks=None):
+
+    # Sample where the CPU time goes, if sampling is turned on
+    startSampling("SimulatorInterface")
 
     # Create a simulator object
     simulator = Simulator()
@@ -39,11 +51,42 @@ def simulatorInterface(pipes):
             # were matched
             raise ValueError
 
+    # Lock-step: send a tick through the blarghs, answer whatever they ask
+    # for until it's all the way through, then step the simulator by exactly
+    # one tick
+    if clock != None:
+        startTime = monotonicTime()
+        lastDraw = None
+        while ticks == None or clock.ticks < ticks:
+            clock.tick()
+            finished = False
+            while not finished:
+                ready, finished = clock.wait(pipes)
+                for pipe in ready:
+                    if (handleCommand(pipe) == "KILL"):
+                        stopSampling()
+                        return 0
+            simulator.step(clock.period)
+            if lastDraw == None or monotonicTime() - lastDraw > LOCK_STEP_DRAW_INTERVAL:
+                simulator.draw()
+                lastDraw = monotonicTime()
+        elapsed = monotonicTime() - startTime
+        print "Simulated %d ticks (%.2fs) in %.2fs, %.1f times real time" % (clock.ticks, clock.time(), elapsed,
+            clock.time() / elapsed)
+        pipes[0].send(("FINISHED", clock.ticks))
+        # Keep answering until we're killed
+        while True:
+            for pipe in selectInterruptible(pipes):
+                if (handleCommand(pipe) == "KILL"):
+                    stopSampling()
+                    return 0
+
     # Constantly poll pipes, then step the simulator
     while True:
         for pipe in pipes:
             if (pipe.poll()):
                 if (handleCommand(pipe) == "KILL"):
+                    stopSampling()
                     return 0
         simulator.step()
         simulator.draw()
@@ -51,8 +94,9 @@ def simulatorInterface(pipes):
 
 # Called by simulated_main.py to create a simulator interface, which is
 # analogous to the arduino interface, providing pipes to any blarghs that need
-# to make use of input or output
-def createSimulatorInterface(numPipesRequested):
+# to make use of input or output. clock and ticks are for lock-step mode (see
+# simulatorInterface).
+def createSimulatorInterface(numPipesRequested, clock=None, ticks=None):
     # Initialize the lists of pipes
     childPipes = []
     parentPipes = []
@@ -63,7 +107,7 @@ def createSimulatorInterface(numPipesRequested):
         parentPipes.append(parentConn)
 
     # Create the process and start it, passing in the child ends of the pipes
-    simProc = Process(target = simulatorInterface, args = [childPipes])
+    simProc = Process(target = simulatorInterface, args = [childPipes, clock, ticks])
     simProc.start()
 
     # Return the parent ends of the pipes
@@ -72,11 +72,13 @@ class Simulator:
         # Flip the buffers (display everything)
         pygame.display.flip()
 
-    def step(self):
+    # Move everything along by delTime seconds, or by however long it's
+    # been since the last step if it isn't given
+    def step(self, delTime=None):
         # Step all the objects...
         for ball in self.balls:
             ball.step()
-        self.robot.step()
+        self.robot.step(delTime)
 
 
 class Object:
@@ -199,12 +201,14 @@ class Robot(Object):
         self.camera = Camera( self, ( 0, 0 ), 0 )
         self.components = [ self.camera ]
 
-    # Update the Robot's position
-    def step(self):
+    # Update the Robot's position, delTime seconds on (by default, however
+    # long it's been since the last step)
+    def step(self, delTime=None):
         
         # Get the current time, calculate time between steps
         currentTime = time.time()
-        delTime = currentTime - self.lastTime
+        if delTime == None:
+            delTime = currentTime - self.lastTime
 
         # Assuming this function gets called pretty often, it can
         # decouple the motions.
@@ -0,0 +1,95 @@
+import sys
+sys.path.append("..")
+
+import os
+import struct
+import tempfile
+from multiprocessing import Process
+
+from checks import check, finish
+from blargh.blackboard import Blackboard, MAX_READ_TRIES, SEQUENCE
+from blargh.clock import monotonicTime
+
+# Checks the sequence lock that keeps blackboard reads (see
+# blargh/blackboard.py) consistent. Run it from this directory after
+# changing blackboard.py:
+#   python blackboard_tests.py
+
+# How long the writer publishes for while we read, in seconds
+PUBLISH_TIME = 1.0
+# Every record is a count and then RECORD_WORDS copies of it, so a record
+# that's half one write and half another can't look right
+RECORD_WORDS = 512
+RECORD = struct.Struct("<Q" + "Q" * RECORD_WORDS)
+
+def testPath():
+    return os.path.join(tempfile.gettempdir(), "blargh-test-%d" % os.getpid())
+
+# Publishes records counting up from 1 for PUBLISH_TIME, then a last one of 0
+def publish(path):
+    blackboard = Blackboard(path, RECORD.size)
+    i = 1
+    end = monotonicTime() + PUBLISH_TIME
+    while monotonicTime() < end:
+        blackboard.write(RECORD.pack(*([i] * (RECORD_WORDS + 1))))
+        i += 1
+    blackboard.write(RECORD.pack(*([0] * (RECORD_WORDS + 1))))
+    blackboard.close()
+
+def checkBlackboard():
+    path = testPath()
+    blackboard = Blackboard(path, RECORD.size, create=True)
+    record, sequence = blackboard.read()
+    check("blackboard starts at sequence 0", sequence == 0, sequence)
+    blackboard.write(RECORD.pack(*([7] * (RECORD_WORDS + 1))))
+    record, sequence = blackboard.read()
+    check("blackboard gives back what was written", sequence == 1 and RECORD.unpack(record)[0] == 7, sequence)
+
+    # Read while another process writes as fast as it can
+    writer = Process(target=publish, args=(path,))
+    writer.start()
+    torn = []
+    reads = 0
+    gaveUp = 0
+    last = 0
+    while True:
+        alive = writer.is_alive()
+        record, sequence = blackboard.read()
+        # With fewer CPUs than processes, the writer can get switched out
+        # halfway through a write for longer than all our tries take. That
+        # reads as nothing new, the same as a dead writer.
+        if record == None:
+            gaveUp += 1
+            if not alive:
+                break
+            continue
+        values = RECORD.unpack(record)
+        if values[0] == 0 and sequence > 1:
+            break
+        reads += 1
+        if values != (values[0],) * (RECORD_WORDS + 1) or sequence < last:
+            torn.append((values[0], sequence, last))
+        last = sequence
+        # (In case it died before writing the 0)
+        if not alive:
+            break
+    writer.join()
+    check("blackboard reads are never torn (%d reads, %d retries, %d gave up)" % (reads, blackboard.retries, gaveUp),
+          len(torn) == 0, torn[:1])
+
+    # A writer that dies halfway through a write leaves the sequence odd
+    sequence = SEQUENCE.unpack_from(blackboard.memory, 0)[0]
+    SEQUENCE.pack_into(blackboard.memory, 0, sequence + 1)
+    retries = blackboard.retries
+    check("blackboard read gives up on a stuck write", blackboard.read() == (None, None) and
+          blackboard.retries - retries == MAX_READ_TRIES)
+    SEQUENCE.pack_into(blackboard.memory, 0, sequence + 2)
+    record, newSequence = blackboard.read()
+    check("blackboard reads once the write finishes", newSequence == sequence / 2 + 1, newSequence)
+
+    blackboard.close()
+    os.remove(path)
+
+if __name__ == "__main__":
+    checkBlackboard()
+    finish()
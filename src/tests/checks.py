@@ -0,0 +1,23 @@
+import sys
+
+# What the *_tests.py scripts that check themselves use to report. Every
+# check prints PASS or FAIL, and finish() exits with 1 if any failed, so
+# they can be run one after another:
+#   for t in packet_tests.py edge_tests.py blackboard_tests.py; do python $t || break; done
+
+failures = 0
+
+# Report one check. detail is printed along with a failure, to show what
+# went wrong.
+def check(name, ok, detail=""):
+    global failures
+    if ok:
+        print "PASS", name
+    else:
+        failures += 1
+        print "FAIL", name, detail
+
+# Call at the end of the script
+def finish():
+    if failures > 0:
+        sys.exit(1)
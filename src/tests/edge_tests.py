@@ -0,0 +1,175 @@
+import sys
+sys.path.append("..")
+
+import os
+import threading
+import time
+from multiprocessing import Process
+
+from checks import check, finish
+from blargh.clock import monotonicTime
+from blargh.edges import *
+
+# Checks the edges in blargh/edges.py: credit flow control on pipe edges,
+# the mailbox's sequence lock, and maxAge throwing away stale messages.
+# Run it from this directory after changing edges.py:
+#   python edge_tests.py
+
+# How long the mailbox producer writes for while we read, in seconds
+PRODUCE_TIME = 1.0
+
+# A pipe edge lets the producer get window messages ahead and no further,
+# and the consumer hands credits back half a window at a time
+def checkPipeCredits():
+    inEnd, outEnd = createEdge(PIPE_EDGE, window=4)
+    for i in range(4):
+        outEnd.send(i, (float(i), ()))
+        outEnd.waitAck()
+    check("pipe edge uses a credit per message", outEnd.credits == 0, outEnd.credits)
+
+    received = []
+    creditsBack = []
+    def consume():
+        time.sleep(0.2)
+        received.append(inEnd.recv())
+        creditsBack.append(outEnd.conn.poll())
+        received.append(inEnd.recv())
+        creditsBack.append(outEnd.conn.poll(1.0))
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    sendStart = monotonicTime()
+    outEnd.send(4, (4.0, ()))
+    blocked = monotonicTime() - sendStart
+    consumer.join()
+    check("pipe edge blocks with no credits left", blocked > 0.15 and outEnd.waitTime() > 0.15,
+          (blocked, outEnd.waitTime()))
+    check("pipe edge hands credits back in batches", creditsBack == [False, True], creditsBack)
+    check("pipe edge gets its credits back", outEnd.credits == 1, outEnd.credits)
+
+    while inEnd.poll():
+        received.append(inEnd.recv())
+    check("pipe edge keeps messages and traces in order",
+          received == [(i, (float(i), ())) for i in range(5)], received)
+
+    # With no credits, wakeOn being readable sends anyway instead of waiting
+    inEnd, outEnd = createEdge(PIPE_EDGE, window=1)
+    outEnd.send("first")
+    readFd, writeFd = os.pipe()
+    os.write(writeFd, "!")
+    outEnd.wakeOn = readFd
+    sendStart = monotonicTime()
+    outEnd.send("second")
+    check("pipe edge wakeOn stops the wait", monotonicTime() - sendStart < 0.1 and outEnd.credits == -1,
+          outEnd.credits)
+    os.close(readFd)
+    os.close(writeFd)
+
+# Writes messages into a mailbox for PRODUCE_TIME, each one a number and a
+# string whose length depends on it, so a torn read can't look right. The
+# last one is None.
+def produce(outEnd):
+    i = 0
+    end = monotonicTime() + PRODUCE_TIME
+    while monotonicTime() < end:
+        outEnd.send((i, "m" * (i % 200)), (float(i), ()))
+        i += 1
+    outEnd.send(None)
+
+# Stands in for a mailbox's data. The first time anything is copied out of
+# it, a whole new message gets written while the copy is half done.
+class InterruptedCopy():
+    def __init__(self, mailbox, payload):
+        self.mailbox = mailbox
+        self.data = mailbox.data
+        self.payload = payload
+    def __getslice__(self, start, end):
+        first = self.data[start:(start + end) / 2]
+        self.mailbox.data = self.data
+        self.mailbox.write(self.payload)
+        return first + self.data[(start + end) / 2:end]
+
+# A mailbox gives the newest message and counts the rest as dropped, never
+# gives a half written message, and a producer stuck halfway through a write
+# just means there's nothing new instead of a hang
+def checkMailbox():
+    inEnd, outEnd = createEdge(MAILBOX_EDGE)
+    check("mailbox starts empty", not inEnd.poll())
+    for i in range(3):
+        outEnd.send(i)
+    check("mailbox gives the newest message", inEnd.poll() and inEnd.recv() == (2, None))
+    check("mailbox counts overwritten messages as dropped", inEnd.dropped() == 2, inEnd.dropped())
+    check("mailbox has nothing new after a read", not inEnd.poll())
+
+    # A write that lands in the middle of a read means the read starts again
+    mailbox = outEnd.mailbox
+    outEnd.send("a" * 100)
+    mailbox.data = InterruptedCopy(mailbox, encodeMessage("b" * 100, None))
+    check("mailbox read retries when a write lands during it", inEnd.poll() and inEnd.recv() == ("b" * 100, None))
+
+    # Read while another process writes as fast as it can
+    producer = Process(target=produce, args=(outEnd,))
+    producer.start()
+    torn = []
+    last = -1
+    reads = 0
+    while True:
+        if not inEnd.poll():
+            # (In case it died before sending the None)
+            if not producer.is_alive() and not inEnd.poll():
+                break
+            continue
+        message, trace = inEnd.recv()
+        if message == None:
+            break
+        i, s = message
+        reads += 1
+        if s != "m" * (i % 200) or trace != (float(i), ()) or i <= last:
+            torn.append((i, len(s), trace, last))
+        last = i
+    producer.join()
+    check("mailbox reads are never torn (%d reads)" % reads, len(torn) == 0, torn[:1])
+
+    # The producer dies halfway through a write: the sequence is left odd
+    outEnd.send("whole")
+    mailbox.seq.value += 1
+    mailbox.written.value += 1
+    pollStart = monotonicTime()
+    got = inEnd.poll()
+    check("mailbox poll gives up on a stuck write", not got and monotonicTime() - pollStart < 1.0, got)
+    try:
+        inEnd.recv()
+        raised = False
+    except ValueError:
+        raised = True
+    check("mailbox recv with nothing to receive raises ValueError", raised)
+    # Once the write finishes it's there as usual
+    mailbox.seq.value += 1
+    check("mailbox gets the write once it finishes", inEnd.poll() and inEnd.recv() == ("whole", None))
+
+# maxAge throws away messages whose data was sampled too long ago, keeps the
+# fresh ones, and never expires messages with no trace
+def checkMaxAge():
+    for edgeType in [PIPE_EDGE, RING_EDGE, LOCAL_EDGE]:
+        inEnd, outEnd = createEdge(edgeType, maxAge=0.1)
+        now = monotonicTime()
+        outEnd.send("stale", (now - 1.0, ()))
+        outEnd.send("fresh", (now, ()))
+        outEnd.send("untraced", None)
+        outEnd.send("stale again", (now - 0.5, ()))
+        received = []
+        while inEnd.poll():
+            received.append(inEnd.recv()[0])
+        check("%s edge with maxAge drops stale messages" % edgeType,
+              received == ["fresh", "untraced"] and inEnd.expired() == 2, (received, inEnd.expired()))
+
+    # A message can go stale while it waits
+    inEnd, outEnd = createEdge(PIPE_EDGE, maxAge=0.1)
+    outEnd.send("waited", (monotonicTime(), ()))
+    time.sleep(0.2)
+    check("maxAge counts time spent waiting on the edge", not inEnd.poll() and inEnd.expired() == 1)
+
+if __name__ == "__main__":
+    checkPipeCredits()
+    checkMailbox()
+    checkMaxAge()
+    finish()
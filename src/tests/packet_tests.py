@@ -0,0 +1,223 @@
+import sys
+# Straight from the arduino directory, since the arduino package needs pyusb
+sys.path.append("../arduino")
+
+import random
+
+from checks import check, finish
+from emulator import sensorPacket
+from packets import SensorPacketParser, CommandPacket
+
+# Checks that the packet code in packets.py gets the same bytes in and out
+# as the firmware, without needing a board or even an emulator running. Run
+# it from this directory after changing packets.py:
+#   python packet_tests.py
+
+# How many random cases each check tries. The seed is fixed, so a failure
+# comes back the same way every run.
+CASES = 1000
+SEED = 2013
+
+# A random sensor packet, as (digital readings, analog readings), with
+# numDigital and numAnalog readings if they're given
+def randomReadings(rand, numDigital=None, numAnalog=None):
+    if numDigital == None:
+        numDigital = rand.randint(0, 8)
+    if numAnalog == None:
+        numAnalog = rand.randint(0, 8)
+    digital = [rand.randint(0, 1) for i in range(numDigital)]
+    analog = [rand.randint(0, 1023) for i in range(numAnalog)]
+    return digital, analog
+
+# What the parser should give back for readings: digital readings as True
+# for HIGH, and analog readings decoded the way the old per byte reader
+# did (byte1 * 256 + byte0, each minus 1), so a byte the firmware had to
+# send as 255 instead of 256 comes out the same as it always did
+def expectedPacket(digital, analog):
+    data = sensorPacket(digital, analog)
+    analogStart = 2 + len(digital) + 2
+    decoded = []
+    for i in range(len(analog)):
+        byte0 = ord(data[analogStart + 2 * i]) - 1
+        byte1 = ord(data[analogStart + 2 * i + 1]) - 1
+        decoded.append(byte1 * 256 + byte0)
+    return ([value == 1 for value in digital], decoded)
+
+# Every packet the emulator can send comes back out of the parser the way
+# the old reader decoded it, whole or in any size pieces
+def checkRoundTrip(rand):
+    wrong = []
+    for i in range(CASES):
+        digital, analog = randomReadings(rand)
+        parser = SensorPacketParser()
+        parser.feed(sensorPacket(digital, analog))
+        packets = parser.packets()
+        if packets != [expectedPacket(digital, analog)]:
+            wrong.append((digital, analog, packets))
+    check("sensor packets round trip", len(wrong) == 0, wrong[:1])
+
+# A stream of packets fed in random sized chunks, with packets() called
+# after every one, comes out the same as fed all at once, and reading
+# needed() bytes at a time never reads past the end of a packet (which is
+# what lets readSensorData block for exactly one frame)
+def checkSplitChunks(rand):
+    wrongChunks = []
+    overRead = []
+    for i in range(CASES / 10):
+        readings = [randomReadings(rand) for j in range(rand.randint(1, 10))]
+        stream = "".join([sensorPacket(digital, analog) for digital, analog in readings])
+        expected = [expectedPacket(digital, analog) for digital, analog in readings]
+
+        parser = SensorPacketParser()
+        packets = []
+        offset = 0
+        while offset < len(stream):
+            size = rand.randint(1, 12)
+            parser.feed(stream[offset:offset + size])
+            offset += size
+            packets.extend(parser.packets())
+        if packets != expected or parser.skipped != 0:
+            wrongChunks.append((readings, packets))
+
+        parser = SensorPacketParser()
+        packets = []
+        offset = 0
+        while offset < len(stream):
+            size = parser.needed()
+            parser.feed(stream[offset:offset + size])
+            offset += size
+            newPackets = parser.packets()
+            if len(newPackets) > 0 and len(parser.buffer) != 0:
+                overRead.append((readings, offset))
+            packets.extend(newPackets)
+        if packets != expected:
+            wrongChunks.append((readings, packets))
+    check("sensor packets split into chunks", len(wrongChunks) == 0, wrongChunks[:1])
+    check("needed() stops at the end of the packet", len(overRead) == 0, overRead[:1])
+
+# Junk in front of a packet (like the tail of one we started reading
+# halfway through), or a packet cut off partway, gets skipped, and the
+# whole packets after it come out straight away. This is with the parser
+# told the layout, the way Arduino uses it once it's sent the init packet.
+# Packets have no checksum, so once in a while a cut off packet's last byte
+# lines up with a ';' in the next one's analog readings, and the two come
+# out as one bad packet. It has to be back in sync for the packet after.
+def checkResync(rand):
+    wrong = []
+    linedUp = 0
+    for i in range(CASES):
+        numDigital, numAnalog = rand.randint(0, 8), rand.randint(0, 8)
+        readings = [randomReadings(rand, numDigital, numAnalog) for j in range(4)]
+        packets = [sensorPacket(digital, analog) for digital, analog in readings]
+        # Junk never has a 'D' in it, a 'D' could really start a packet
+        junk = "".join([rand.choice("A;\x01\x02\x05\xff") for j in range(rand.randint(1, 6))])
+        cut = packets[0][:rand.randint(1, len(packets[0]) - 1)]
+        stream = junk + packets[1] + cut + packets[2] + packets[3]
+        parser = SensorPacketParser(numDigital, numAnalog)
+        parser.feed(stream)
+        got = parser.packets()
+        expected = [expectedPacket(*readings[j]) for j in range(1, 4)]
+        if got == expected and parser.skipped == len(junk) + len(cut):
+            continue
+        cutEnd = len(junk) + len(packets[1]) + len(packets[0]) - 1
+        if (len(got) == 3 and got[0] == expected[0] and got[2] == expected[2] and stream[cutEnd] == ";"):
+            linedUp += 1
+        else:
+            wrong.append((repr(stream), got, parser.skipped))
+    check("sensor packets resync after junk and cut off packets", len(wrong) == 0, wrong[:1])
+    print "    (%d of %d cut off packets lined up with the next one and came out as a bad packet)" % (linedUp, CASES)
+
+# How arduino3.py used to build command packets, from scratch every cycle
+def oldCommandPacket(motorSpeeds, stepperSteps, servoAngles):
+    output = ""
+    output += "M" + chr(len(motorSpeeds) + 1)
+    for i in motorSpeeds:
+        output += chr(i+1)
+    output += "T" + chr(len(stepperSteps) + 1)
+    for i in range(len(stepperSteps)):
+        step = stepperSteps[i]
+        output += chr(int(step))
+    output += "S" + chr(len(servoAngles) + 1)
+    for i in servoAngles:
+        output += chr(i+1)
+    output += ";"
+    return output
+
+# A CommandPacket has the same bytes as the old builder would make from the
+# same values, both when it's first laid out and after values are patched
+# in any order (including setting something to what it already was)
+def checkCommandPacket(rand):
+    wrong = []
+    for i in range(CASES):
+        motorSpeeds = [0] * rand.randint(0, 8)
+        stepperSteps = [0] * rand.randint(0, 4)
+        servoAngles = [0] * rand.randint(0, 8)
+        packet = CommandPacket(len(motorSpeeds), len(stepperSteps), len(servoAngles))
+        if str(packet.fullPacket()) != oldCommandPacket(motorSpeeds, stepperSteps, servoAngles):
+            wrong.append(("new", motorSpeeds, stepperSteps, servoAngles))
+        for j in range(rand.randint(1, 20)):
+            kind = rand.choice([values for values in (motorSpeeds, stepperSteps, servoAngles) if len(values) > 0] or [None])
+            if kind is motorSpeeds:
+                k = rand.randrange(len(motorSpeeds))
+                motorSpeeds[k] = rand.randint(0, 254)
+                packet.setMotorSpeed(k, motorSpeeds[k])
+            elif kind is stepperSteps:
+                k = rand.randrange(len(stepperSteps))
+                stepperSteps[k] = rand.choice([0, 1, True, False])
+                packet.stepStepper(k, stepperSteps[k])
+            elif kind is servoAngles:
+                k = rand.randrange(len(servoAngles))
+                servoAngles[k] = rand.randint(0, 180)
+                packet.setServoAngle(k, servoAngles[k])
+            if str(packet.fullPacket()) != oldCommandPacket(motorSpeeds, stepperSteps, servoAngles):
+                wrong.append((motorSpeeds, stepperSteps, servoAngles, repr(str(packet.fullPacket()))))
+    check("command packets match the old builder", len(wrong) == 0, wrong[:1])
+
+# Applies a delta packet to a copy of a full packet, the way the firmware
+# does with its motor speeds, steppers and servos
+def applyDelta(packet, full, delta):
+    offsets = dict([(char, offset) for char, offset, count in packet.sections])
+    i = 0
+    while delta[i] != ord(";"):
+        offset = offsets[delta[i]]
+        for j in range(delta[i + 1] - 1):
+            full[offset + delta[i + 2 + 2 * j] - 1] = delta[i + 3 + 2 * j]
+        i += 2 + 2 * (delta[i + 1] - 1)
+
+# Delta packets carry everything that changed since the last packet, so
+# applying them keeps the arduino's copy the same as ours, and sending a
+# full packet leaves nothing for the next delta packet
+def checkDeltaPacket(rand):
+    wrong = []
+    for i in range(CASES):
+        numMotors, numSteppers, numServos = rand.randint(0, 8), rand.randint(0, 4), rand.randint(0, 8)
+        packet = CommandPacket(numMotors, numSteppers, numServos)
+        arduinoCopy = bytearray(packet.fullPacket())
+        if packet.deltaPacket() != bytearray(";"):
+            wrong.append("not empty after a full packet")
+        for j in range(rand.randint(1, 20)):
+            for k in range(rand.randint(0, 3)):
+                if numMotors > 0:
+                    packet.setMotorSpeed(rand.randrange(numMotors), rand.randint(0, 254))
+                if numSteppers > 0:
+                    packet.stepStepper(rand.randrange(numSteppers), rand.randint(0, 1))
+                if numServos > 0:
+                    packet.setServoAngle(rand.randrange(numServos), rand.randint(0, 180))
+            if rand.random() < 0.2:
+                arduinoCopy = bytearray(packet.fullPacket())
+            else:
+                applyDelta(packet, arduinoCopy, packet.deltaPacket())
+            if arduinoCopy != packet.buffer:
+                wrong.append((repr(str(arduinoCopy)), repr(str(packet.buffer))))
+            if packet.deltaPacket() != bytearray(";"):
+                wrong.append("not empty after sending")
+    check("delta packets keep the arduino up to date", len(wrong) == 0, wrong[:1])
+
+if __name__ == "__main__":
+    rand = random.Random(SEED)
+    checkRoundTrip(rand)
+    checkSplitChunks(rand)
+    checkResync(rand)
+    checkCommandPacket(rand)
+    checkDeltaPacket(rand)
+    finish()
@@ -1,4 +1,7 @@
-from blargh import Blargh
+from blargh import Blargh, Batch, codec
+from blargh.clock import monotonicTime
+from input import INPUT_MESSAGE, BUMP_SCHEMA, IR_SCHEMA
+import new
 import time
 
 #This object will be passed on to the BehaviorBlargh. It describes the state of the world around the robot.
@@ -9,6 +12,8 @@ class World:
         self.bumpData = None
         self.wallInFront = False
         self.yellowTheta = -1
+        # The simulated time in lock-step mode, None when running for real
+        self.time = None
     def updateBalls(self, balls):
         self.balls = balls
     def updateYellowTheta(self, yellowTheta):
@@ -17,6 +22,8 @@ class World:
         self.bumpData = bumpData
     def updateIRData(self, irData):
         self.irData = irData
+    def updateTime(self, time):
+        self.time = time
     def updateWallInFront(self, wallInFront):
         self.wallInFront = wallInFront
     def isWallInFront(self):
@@ -25,27 +32,96 @@ class World:
 
 #This Blargh takes input from the sensors and vision and aggregates it into a model of the world.
 #For now, this is pretty sparse. Just pass on data.
+#If it's given the path of a world blackboard (see blackboard.py), every new
+#World also gets published there for anyone to read.
 class WorldBlargh(Blargh):
     VISION = 0
-    INPUT = 1
-    def __init__(self):
+    INPUT = INPUT_MESSAGE
+    def __init__(self, blackboardPath=None):
         self.world = World()
+        self.blackboard = None
+        if blackboardPath != None:
+            from blackboard import WorldBlackboard
+            self.blackboard = WorldBlackboard(blackboardPath)
+        # When input and vision last changed the world
+        self.inputTime = None
+        self.visionTime = None
 
     def step(self, inp):
-        if (not inp == None):
-            command, args = inp
-            if (command == self.VISION):
-                if args == None:
-                    return None
-                balls, yellowTheta = args
-                self.world.updateBalls(balls)
-                self.world.updateYellowTheta(yellowTheta)
-
-            elif(command == self.INPUT):
-                bumpData, irData = args
-                if bumpData != None:
-                    self.world.updateBumpData(bumpData)
-                if irData != None:
-                    self.world.updateIRData(irData)
+        # A batch has everything that came in since the last step, oldest
+        # first. Apply all of it, then send out one World. If nothing came
+        # in, nothing changed, so there's nothing to send.
+        if isinstance(inp, Batch):
+            updated = False
+            for each in inp:
+                if self.update(each):
+                    updated = True
+            if not updated:
+                return None
+            return self.publish()
+        if not self.update(inp):
+            return None
+        return self.publish()
 
+    def publish(self):
+        if self.blackboard != None:
+            self.blackboard.publish(self.world, self.inputTime, self.visionTime)
         return self.world
+
+    # Apply one input to the world. Returns False if there was nothing to
+    # apply.
+    def update(self, inp):
+        if inp == None:
+            return False
+        command, args = inp
+        if (command == self.VISION):
+            if args == None:
+                return False
+            balls, yellowTheta = args
+            self.world.updateBalls(balls)
+            self.world.updateYellowTheta(yellowTheta)
+            self.visionTime = monotonicTime()
+
+        elif(command == self.INPUT):
+            bumpData, irData = args[:2]
+            if bumpData != None:
+                self.world.updateBumpData(bumpData)
+            if irData != None:
+                self.world.updateIRData(irData)
+            if len(args) > 2:
+                self.world.updateTime(args[2])
+            self.inputTime = monotonicTime()
+
+        return True
+
+# How Worlds get sent between blargh processes (see blargh/codec.py). The
+# ball count always goes last, the balls follow it. Vision's outputs are
+# only a float and a list of tuples, which cPickle already does faster than
+# we could, so they're left to be pickled.
+WORLD_STRUCT = codec.BallStruct("<cBdBdB" + BUMP_SCHEMA.format + IR_SCHEMA.format + "H")
+WORLD_FIELDS = set(["balls", "irData", "bumpData", "wallInFront", "yellowTheta", "time"])
+
+def encodeWorld(world):
+    if set(world.__dict__) != WORLD_FIELDS or type(world.wallInFront) is not bool:
+        raise codec.CantEncode
+    values = ["W"]
+    values.extend(codec.packNumber(world.yellowTheta))
+    values.extend(codec.packNumber(world.time))
+    values.append(world.wallInFront)
+    BUMP_SCHEMA.flatten(world.bumpData, values)
+    IR_SCHEMA.flatten(world.irData, values)
+    codec.flattenBalls(world.balls, values)
+    return WORLD_STRUCT.pack(values)
+
+def decodeWorld(data):
+    values, balls = WORLD_STRUCT.unpack(data)
+    bumpData, i = BUMP_SCHEMA.unflatten(values, 6)
+    irData, i = IR_SCHEMA.unflatten(values, i)
+    # Built straight from its attributes, World.__init__ would only set
+    # them all twice
+    return new.instance(World, {"balls": balls, "irData": irData, "bumpData": bumpData,
+                                "wallInFront": bool(values[5]),
+                                "yellowTheta": codec.unpackNumber(values[1], values[2]),
+                                "time": codec.unpackNumber(values[3], values[4])})
+
+codec.registerClass(World, "W", encodeWorld, decodeWorld)
@@ -0,0 +1,110 @@
+import math
+import struct
+
+from blargh.blackboard import Blackboard, blackboardPath
+from blargh.clock import monotonicTime
+from world import World
+from input import BumpSensorData, IRData
+
+# The World, published by WorldBlargh on a blackboard (see
+# blargh/blackboard.py) instead of being sent down an edge, so BehaviorBlargh
+# and anything else that wants to look at it (like world_viewer.py) can
+# read it whenever it likes. Every field has a fixed place in the record:
+#   publish time, input time, vision time  - monotonic times, 0 for never
+#   has sim time, sim time                 - World.time, for lock-step mode
+#   yellowTheta (NaN for None), wallInFront
+#   has bump, left, right, front, back, power
+#   has IR, leftFront, leftSide, left, right  - NaN for None
+#   ball count, then (r, theta) for up to MAX_BALLS balls
+
+# What the world blackboard is called by default
+WORLD_BLACKBOARD = "world"
+# Most balls that fit on the blackboard. Any more than this are left off.
+MAX_BALLS = 16
+
+WORLD_RECORD = struct.Struct("<ddd?dd???????" + "?dddd" + "B" + "d" * (2 * MAX_BALLS))
+
+# Where the world blackboard goes by default
+def worldBlackboardPath():
+    return blackboardPath(WORLD_BLACKBOARD)
+
+def packNumber(value):
+    if value is None:
+        return float("nan")
+    return value
+
+def unpackNumber(value):
+    if math.isnan(value):
+        return None
+    return value
+
+class WorldBlackboard():
+    # The writer (whoever starts everything, before any readers) creates it
+    def __init__(self, path=None, create=False):
+        if path == None:
+            path = worldBlackboardPath()
+        self.blackboard = Blackboard(path, WORLD_RECORD.size, create)
+        # Only used by the writer, so that each publish doesn't allocate
+        self.ballValues = [0.0] * (2 * MAX_BALLS)
+
+    # Publish world. inputTime and visionTime are when input and vision last
+    # updated it (monotonic times, or None for never).
+    def publish(self, world, inputTime=None, visionTime=None):
+        values = [monotonicTime(), inputTime or 0.0, visionTime or 0.0,
+                  world.time != None, world.time or 0.0,
+                  packNumber(world.yellowTheta), bool(world.wallInFront)]
+        bumpData = world.bumpData
+        if bumpData != None:
+            values.extend([True, bool(bumpData.left), bool(bumpData.right), bool(bumpData.front),
+                           bool(bumpData.back), bool(bumpData.power)])
+        else:
+            values.extend([False, False, False, False, False, False])
+        irData = world.irData
+        if irData != None:
+            values.extend([True, packNumber(getattr(irData, "leftFront", None)),
+                           packNumber(getattr(irData, "leftSide", None)),
+                           packNumber(irData.left), packNumber(irData.right)])
+        else:
+            values.extend([False, 0.0, 0.0, 0.0, 0.0])
+        balls = world.balls[:MAX_BALLS]
+        values.append(len(balls))
+        ballValues = self.ballValues
+        for i in range(len(balls)):
+            ballValues[2 * i] = balls[i][0]
+            ballValues[2 * i + 1] = balls[i][1]
+        values.extend(ballValues)
+        self.blackboard.write(WORLD_RECORD.pack(*values))
+
+    # Returns a copy of the newest World, and a dictionary with its
+    # sequence number (how many Worlds have been published) and when it was
+    # published, and when input and vision last updated it (monotonic times,
+    # None for never). The World is None if nothing has been published yet.
+    def snapshot(self):
+        record, sequence = self.blackboard.read()
+        if record == None or sequence == 0:
+            return None, {"sequence": sequence}
+        values = WORLD_RECORD.unpack(record)
+        world = World()
+        if values[3]:
+            world.time = values[4]
+        world.yellowTheta = unpackNumber(values[5])
+        world.wallInFront = values[6]
+        if values[7]:
+            bumpData = BumpSensorData()
+            bumpData.left, bumpData.right, bumpData.front, bumpData.back, bumpData.power = values[8:13]
+            world.bumpData = bumpData
+        if values[13]:
+            irData = IRData()
+            irData.leftFront, irData.leftSide, irData.left, irData.right = [unpackNumber(value)
+                                                                            for value in values[14:18]]
+            world.irData = irData
+        count = values[18]
+        world.balls = [(values[19 + 2 * i], values[20 + 2 * i]) for i in range(count)]
+        stamps = {"sequence": sequence,
+                  "published": values[0],
+                  "input": values[1] or None,
+                  "vision": values[2] or None}
+        return world, stamps
+
+    def close(self):
+        self.blackboard.close()
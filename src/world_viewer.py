@@ -0,0 +1,58 @@
+import sys
+sys.path.append("../lib")
+
+import time
+
+from blargh.clock import monotonicTime
+from world.blackboard import WorldBlackboard, worldBlackboardPath
+
+# Prints out the world the robot is working with, read straight off the
+# world blackboard (see world/blackboard.py) while main.py or
+# simulated_main.py is running. Reading doesn't slow the robot down at all,
+# so this can be left running. For example:
+#   python world_viewer.py
+#   python world_viewer.py --rate 2 --path /dev/shm/blargh-world
+
+DEFAULT_RATE = 5.0
+
+# How long ago a monotonic time was, in milliseconds, for printing
+def age(stamp, now):
+    if stamp == None:
+        return "never"
+    return "%.1fms ago" % ((now - stamp) * 1000)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    rate = DEFAULT_RATE
+    path = worldBlackboardPath()
+    i = 0
+    while i < len(args):
+        if args[i] == "--rate" and i + 1 < len(args):
+            rate = float(args[i + 1])
+            i += 2
+        elif args[i] == "--path" and i + 1 < len(args):
+            path = args[i + 1]
+            i += 2
+        else:
+            print "Usage: python world_viewer.py [--rate Hz] [--path blackboard]"
+            sys.exit(1)
+
+    blackboard = WorldBlackboard(path)
+    while True:
+        world, stamps = blackboard.snapshot()
+        now = monotonicTime()
+        if world == None:
+            print "Nothing published yet"
+        else:
+            print "World #%d published %s, input %s, vision %s" % (stamps["sequence"],
+                age(stamps["published"], now), age(stamps["input"], now), age(stamps["vision"], now))
+            if world.time != None:
+                print "    simulated time %.2fs" % world.time
+            print "    balls %s" % ", ".join(["(%.1f, %.2f)" % ball for ball in world.balls])
+            print "    yellowTheta %s, wall in front %s" % (world.yellowTheta, world.wallInFront)
+            if world.bumpData != None:
+                bump = world.bumpData
+                print "    bump left %s right %s front %s back %s" % (bump.left, bump.right, bump.front, bump.back)
+            if world.irData != None:
+                print "    IR left front %s left side %s" % (world.irData.leftFront, world.irData.leftSide)
+        time.sleep(1.0 / rate)